@@ -0,0 +1,215 @@
+"""One-pass confusion matrices and agreement statistics.
+
+Pairs of responses (reference vs. compared: human vs. model, or one annotator vs.
+another) are encoded in a single pass into integer arrays. Every confusion matrix is
+then one ``np.bincount`` over ``ref * k + other``:
+
+- user_need 8x8, Smartocto group 4x4, and I1/I3/I4 5x5 impact matrices;
+- the same matrices per category (one bincount with a category offset).
+
+From each matrix we derive accuracy, Cohen's kappa, quadratic-weighted kappa (useful
+for the ordinal impact levels) and per-class precision/recall. Rows are the reference,
+columns the compared side. Pairs with a label outside the known set are skipped.
+Statistics that are undefined for a matrix (kappa when the expected disagreement is
+zero, precision of a class never predicted) are NaN; ``json_ready`` turns them into
+``null`` for JSON output.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from evaluate import IMPACT_INDEX, IMPACT_LEVELS, flatten_articles
+from evaluate_vectorized import GROUP_LABELS, MISSING, NEED_TO_GROUP, USER_NEED_CODES, USER_NEED_LABELS
+
+
+IMPACT_METRICS = ("I1", "I3", "I4")
+METRIC_LABELS: Dict[str, Tuple[str, ...]] = {
+    "user_need": USER_NEED_LABELS,
+    "group": GROUP_LABELS,
+    **{metric: tuple(str(level) for level in IMPACT_LEVELS) for metric in IMPACT_METRICS},
+}
+
+
+def _impact_code(value: Any) -> int:
+    try:
+        return IMPACT_INDEX.get(int(value), MISSING)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def encode_pairs(pairs: Iterable[Tuple[Mapping[str, Any], Mapping[str, Any], Optional[str]]]) -> Dict[str, Any]:
+    """Encode ``(reference, compared, category)`` triples in a single pass."""
+
+    ref_codes: List[List[int]] = [[] for _ in range(4)]
+    other_codes: List[List[int]] = [[] for _ in range(4)]
+    categories: List[Optional[str]] = []
+    for reference, compared, category in pairs:
+        ref_codes[0].append(USER_NEED_CODES.get(reference.get("user_need"), MISSING))
+        other_codes[0].append(USER_NEED_CODES.get(compared.get("user_need"), MISSING))
+        for slot, metric in enumerate(IMPACT_METRICS, start=1):
+            ref_codes[slot].append(_impact_code(reference.get(metric)))
+            other_codes[slot].append(_impact_code(compared.get(metric)))
+        categories.append(category)
+
+    fields = ("user_need",) + IMPACT_METRICS
+    ref = {field: np.array(codes, dtype=np.int8) for field, codes in zip(fields, ref_codes)}
+    other = {field: np.array(codes, dtype=np.int8) for field, codes in zip(fields, other_codes)}
+    for side in (ref, other):
+        need = side["user_need"]
+        side["group"] = np.where(need == MISSING, MISSING, NEED_TO_GROUP[np.where(need == MISSING, 0, need)]).astype(np.int8)
+
+    category_labels = sorted({category for category in categories if category is not None})
+    category_index = {category: idx for idx, category in enumerate(category_labels)}
+    category_codes = np.array([category_index.get(category, MISSING) for category in categories], dtype=np.int32)
+    return {"ref": ref, "other": other, "categories": category_labels, "category_codes": category_codes}
+
+
+def confusion(ref: np.ndarray, other: np.ndarray, size: int) -> np.ndarray:
+    valid = (ref != MISSING) & (other != MISSING)
+    flat = ref[valid].astype(np.int64) * size + other[valid]
+    return np.bincount(flat, minlength=size * size).reshape(size, size)
+
+
+def confusion_by_category(ref: np.ndarray, other: np.ndarray, size: int, category_codes: np.ndarray, n_categories: int) -> np.ndarray:
+    valid = (ref != MISSING) & (other != MISSING) & (category_codes != MISSING)
+    flat = (category_codes[valid].astype(np.int64) * size + ref[valid]) * size + other[valid]
+    return np.bincount(flat, minlength=n_categories * size * size).reshape(n_categories, size, size)
+
+
+def cohen_kappa(matrix: np.ndarray) -> float:
+    return weighted_kappa(matrix, weights=None)
+
+
+def weighted_kappa(matrix: np.ndarray, weights: Optional[str] = "quadratic") -> float:
+    """Cohen's kappa with ``None`` (unweighted), ``"linear"`` or ``"quadratic"`` weights."""
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    total = matrix.sum()
+    size = matrix.shape[0]
+    if total == 0:
+        return float("nan")
+    idx = np.arange(size)
+    if weights is None:
+        disagreement = (idx[:, None] != idx[None, :]).astype(np.float64)
+    elif weights == "linear":
+        disagreement = np.abs(idx[:, None] - idx[None, :]) / max(size - 1, 1)
+    elif weights == "quadratic":
+        disagreement = ((idx[:, None] - idx[None, :]) / max(size - 1, 1)) ** 2
+    else:
+        raise ValueError(f"Unknown weights: {weights!r}")
+
+    observed = matrix / total
+    expected = np.outer(matrix.sum(axis=1), matrix.sum(axis=0)) / (total * total)
+    expected_disagreement = (disagreement * expected).sum()
+    if expected_disagreement == 0:
+        # Both sides use a single label: chance agreement is perfect, kappa is undefined.
+        return float("nan")
+    return float(1.0 - (disagreement * observed).sum() / expected_disagreement)
+
+
+def per_class(matrix: np.ndarray, labels: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """Precision/recall/F1 of the compared side, treating rows (reference) as truth."""
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    tp = np.diag(matrix)
+    predicted = matrix.sum(axis=0)
+    actual = matrix.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, np.nan)
+        recall = np.where(actual > 0, tp / actual, np.nan)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), np.nan)
+    return {
+        label: {
+            "precision": float(precision[idx]),
+            "recall": float(recall[idx]),
+            "f1": float(f1[idx]),
+            "support": int(actual[idx]),
+        }
+        for idx, label in enumerate(labels)
+    }
+
+
+def matrix_stats(matrix: np.ndarray, labels: Sequence[str], ordinal: bool) -> Dict[str, Any]:
+    total = int(matrix.sum())
+    stats = {
+        "matrix": matrix.tolist(),
+        "labels": list(labels),
+        "count": total,
+        "accuracy": float(np.trace(matrix) / total) if total else float("nan"),
+        "kappa": cohen_kappa(matrix),
+        "per_class": per_class(matrix, labels),
+    }
+    if ordinal:
+        stats["quadratic_kappa"] = weighted_kappa(matrix, "quadratic")
+    return stats
+
+
+def json_ready(value: Any) -> Any:
+    """``value`` with NaN floats replaced by ``None``, since NaN is not valid JSON."""
+
+    if isinstance(value, float):
+        return None if np.isnan(value) else value
+    if isinstance(value, dict):
+        return {key: json_ready(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_ready(item) for item in value]
+    return value
+
+
+def agreement_report(encoded: Mapping[str, Any], by_category: bool = True) -> Dict[str, Any]:
+    """Confusion matrices and agreement statistics for every metric (and category)."""
+
+    report: Dict[str, Any] = {"overall": {}, "by_category": {}}
+    n_categories = len(encoded["categories"])
+    for metric, labels in METRIC_LABELS.items():
+        ref = encoded["ref"][metric]
+        other = encoded["other"][metric]
+        ordinal = metric in IMPACT_METRICS
+        report["overall"][metric] = matrix_stats(confusion(ref, other, len(labels)), labels, ordinal)
+
+        if by_category and n_categories:
+            stacked = confusion_by_category(ref, other, len(labels), encoded["category_codes"], n_categories)
+            for idx, category in enumerate(encoded["categories"]):
+                report["by_category"].setdefault(category, {})[metric] = matrix_stats(stacked[idx], labels, ordinal)
+    return report
+
+
+def pairs_from_results(results: Iterable[Mapping[str, Any]]):
+    """Model-vs-human pairs from ``evaluate_dataset`` results (reference = ground truth)."""
+
+    for entry in results:
+        yield entry["ground_truth"], entry["model_response"], entry.get("category")
+
+
+def pairs_from_datasets(reference: Mapping[str, Any], compared: Mapping[str, Any]):
+    """Pairs over the article IDs present in both grouped datasets (e.g. two annotators)."""
+
+    ref_index = flatten_articles(reference)
+    other_index = flatten_articles(compared)
+    for article_id in sorted(set(ref_index).intersection(other_index)):
+        ref_response = ref_index[article_id]["response"]
+        other_response = other_index[article_id]["response"]
+        if isinstance(ref_response, dict) and isinstance(other_response, dict):
+            yield ref_response, other_response, ref_index[article_id]["category"]
+
+
+def print_agreement(report: Mapping[str, Any], by_category: bool = False) -> None:
+    print(f"\n{'metric':<10} {'n':>5} {'acc':>6} {'kappa':>7} {'qw-kappa':>9}")
+    for metric, stats in report["overall"].items():
+        qwk = stats.get("quadratic_kappa")
+        qwk_text = f"{qwk:.3f}" if qwk is not None else "-"
+        print(f"{metric:<10} {stats['count']:>5} {stats['accuracy']:>6.3f} {stats['kappa']:>7.3f} {qwk_text:>9}")
+
+    need = report["overall"]["user_need"]["per_class"]
+    print("\nuser_need per class (compared vs reference):")
+    for label, stats in need.items():
+        print(f"  {label:<20} P={stats['precision']:.3f} R={stats['recall']:.3f} F1={stats['f1']:.3f} n={stats['support']}")
+
+    if by_category:
+        print("\nPer category (user_need acc / kappa):")
+        for category, metrics in sorted(report["by_category"].items()):
+            stats = metrics["user_need"]
+            print(f"  {category:<45} n={stats['count']:<4} acc={stats['accuracy']:.3f} kappa={stats['kappa']:.3f}")
@@ -9,6 +9,10 @@ from typing import Any, Dict, Iterable, Tuple
 
 
 def load_json(path: Path) -> Dict[str, Any]:
+    if path.is_dir():
+        from dump_store import load_predictions
+
+        return load_predictions(path)
     with path.open(encoding="utf-8") as f:
         return json.load(f)
 
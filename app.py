@@ -1,20 +1,45 @@
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Awaitable, Dict, List, Mapping, Optional, Tuple
 
+import asyncio
 import logging
 import logging.config
+import math
+import os
+import time
 import requests
 import yaml
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from openai import APITimeoutError
 from pydantic import BaseModel
 
-from qwen3_infer import build_prompt, query_model, parse_json_output, local_infer
-from utils import build_input_data, get_article_data
+from article_corpus import load_article
+from drift import DriftMonitor, category_key
+from dedup import DedupIndex, entry_key
+from field_inference import ALL_FIELDS, FieldCache, ainfer_fields, normalize_fields, text_key
+from metrics import COUNTERS
+from qwen3_infer import aquery_model_with_usage, local_infer
+from shadow import SHADOW_MAX_PRIMARY_INFLIGHT, ShadowRunner
+from warmup import LatencyWindow, Readiness
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 
 LOG_CONFIG_PATH = Path(__file__).parent / "logger" / "config.yaml"
 
+# Absolute deadline as a unix timestamp, or a relative budget in seconds.
+DEADLINE_HEADER = "X-Request-Deadline"
+TIMEOUT_HEADER = "X-Request-Timeout"
+# Used when no header is sent; also caps whatever the client asks for.
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("INFER_DEFAULT_DEADLINE", "120"))
+DISCONNECT_POLL_SECONDS = 0.5
+FIELD_CACHE_SIZE = int(os.getenv("INFER_FIELD_CACHE_SIZE", "10000"))
+# Near-duplicate detection is off unless a threshold is set; reuse also needs DEDUP_REUSE=1.
+DEDUP_THRESHOLD = os.getenv("DEDUP_THRESHOLD")
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH")
+DEDUP_REUSE = os.getenv("DEDUP_REUSE", "0") == "1"
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
 
 urllib3.disable_warnings(InsecureRequestWarning)
 def setup_logging() -> None:
@@ -42,21 +67,167 @@ app = FastAPI(
 class InferRequest(BaseModel):
     article_id: Optional[int] = None
     text: Optional[str] = None
+    # Subset of user_need, I1, I3, I4; all fields when omitted.
+    fields: Optional[List[str]] = None
+    # Dump-style category slug (kinhdoanh/doanh-nghiep) for drift monitoring; derived
+    # from the article payload when omitted.
+    category: Optional[str] = None
+
+
+field_cache = FieldCache(max_entries=FIELD_CACHE_SIZE)
+
+
+def load_dedup_index() -> Optional[DedupIndex]:
+    if not DEDUP_THRESHOLD:
+        return None
+    threshold = float(DEDUP_THRESHOLD)
+    if DEDUP_INDEX_PATH and Path(DEDUP_INDEX_PATH).exists():
+        index = DedupIndex.load(Path(DEDUP_INDEX_PATH), threshold)
+        index.max_entries = FIELD_CACHE_SIZE + len(index)
+        return index
+    return DedupIndex(threshold, max_entries=FIELD_CACHE_SIZE)
+
+
+dedup_index = load_dedup_index()
+readiness = Readiness()
+stage_latency = {"fetch": LatencyWindow(), "generate": LatencyWindow()}
+# Primary /infer requests in flight; shadow work waits while there are too many.
+inflight = {"primary": 0}
+drift = DriftMonitor.from_env()
+shadow = ShadowRunner(
+    aquery_model_with_usage,
+    busy=lambda: inflight["primary"] > SHADOW_MAX_PRIMARY_INFLIGHT,
+    load=lambda: inflight["primary"],
+)
+
+
+@app.on_event("startup")
+async def start_warmup() -> None:
+    # In the background so /health answers at once; /ready stays 503 until it is done.
+    if WARMUP_ON_STARTUP:
+        app.state.warmup_task = asyncio.create_task(readiness.warmup())
+    else:
+        readiness.warm = True
+        readiness.warmup_report = {"state": "disabled"}
+
+
+@app.on_event("startup")
+async def start_shadow() -> None:
+    shadow.start()
+
+
+@app.on_event("shutdown")
+async def stop_shadow() -> None:
+    await shadow.stop()
+
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def resolve_deadline(headers: Mapping[str, str]) -> float:
+    """Return the request deadline on the ``time.monotonic`` clock."""
+
+    now = time.monotonic()
+    budget = DEFAULT_DEADLINE_SECONDS
+    try:
+        if headers.get(DEADLINE_HEADER):
+            budget = float(headers[DEADLINE_HEADER]) - time.time()
+        elif headers.get(TIMEOUT_HEADER):
+            budget = float(headers[TIMEOUT_HEADER])
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid deadline header.") from exc
+    # float() accepts "nan" and "inf"; min() with NaN would disable the deadline.
+    if not math.isfinite(budget):
+        raise HTTPException(status_code=400, detail="Invalid deadline header.")
+    return now + min(budget, DEFAULT_DEADLINE_SECONDS)
 
 
+def remaining(deadline: float) -> float:
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left
 
-def run_inference(article_text: str) -> Tuple[dict, str]:
+
+async def run_inference(
+    article_text: str,
+    deadline: float,
+    fields: Optional[List[str]] = None,
+    article_id: Optional[int] = None,
+) -> Tuple[dict, Dict[str, Any]]:
     if not article_text:
         raise ValueError("Article text is empty.")
 
-    prompt = build_prompt(article_text)
-    raw_output = query_model(prompt)
-    parsed = parse_json_output(raw_output)
+    async def query(prompt: str):
+        return await aquery_model_with_usage(prompt, timeout=remaining(deadline))
+
+    key = text_key(article_text)
+    # Same key space as indexes built from dumps and batch runs.
+    index_key = entry_key(article_id, key)
+    signature, match = None, None
+    if dedup_index is not None:
+        signature = dedup_index.signature(article_text)
+        match = dedup_index.query_signature(signature, exclude=index_key)
+        COUNTERS.inc("dedup_lookups")
+        if match is not None:
+            COUNTERS.inc("dedup_hits")
+            if DEDUP_REUSE and match.result:
+                # Seed the field cache so only fields the earlier result lacks are generated.
+                cached = field_cache.get(key)
+                field_cache.update(key, {
+                    field: value for field, value in match.result.items()
+                    if field in ALL_FIELDS and field not in cached
+                })
+
+    parsed, details = await ainfer_fields(article_text, fields, field_cache, query)
+    details["duplicate_of"] = None
+    if dedup_index is not None:
+        dedup_index.add_signature(index_key, signature, field_cache.get(key))
+        if match is not None:
+            details["duplicate_of"] = {"key": match.key, "similarity": round(match.similarity, 4)}
+    COUNTERS.inc(f"stage_{details['stage'] or 'cached'}")
+    COUNTERS.inc("field_cache_hits", len(details["cached_fields"]))
+    if details["repairs"]:
+        COUNTERS.inc("parse_repaired")
+    return parsed, details
 
-    if parsed is None:
-        raise ValueError("Model response could not be parsed as JSON.")
 
-    return parsed, raw_output
+async def run_until_cancelled(
+    http_request: Request,
+    deadline: float,
+    work: Awaitable[Any],
+    stage: Dict[str, str],
+) -> Any:
+    """Await ``work`` but cancel it when the client disconnects or the deadline passes.
+
+    ``stage`` is updated by the work coroutine so cancellations are counted per stage.
+    """
+
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise DeadlineExceeded()
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_SECONDS, left))
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    except (DeadlineExceeded, ClientDisconnected) as exc:
+        reason = "deadline" if isinstance(exc, DeadlineExceeded) else "disconnect"
+        if not task.done():
+            task.cancel()
+            COUNTERS.inc(f"cancelled_{reason}")
+            COUNTERS.inc(f"cancelled_{stage['name']}")
+            logger.info("Cancelled %s stage after client %s", stage["name"], reason)
+        raise
 
 
 @app.get("/health")
@@ -64,37 +235,98 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    is_ready, body = await readiness.status(stage_latency)
+    return JSONResponse(status_code=200 if is_ready else 503, content=body)
+
+
+@app.get("/shadow")
+def shadow_stats():
+    return {"enabled": shadow.enabled, "variant": shadow.variant, "sample_rate": shadow.sample_rate, **shadow.stats.snapshot()}
+
+
+@app.get("/drift")
+def drift_stats():
+    return drift.snapshot()
+
+
+@app.get("/metrics")
+def metrics():
+    snapshot = COUNTERS.snapshot()
+    snapshot.update(drift.metrics())
+    if dedup_index is not None:
+        stats = dedup_index.stats()
+        snapshot.update({"dedup_entries": stats["entries"], "dedup_hit_rate": stats["hit_rate"], "dedup_mean_lookup_ms": stats["mean_lookup_ms"]})
+    return snapshot
+
+
+async def resolve_article_text(request: InferRequest, deadline: float) -> Tuple[str, str, Optional[str]]:
+    """Return the article text, its source and its category for drift monitoring."""
+
+    if request.article_id is not None:
+        timeout = remaining(deadline)
+        api_data, article_text = await asyncio.to_thread(load_article, request.article_id, timeout)
+        if not api_data:
+            raise HTTPException(
+                status_code=404,
+                detail="Article not found or upstream returned no data.",
+            )
+        if not article_text:
+            raise HTTPException(
+                status_code=404,
+                detail="Article content is empty.",
+            )
+        category = request.category or category_key(api_data)
+        return article_text, "article", category
+
+    text = (request.text or "").strip()
+    if not text:
+        raise HTTPException(
+            status_code=400,
+            detail="Provided text is empty.",
+        )
+    return text, "text", request.category
+
+
 @app.post("/infer")
-def infer(request: InferRequest):
+async def infer(request: InferRequest, http_request: Request, response: Response):
+    deadline = resolve_deadline(http_request.headers)
+    try:
+        fields = normalize_fields(request.fields)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    stage = {"name": "fetch"}
+    timings: Dict[str, float] = {}
+
+    async def work() -> Tuple[str, dict, Dict[str, Any]]:
+        started = time.perf_counter()
+        article_text, source, category = await resolve_article_text(request, deadline)
+        fetched = time.perf_counter()
+        timings["fetch"] = fetched - started
+        stage["name"] = "generate"
+        load = inflight["primary"]
+        parsed, details = await run_inference(article_text, deadline, fields, request.article_id)
+        timings["generate"] = time.perf_counter() - fetched
+        if details["stage"] is not None:
+            # Only fresh model output; cache hits would count one answer many times.
+            drift.record(category, parsed)
+        if fields == ALL_FIELDS and details["stage"] == "full":
+            shadow.submit(request.article_id, article_text, parsed, timings["generate"], load)
+        return source, parsed, details
+
+    inflight["primary"] += 1
     try:
-        if request.article_id is not None:
-            api_data = get_article_data(request.article_id)
-            if not api_data:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Article not found or upstream returned no data.",
-                )
-            article_text = build_input_data(api_data)
-            if not article_text:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Article content is empty.",
-                )
-            source = "article"
-        else:
-            text = (request.text or "").strip()
-            if not text:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Provided text is empty.",
-                )
-            article_text = text
-            source = "text"
-
-        parsed, raw_output = run_inference(article_text)
+        source, parsed, details = await run_until_cancelled(http_request, deadline, work(), stage)
 
     except HTTPException:
         raise
+    except ClientDisconnected as exc:
+        # Nobody is listening; the status only shows up in access logs.
+        raise HTTPException(status_code=499, detail="Client disconnected.") from exc
+    except (DeadlineExceeded, APITimeoutError, asyncio.TimeoutError) as exc:
+        COUNTERS.inc("deadline_exceeded")
+        raise HTTPException(status_code=504, detail="Request deadline exceeded.") from exc
     except requests.exceptions.RequestException as exc:
         logger.exception("Network error during inference")
         raise HTTPException(
@@ -104,12 +336,22 @@ def infer(request: InferRequest):
     except Exception as exc:
         logger.exception("Inference failed")
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    finally:
+        inflight["primary"] -= 1
 
+    for name, seconds in timings.items():
+        stage_latency[name].add(seconds)
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
     return {
         "source": source,
         "article_id": request.article_id,
         "result": parsed,
-        "raw_response": raw_output,
+        "raw_response": details["raw_output"],
+        "stage": details["stage"],
+        "cached_fields": details["cached_fields"],
+        "duplicate_of": details["duplicate_of"],
     }
 
 
@@ -0,0 +1,213 @@
+"""Local SQLite corpus of fetched articles.
+
+Every experiment used to call ``get_article_data`` + ``build_input_data`` per article
+over the network. The corpus keeps, per article ID, the raw ``/ar/get_full`` payload and
+the cleaned model input text, so runs can be repeated fully offline:
+
+    python article_corpus.py prefetch --test-path data/test_list_27_11_2025.json
+    python article_corpus.py prefetch --ids 4986601 4986602 --rate 2
+    python article_corpus.py stats
+
+``load_article`` is the read path used by the infer scripts, ``batch_infer.py`` and
+``/infer``: it answers from the corpus when the article is there and otherwise fetches
+it (and writes it through when a corpus file exists). The corpus location comes from
+``ARTICLE_CORPUS_PATH`` (default ``./data/articles.sqlite``).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from utils import RateLimiter, build_input_data, get_article_data
+
+
+DEFAULT_CORPUS_PATH = Path(os.getenv("ARTICLE_CORPUS_PATH", "./data/articles.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    article_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    text TEXT,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+class ArticleCorpus:
+    """Raw API payloads and cleaned input text keyed by article ID."""
+
+    def __init__(self, path: Path = DEFAULT_CORPUS_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def get(self, article_id: int) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """Return ``(payload, text)`` for a stored article, else ``None``."""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, text FROM articles WHERE article_id = ?", (int(article_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, article_id: int, payload: Dict[str, Any]) -> Optional[str]:
+        """Store a raw payload and its cleaned text; return the text."""
+
+        text = build_input_data(payload)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO articles (article_id, payload, text, fetched_at) VALUES (?, ?, ?, ?)",
+                (int(article_id), json.dumps(payload, ensure_ascii=False), text, time.time()),
+            )
+            self._conn.commit()
+        return text
+
+    def missing(self, article_ids: Iterable[int]) -> List[int]:
+        ids = [int(article_id) for article_id in article_ids]
+        with self._lock:
+            present = {row[0] for row in self._conn.execute("SELECT article_id FROM articles")}
+        return [article_id for article_id in ids if article_id not in present]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_corpus: Optional[ArticleCorpus] = None
+_default_lock = threading.Lock()
+
+
+def get_default_corpus() -> Optional[ArticleCorpus]:
+    """The shared corpus at ``DEFAULT_CORPUS_PATH``, or ``None`` if it was never created."""
+
+    global _default_corpus
+    if _default_corpus is None and DEFAULT_CORPUS_PATH.exists():
+        with _default_lock:
+            if _default_corpus is None:
+                _default_corpus = ArticleCorpus(DEFAULT_CORPUS_PATH)
+    return _default_corpus
+
+
+def load_article(
+    article_id: int,
+    timeout: float = 10,
+    corpus: Optional[ArticleCorpus] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Return ``(api_data, input_text)``, reading the corpus first.
+
+    Drop-in for ``get_article_data`` followed by ``build_input_data``.
+    """
+
+    corpus = corpus or get_default_corpus()
+    if corpus is not None:
+        stored = corpus.get(article_id)
+        if stored is not None:
+            return stored
+    api_data = get_article_data(int(article_id), timeout)
+    if api_data is None:
+        return None, None
+    if corpus is not None:
+        return api_data, corpus.put(article_id, api_data)
+    return api_data, build_input_data(api_data)
+
+
+def test_list_ids(test_path: Path) -> List[int]:
+    with test_path.open(encoding="utf-8") as f:
+        articles = json.load(f)
+    return [int(article_id) for ids in articles["articles_id"].values() for article_id in ids]
+
+
+def prefetch(
+    article_ids: Iterable[int],
+    corpus: ArticleCorpus,
+    workers: int = 8,
+    rate: float = 5.0,
+    refresh: bool = False,
+    timeout: float = 10,
+) -> Dict[str, Any]:
+    """Download articles concurrently (at most ``rate`` requests/s) into ``corpus``."""
+
+    ids = list(dict.fromkeys(int(article_id) for article_id in article_ids))
+    pending = ids if refresh else corpus.missing(ids)
+    limiter = RateLimiter(rate, burst=workers)
+    failed: List[int] = []
+
+    def fetch(article_id: int) -> bool:
+        limiter.acquire()
+        try:
+            payload = get_article_data(article_id, timeout)
+            if payload is None:
+                return False
+            # A payload that cannot be stored (bad shape, database error) fails the ID too.
+            corpus.put(article_id, payload)
+        except Exception:
+            logging.error(f"Prefetch failed for article {article_id}", exc_info=True)
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, article_id): article_id for article_id in pending}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            if not future.result():
+                failed.append(futures[future])
+
+    return {
+        "requested": len(ids),
+        "already_stored": len(ids) - len(pending),
+        "fetched": len(pending) - len(failed),
+        "failed": sorted(failed),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Manage the local article corpus.")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS_PATH, help="SQLite corpus path.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fetch = sub.add_parser("prefetch", help="Download articles into the corpus.")
+    source = fetch.add_mutually_exclusive_group(required=True)
+    source.add_argument("--test-path", type=Path, help="test_list_*.json file to prefetch.")
+    source.add_argument("--ids", type=int, nargs="+", help="Article IDs to prefetch.")
+    fetch.add_argument("--workers", type=int, default=8, help="Concurrent downloads.")
+    fetch.add_argument("--rate", type=float, default=5.0, help="Maximum requests per second.")
+    fetch.add_argument("--timeout", type=float, default=10, help="Per-request timeout in seconds.")
+    fetch.add_argument("--refresh", action="store_true", help="Re-download articles already stored.")
+
+    sub.add_parser("stats", help="Print the number of stored articles.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    corpus = ArticleCorpus(args.corpus)
+    if args.command == "prefetch":
+        ids = test_list_ids(args.test_path) if args.test_path else args.ids
+        report = prefetch(ids, corpus, args.workers, args.rate, args.refresh, args.timeout)
+        print(json.dumps(report, indent=2))
+    print(f"{args.corpus}: {len(corpus)} articles")
+    corpus.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""Concurrent batch inference with adaptive (AIMD) concurrency control.
+
+This is the concurrent replacement for the sequential ``infer_test_file`` loops in
+``qwen3_infer.py`` and ``qwen3_infer_seperate_prompt.py``. Instead of a fixed worker
+count, the number of in-flight requests is steered by an AIMD controller:
+
+- every successful request that finishes under the latency threshold grows the limit
+  additively (roughly +1 per full window of completions);
+- an error or a request slower than the threshold shrinks the limit multiplicatively,
+  at most once per window so one burst of slow responses is not punished repeatedly.
+
+Latency is the duration of the model calls alone (``generate_s`` on the row), not the
+fetch. Articles answered without a model call (missing article, cascade, dedup reuse)
+free their slot without moving the limit. The latency threshold is either fixed
+(``--latency-target``) or the fastest of the last ``BASE_LATENCY_WINDOW`` model
+latencies times ``--latency-tolerance``, so the baseline follows the backend when it
+gets slower. The current limit, in-flight count and achieved tokens/s are logged
+periodically.
+
+Run ``python batch_infer.py --test-path ./data/test_list_12_12_2025_qc_selected.json``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from article_corpus import load_article
+from cascade import run_cascade
+from dedup import DEFAULT_THRESHOLD as DEFAULT_DEDUP_THRESHOLD, DedupIndex
+from field_inference import ALL_FIELDS, FieldCache, infer_fields
+from qwen3_infer import build_prompt, parse_json_output, query_model_with_usage
+from self_consistency import DEFAULT_SAMPLES, DEFAULT_TEMPERATURE, run_vote
+
+
+logger = logging.getLogger(__name__)
+
+BASE_LATENCY_WINDOW = 50
+
+VARIANTS = ("single", "separate", "vote", "cascade")
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease limit on in-flight requests."""
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: Optional[float] = None,
+        latency_tolerance: float = 2.0,
+        base_window: int = BASE_LATENCY_WINDOW,
+    ) -> None:
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("Expected 1 <= minimum <= initial <= maximum.")
+        if not 0.0 < decrease < 1.0:
+            raise ValueError("decrease must be in (0, 1).")
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._recent_latencies: deque = deque(maxlen=base_window)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def latency_threshold(self) -> Optional[float]:
+        if self.latency_target is not None:
+            return self.latency_target
+        if not self._recent_latencies:
+            return None
+        return min(self._recent_latencies) * self.latency_tolerance
+
+    def acquire(self) -> float:
+        """Block until a slot is free; return the start timestamp of the request."""
+
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, ok: bool, latency: Optional[float] = None) -> None:
+        """Free a slot and adapt the limit.
+
+        ``latency`` is the model-call duration of a successful request; ``None`` means
+        it was answered without a model call and carries no congestion signal.
+        """
+
+        with self._cond:
+            self._in_flight -= 1
+            if ok and latency is None:
+                self._cond.notify_all()
+                return
+            if ok:
+                self._recent_latencies.append(latency)
+
+            threshold = self.latency_threshold()
+            congested = (not ok) or (threshold is not None and latency > threshold)
+            if congested:
+                # Only react once per window: requests that started before the last
+                # decrease were already in flight when we backed off.
+                if started >= self._last_decrease:
+                    self._limit = max(float(self.minimum), self._limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+            else:
+                self._limit = min(float(self.maximum), self._limit + self.increase / max(self._limit, 1.0))
+            self._cond.notify_all()
+
+
+class ThroughputLog:
+    """Periodic snapshots of the controller state and achieved token rate."""
+
+    def __init__(self, controller: AIMDController, interval: float = 10.0) -> None:
+        self.controller = controller
+        self.interval = interval
+        self.history: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._window_start = self._start
+        self._window_tokens = 0
+        self._window_done = 0
+        self._window_errors = 0
+
+    def record(self, completion_tokens: int, ok: bool) -> None:
+        with self._lock:
+            self._window_tokens += completion_tokens
+            self._window_done += 1
+            if not ok:
+                self._window_errors += 1
+            if time.monotonic() - self._window_start >= self.interval:
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._window_done:
+                self._flush()
+
+    def _flush(self) -> None:
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-9)
+        snapshot = {
+            "t": round(now - self._start, 3),
+            "limit": self.controller.limit,
+            "in_flight": self.controller.in_flight,
+            "completed": self._window_done,
+            "errors": self._window_errors,
+            "tokens_per_s": round(self._window_tokens / elapsed, 2),
+            "requests_per_s": round(self._window_done / elapsed, 3),
+        }
+        self.history.append(snapshot)
+        logger.info(
+            "concurrency=%(limit)d in_flight=%(in_flight)d completed=%(completed)d "
+            "errors=%(errors)d tokens/s=%(tokens_per_s).1f req/s=%(requests_per_s).2f",
+            snapshot,
+        )
+        self._window_start = now
+        self._window_tokens = 0
+        self._window_done = 0
+        self._window_errors = 0
+
+
+def sum_usage(*usages: Mapping[str, int]) -> Dict[str, int]:
+    total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for usage in usages:
+        for key in total:
+            total[key] += int(usage.get(key, 0) or 0)
+    return total
+
+
+StageUsage = Dict[str, Dict[str, int]]
+# (response, usage per stage, extra row fields)
+RunnerResult = Tuple[Optional[dict], StageUsage, Dict[str, Any]]
+
+
+def run_single_prompt(context: str) -> RunnerResult:
+    raw_output, usage = query_model_with_usage(build_prompt(context))
+    return parse_json_output(raw_output), {"full": usage}, {}
+
+
+def run_separate_prompts(context: str) -> RunnerResult:
+    from qwen3_infer_seperate_prompt import run_user_need_and_scoring
+
+    result, details = run_user_need_and_scoring(context)
+    return result, {"user_need": details["user_need_usage"], "scores": details["scoring_usage"]}, {}
+
+
+VARIANT_RUNNERS: Dict[str, Callable[[str], RunnerResult]] = {
+    "single": run_single_prompt,
+    "separate": run_separate_prompts,
+    "vote": run_vote,
+    "cascade": run_cascade,
+}
+
+
+def configure_vote(samples: int, temperature: float) -> None:
+    """Set the number of samples and temperature used by the ``vote`` variant."""
+
+    VARIANT_RUNNERS["vote"] = functools.partial(run_vote, n=samples, temperature=temperature)
+
+
+DEDUP: Dict[str, Any] = {"index": None, "reuse": False}
+
+
+def configure_dedup(index: Optional[DedupIndex], reuse: bool = False) -> None:
+    """Check every article against ``index``; with ``reuse``, label near-duplicates with the earlier result."""
+
+    DEDUP["index"], DEDUP["reuse"] = index, reuse
+
+
+def infer_article(
+    article_id: int,
+    variant: str,
+    fields: Optional[Iterable[str]] = None,
+    cache: Optional[FieldCache] = None,
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Fetch, build and infer one article; return the output row and its total usage.
+
+    Rows carry ``prompt_variant``, ``usage`` (summed over stages) and ``usage_by_stage``
+    so ``token_report.py`` can aggregate cost per variant, stage and category.
+    """
+
+    api_data, context = load_article(int(article_id))
+    return infer_context(article_id, api_data, context, variant, fields, cache)
+
+
+def infer_context(
+    article_id: int,
+    api_data: Optional[Mapping[str, Any]],
+    context: Optional[str],
+    variant: str,
+    fields: Optional[Iterable[str]] = None,
+    cache: Optional[FieldCache] = None,
+    runner: Optional[Callable[[str], Any]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Infer an article whose payload and input text were already loaded.
+
+    ``runner`` replaces ``VARIANT_RUNNERS[variant]``; ``variant`` is then only the label.
+    """
+
+    url = api_data["data"]["share_url"] if api_data else None
+    prompt_variant = variant if fields is None else "fields:" + ",".join(fields)
+    if context is None:
+        row = {"article_id": article_id, "response": None, "data": context, "url": url, "prompt_variant": prompt_variant}
+        return row, sum_usage()
+
+    extras: Dict[str, Any] = {}
+    index: Optional[DedupIndex] = DEDUP["index"] if fields is None else None
+    signature, match = None, None
+    if index is not None:
+        signature = index.signature(context)
+        match = index.query_signature(signature, exclude=int(article_id))
+    if match is not None:
+        extras["duplicate_of"] = {"article_id": match.key, "similarity": round(match.similarity, 4)}
+
+    generate_started = time.monotonic()
+    if match is not None and DEDUP["reuse"] and match.result is not None:
+        result, usage_by_stage = dict(match.result), {}
+    elif fields is None:
+        result, usage_by_stage, runner_extras = (runner or VARIANT_RUNNERS[variant])(context)
+        extras.update(runner_extras)
+    else:
+        result, details = infer_fields(context, fields, cache)
+        usage_by_stage = {details["stage"]: details["usage"]} if details["stage"] else {}
+    if usage_by_stage:
+        # Model time only; rows answered without a model call carry no generate_s.
+        extras["generate_s"] = round(time.monotonic() - generate_started, 4)
+    usage = sum_usage(*usage_by_stage.values())
+    if index is not None and isinstance(result, dict):
+        index.add_signature(int(article_id), signature, result)
+    logging.info(f"Context: {repr(context)} ==> RESPONSE: {result}")
+    row = {
+        "article_id": article_id,
+        "response": result,
+        "data": context,
+        "url": url,
+        "prompt_variant": prompt_variant,
+        "usage": usage,
+        "usage_by_stage": usage_by_stage,
+        **extras,
+    }
+    return row, usage
+
+
+def run_batch(
+    articles: Mapping[str, List[int]],
+    variant: str = "single",
+    controller: Optional[AIMDController] = None,
+    max_retries: int = 2,
+    log_interval: float = 10.0,
+    fields: Optional[Iterable[str]] = None,
+    cache: Optional[FieldCache] = None,
+) -> Tuple[Dict[str, List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Infer every article in ``articles`` (category -> ids) under AIMD control.
+
+    When ``fields`` is given, each article runs only the cheapest prompt stage covering
+    those fields (see ``field_inference``) instead of the ``variant`` pipeline.
+
+    Returns the grouped output (same shape as ``infer_test_file`` writes) and the
+    concurrency/throughput history.
+    """
+
+    if variant not in VARIANT_RUNNERS:
+        raise ValueError(f"Unknown variant {variant!r}; expected one of {VARIANTS}.")
+    controller = controller or AIMDController()
+    throughput = ThroughputLog(controller, interval=log_interval)
+
+    pending: List[Tuple[str, int, int, int]] = [
+        (category, position, int(article_id), 0)
+        for category, ids in articles.items()
+        for position, article_id in enumerate(ids)
+    ]
+    pending.reverse()
+    rows: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+    def task(article_id: int, started: float) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        ok, latency = False, None
+        try:
+            row, usage = infer_article(article_id, variant, fields, cache)
+            ok, latency = True, row.get("generate_s")
+            return row, usage
+        finally:
+            controller.release(started, ok, latency)
+
+    with ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+        running: Dict[Future, Tuple[str, int, int, int]] = {}
+        while pending or running:
+            while pending and controller.in_flight < controller.limit:
+                item = pending.pop()
+                started = controller.acquire()
+                running[executor.submit(task, item[2], started)] = item
+            if not running:
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                category, position, article_id, attempt = running.pop(future)
+                try:
+                    row, usage = future.result()
+                except Exception:
+                    throughput.record(0, ok=False)
+                    if attempt < max_retries:
+                        logger.warning("Retrying article %s (attempt %d)", article_id, attempt + 1)
+                        pending.append((category, position, article_id, attempt + 1))
+                        continue
+                    logger.exception("Article %s failed after %d attempts", article_id, attempt + 1)
+                    row = {"article_id": article_id, "response": None, "data": None, "url": None}
+                    usage = sum_usage()
+                else:
+                    throughput.record(usage["completion_tokens"], ok=True)
+                rows[(category, position)] = row
+
+    throughput.close()
+
+    output: Dict[str, List[Dict[str, Any]]] = {}
+    for category, ids in articles.items():
+        output[category] = [rows[(category, position)] for position in range(len(ids))]
+    return output, throughput.history
+
+
+def default_output_path(test_path: Path) -> Path:
+    suffix = "_".join(str(test_path).split("_")[-3:])
+    return Path(f"./data/qwen3_infer_{suffix}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run batch inference with adaptive concurrency.")
+    parser.add_argument("--test-path", type=Path, default=Path("./data/test_list_12_12_2025_qc_selected.json"), help="Test list JSON with an articles_id mapping.")
+    parser.add_argument("--variant", choices=VARIANTS, default="single", help="single prompt (qwen3_infer), separated prompts (qwen3_infer_seperate_prompt), n-sample voting (self_consistency) or classifier-first cascade (cascade).")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="Completions per request for --variant vote.")
+    parser.add_argument("--vote-temperature", type=float, default=DEFAULT_TEMPERATURE, help="Sampling temperature for --variant vote.")
+    parser.add_argument("--fields", nargs="+", choices=ALL_FIELDS, help="Only compute these fields with the cheapest covering prompt (overrides --variant).")
+    parser.add_argument("--output", type=Path, help="Output path (defaults to ./data/qwen3_infer_<suffix of test list>).")
+    parser.add_argument("--initial-concurrency", type=int, default=4)
+    parser.add_argument("--min-concurrency", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--latency-target", type=float, help=f"Fixed latency threshold in seconds; derived from the fastest of the last {BASE_LATENCY_WINDOW} model latencies when omitted.")
+    parser.add_argument("--latency-tolerance", type=float, default=2.0, help=f"Multiplier over the fastest of the last {BASE_LATENCY_WINDOW} model latencies treated as congestion.")
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--log-interval", type=float, default=10.0, help="Seconds between concurrency/throughput log lines.")
+    parser.add_argument("--dedup-index", type=Path, help="Near-duplicate index (dedup.py); loaded if it exists and saved with this run's results.")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_DEDUP_THRESHOLD, help="Minimum similarity for a near-duplicate.")
+    parser.add_argument("--dedup-reuse", action="store_true", help="Label near-duplicates with the earlier result instead of querying the model.")
+    parser.add_argument("--history", type=Path, help="Optional path to write the concurrency/throughput history as JSON.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    with args.test_path.open(encoding="utf-8") as f:
+        articles = json.load(f)["articles_id"]
+
+    configure_vote(args.samples, args.vote_temperature)
+    if args.dedup_index:
+        exists = args.dedup_index.exists()
+        index = DedupIndex.load(args.dedup_index, args.dedup_threshold) if exists else DedupIndex(args.dedup_threshold)
+        configure_dedup(index, args.dedup_reuse)
+    controller = AIMDController(
+        initial=args.initial_concurrency,
+        minimum=args.min_concurrency,
+        maximum=args.max_concurrency,
+        latency_target=args.latency_target,
+        latency_tolerance=args.latency_tolerance,
+    )
+    output, history = run_batch(
+        articles,
+        variant=args.variant,
+        controller=controller,
+        max_retries=args.max_retries,
+        log_interval=args.log_interval,
+        fields=args.fields,
+        cache=FieldCache() if args.fields else None,
+    )
+
+    output_path = args.output or default_output_path(args.test_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("w", encoding="utf-8") as out_f:
+        json.dump(output, out_f, ensure_ascii=False, indent=4)
+    print(f"Wrote {sum(len(rows) for rows in output.values())} rows to {output_path}")
+    if DEDUP["index"] is not None:
+        DEDUP["index"].save(args.dedup_index)
+        stats = DEDUP["index"].stats()
+        print(f"Near-duplicates: {stats['hits']}/{stats['lookups']} ({stats['hit_rate'] * 100:.1f}%), mean lookup {stats['mean_lookup_ms']:.3f} ms")
+
+    if args.history:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with args.history.open("w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
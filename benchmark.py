@@ -0,0 +1,273 @@
+"""Offline throughput/latency benchmarks against local stand-in servers.
+
+Starts ``mock_servers`` (OpenAI-compatible chat endpoint + fake ``/ar/get_full``),
+points the code at them through ``LOCAL_BASE_URL`` / ``ARTICLE_API_URL`` and drives
+one of:
+
+- ``batch``: ``batch_infer.run_batch`` in-process, timing the fetch and generate stage
+  of every article;
+- ``infer``: the ``/infer`` endpoint with a closed-loop load generator (``--concurrency``
+  clients). The app is started with uvicorn unless ``--app-url`` is given; stage
+  timings come from its ``Server-Timing`` header.
+
+The report (requests/s and p50/p95/p99 latency per stage) is printed and appended as
+one JSON line to ``--output`` so runs can be tracked over time:
+
+    python benchmark.py batch --articles 200 --ttft 0.2 --token-rate 80
+    python benchmark.py infer --requests 500 --concurrency 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+
+from mock_servers import DEFAULT_FIXTURES, MockState, load_fixtures, start_mock_servers
+
+
+DEFAULT_OUTPUT = Path("./data/benchmarks.jsonl")
+PERCENTILES = (50, 95, 99)
+CONFIG_KEYS = {
+    "common": ("ttft", "token_rate", "completion_tokens", "slots", "article_latency", "concurrency"),
+    "batch": ("articles", "variant", "max_concurrency"),
+    "infer": ("requests", "fields", "app_url"),
+}
+
+
+class StageTimer:
+    """Collect per-stage latencies from concurrent callers."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        return timed
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000.0
+    summary = {"count": int(values.size), "mean_ms": round(float(values.mean()), 2)}
+    for pct, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{pct}_ms"] = round(float(value), 2)
+    summary["max_ms"] = round(float(values.max()), 2)
+    return summary
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_env(env: Mapping[str, str]) -> None:
+    """Point upstream URLs at the mocks; must run before the inference modules are imported."""
+
+    os.environ.update(env)
+    # Keep a prefetched corpus from short-circuiting the article fetches being measured.
+    os.environ["ARTICLE_CORPUS_PATH"] = str(Path(tempfile.gettempdir()) / "benchmark-no-corpus.sqlite")
+
+
+def benchmark_batch(args: argparse.Namespace, state: MockState) -> Dict[str, Any]:
+    import batch_infer
+
+    timer = StageTimer()
+    batch_infer.infer_article = timer.wrap("total", batch_infer.infer_article)
+    batch_infer.load_article = timer.wrap("fetch", batch_infer.load_article)
+    runner = batch_infer.VARIANT_RUNNERS[args.variant]
+    batch_infer.VARIANT_RUNNERS[args.variant] = timer.wrap("generate", runner)
+    batch_infer.logging.getLogger().setLevel("WARNING")
+
+    # Distinct IDs past the fixtures; the mock gives each its own text, so every
+    # article is fetched and generated.
+    base = max(state.article_ids) + 1
+    articles = {"benchmark": list(range(base, base + args.articles))}
+    controller = batch_infer.AIMDController(
+        initial=args.concurrency, minimum=1, maximum=max(args.concurrency, args.max_concurrency)
+    )
+    started = time.perf_counter()
+    output, history = batch_infer.run_batch(articles, args.variant, controller, log_interval=args.log_interval)
+    elapsed = time.perf_counter() - started
+
+    rows = output["benchmark"]
+    return {
+        "requests": len(rows),
+        "errors": sum(1 for row in rows if row.get("response") is None),
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(len(rows) / elapsed, 3) if elapsed else 0.0,
+        "final_concurrency": controller.limit,
+        "latency": {stage: latency_summary(timer.samples.get(stage, [])) for stage in ("total", "fetch", "generate")},
+        "throughput_history": history,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 60.0) -> None:
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"App did not become ready at {url}")
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    timings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value) / 1000.0
+    return timings
+
+
+def benchmark_infer(args: argparse.Namespace, state: MockState) -> Dict[str, Any]:
+    import requests
+
+    process = None
+    app_url = args.app_url
+    if app_url is None:
+        port = free_port()
+        app_url = f"http://127.0.0.1:{port}"
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            env=dict(os.environ),
+        )
+    try:
+        wait_until_up(app_url)
+        timer = StageTimer()
+        # Distinct IDs with distinct mock texts, so the field cache never answers.
+        base = max(state.article_ids) + 1
+        session_local = threading.local()
+        errors = 0
+        errors_lock = threading.Lock()
+
+        def one(idx: int) -> None:
+            nonlocal errors
+            session = getattr(session_local, "session", None)
+            if session is None:
+                session = session_local.session = requests.Session()
+            payload: Dict[str, Any] = {"article_id": base + idx}
+            if args.fields:
+                payload["fields"] = args.fields
+            started = time.perf_counter()
+            try:
+                resp = session.post(f"{app_url}/infer", json=payload, timeout=args.timeout)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                resp, ok = None, False
+            timer.add("total", time.perf_counter() - started)
+            if not ok:
+                with errors_lock:
+                    errors += 1
+                return
+            for stage, seconds in parse_server_timing(resp.headers.get("Server-Timing", "")).items():
+                timer.add(stage, seconds)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 3) if elapsed else 0.0,
+        "latency": {stage: latency_summary(samples) for stage, samples in timer.samples.items()},
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with mock vLLM and article API servers.")
+    parser.add_argument("mode", choices=("batch", "infer"), help="batch: batch_infer.run_batch in-process; infer: the /infer endpoint.")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Glob of grouped dumps providing articles and answers.")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Mock seconds before the first token.")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Mock generated tokens per second per request.")
+    parser.add_argument("--completion-tokens", type=int, help="Mock completion length (default: answer length / 4).")
+    parser.add_argument("--slots", type=int, default=16, help="Mock concurrent generations before requests queue.")
+    parser.add_argument("--article-latency", type=float, default=0.05, help="Mock seconds per article API call.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients (infer) or initial AIMD limit (batch).")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="AIMD upper bound (batch).")
+    parser.add_argument("--articles", type=int, default=100, help="Articles to process (batch).")
+    parser.add_argument("--variant", choices=("single", "separate", "vote", "cascade"), default="single", help="Prompt variant (batch).")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to send (infer).")
+    parser.add_argument("--fields", nargs="+", help="Fields to request from /infer.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per /infer request.")
+    parser.add_argument("--app-url", help="Benchmark an already running app instead of starting one.")
+    parser.add_argument("--log-interval", type=float, default=10.0, help="AIMD throughput log interval (batch).")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="JSONL file the report is appended to.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    articles, answers = load_fixtures(args.fixtures)
+    state = MockState(articles, answers, args.ttft, args.token_rate, args.completion_tokens, args.slots, args.article_latency)
+    servers = start_mock_servers(state)
+    configure_env(servers["env"])
+    try:
+        result = benchmark_batch(args, state) if args.mode == "batch" else benchmark_infer(args, state)
+    finally:
+        servers["llm"].stop()
+        servers["article"].stop()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "mode": args.mode,
+        "config": {key: getattr(args, key) for key in CONFIG_KEYS["common"] + CONFIG_KEYS[args.mode]},
+        "mock_calls": dict(state.counts),
+        **result,
+    }
+    summary = {key: value for key, value in report.items() if key != "throughput_history"}
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
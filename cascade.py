@@ -0,0 +1,280 @@
+"""Cheap first-stage classifier that answers easy articles without the LLM.
+
+A TF-IDF + logistic regression model (one head per field: user_need, I1, I3, I4) is
+trained on the article texts in the ``data/qwen3_infer_*.json`` dumps. Labels come from
+the human ``scores_*.json`` files where an article was annotated, and from the model's
+own output otherwise. The cascade's confidence for an article is the lowest top-class
+probability over the four heads. At or above the threshold the classifier answers;
+below it the article goes to ``query_model_with_usage`` as usual.
+
+``train`` picks the threshold from out-of-fold predictions on the annotated articles:
+the lowest threshold that keeps the cascaded ``final_score`` (``evaluate.py`` rubric)
+within ``--tolerance`` of the LLM-only score, i.e. the most LLM calls avoided at that
+quality. Use the model through ``batch_infer.py --variant cascade``:
+
+    python cascade.py train --tolerance 0.05
+    python batch_infer.py --variant cascade --test-path data/test_list_27_11_2025.json
+    python cascade.py report data/qwen3_infer_27_11_2025.json
+
+scikit-learn is only imported when a model is trained or loaded.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from evaluate import DEFAULT_GROUND_TRUTHS, evaluate_response, flatten_articles, load_json
+
+
+FIELDS = ("user_need", "I1", "I3", "I4")
+DEFAULT_MODEL_PATH = Path(os.getenv("CASCADE_MODEL_PATH", "./data/cascade_model.pkl"))
+DEFAULT_TRAIN_GLOB = "./data/qwen3_infer_*.json"
+DEFAULT_LLM_PREDICTIONS = Path("./data/qwen3_infer_2025_qc_selected.json")
+NEVER = 1.01
+
+
+class CascadeModel:
+    """Shared TF-IDF features with one logistic regression head per field."""
+
+    def __init__(self, threshold: float = NEVER) -> None:
+        self.threshold = threshold
+        self.vectorizer = None
+        self.heads: Dict[str, Any] = {}
+        self.constants: Dict[str, Any] = {}
+
+    def fit(self, texts: Sequence[str], responses: Sequence[Mapping[str, Any]]) -> "CascadeModel":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, max_features=200_000)
+        features = self.vectorizer.fit_transform(texts)
+        self.heads, self.constants = {}, {}
+        for field in FIELDS:
+            rows = [idx for idx, response in enumerate(responses) if response.get(field) is not None]
+            labels = [responses[idx][field] for idx in rows]
+            if len(set(labels)) < 2:
+                # A single observed class cannot train a classifier; always answer it.
+                self.constants[field] = labels[0] if labels else None
+                continue
+            head = LogisticRegression(max_iter=1000)
+            head.fit(features[rows], labels)
+            self.heads[field] = head
+        return self
+
+    def predict(self, texts: Sequence[str]) -> List[Tuple[Dict[str, Any], float]]:
+        """``(response, confidence)`` per text; confidence is the weakest head's top probability."""
+
+        features = self.vectorizer.transform(texts)
+        responses: List[Dict[str, Any]] = [{} for _ in texts]
+        confidence = np.ones(len(texts))
+        for field in FIELDS:
+            if field in self.heads:
+                head = self.heads[field]
+                probabilities = head.predict_proba(features)
+                best = probabilities.argmax(axis=1)
+                confidence = np.minimum(confidence, probabilities.max(axis=1))
+                for response, label in zip(responses, head.classes_[best]):
+                    response[field] = label.item() if hasattr(label, "item") else label
+            elif self.constants.get(field) is not None:
+                for response in responses:
+                    response[field] = self.constants[field]
+        return list(zip(responses, confidence.tolist()))
+
+    def save(self, path: Path) -> None:
+        # Pickle the fitted parts rather than the instance, so a model trained with
+        # ``python cascade.py`` (class in ``__main__``) loads from any other entry point.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            pickle.dump({"threshold": self.threshold, "vectorizer": self.vectorizer, "heads": self.heads, "constants": self.constants}, f)
+
+    @classmethod
+    def load(cls, path: Path) -> "CascadeModel":
+        with path.open("rb") as f:
+            state = pickle.load(f)
+        model = cls(state["threshold"])
+        model.vectorizer, model.heads, model.constants = state["vectorizer"], state["heads"], state["constants"]
+        return model
+
+
+_model: Optional[CascadeModel] = None
+_model_lock = threading.Lock()
+
+
+def get_cascade_model(path: Path = DEFAULT_MODEL_PATH) -> CascadeModel:
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = CascadeModel.load(path)
+    return _model
+
+
+def run_cascade(context: str) -> Tuple[Optional[dict], Dict[str, Dict[str, int]], Dict[str, Any]]:
+    """Runner for ``batch_infer``: classifier when confident, else the LLM."""
+
+    model = get_cascade_model()
+    response, confidence = model.predict([context])[0]
+    if confidence >= model.threshold:
+        return response, {}, {"cascade": {"answered_by": "classifier", "confidence": confidence}}
+
+    from qwen3_infer import build_prompt, parse_json_output, query_model_with_usage
+
+    raw_output, usage = query_model_with_usage(build_prompt(context))
+    return parse_json_output(raw_output), {"full": usage}, {"cascade": {"answered_by": "llm", "confidence": confidence}}
+
+
+def training_set(
+    dump_paths: Sequence[str],
+    gt_datasets: Sequence[Mapping[str, Any]],
+) -> Tuple[List[int], List[str], List[Dict[str, Any]], List[bool]]:
+    """Article ids, texts, labels and whether each label is human."""
+
+    gt_indices = [flatten_articles(gt) for gt in gt_datasets]
+    texts: Dict[int, str] = {}
+    llm_labels: Dict[int, Dict[str, Any]] = {}
+    for path in dump_paths:
+        for items in load_json(Path(path)).values():
+            for item in items if isinstance(items, list) else []:
+                article_id = int(item["article_id"])
+                if isinstance(item.get("data"), str):
+                    texts.setdefault(article_id, item["data"])
+                if isinstance(item.get("response"), dict):
+                    llm_labels.setdefault(article_id, item["response"])
+
+    ids, docs, labels, human = [], [], [], []
+    for article_id, text in texts.items():
+        gt = next((index[article_id]["response"] for index in gt_indices if article_id in index), None)
+        label = gt if isinstance(gt, dict) else llm_labels.get(article_id)
+        if label is None:
+            continue
+        ids.append(article_id)
+        docs.append(text)
+        labels.append(label)
+        human.append(isinstance(gt, dict))
+    return ids, docs, labels, human
+
+
+def out_of_fold(texts: Sequence[str], labels: Sequence[Mapping[str, Any]], folds: int, seed: int) -> List[Tuple[Dict[str, Any], float]]:
+    order = np.random.default_rng(seed).permutation(len(texts))
+    predictions: List[Optional[Tuple[Dict[str, Any], float]]] = [None] * len(texts)
+    for fold in np.array_split(order, folds):
+        held_out = set(fold.tolist())
+        train = [idx for idx in range(len(texts)) if idx not in held_out]
+        model = CascadeModel().fit([texts[idx] for idx in train], [labels[idx] for idx in train])
+        for idx, prediction in zip(fold.tolist(), model.predict([texts[idx] for idx in fold.tolist()])):
+            predictions[idx] = prediction
+    return predictions  # type: ignore[return-value]
+
+
+def tune_threshold(
+    cheap: Sequence[Tuple[Mapping[str, Any], float]],
+    llm: Sequence[Mapping[str, Any]],
+    gt_candidates: Sequence[Sequence[Mapping[str, Any]]],
+    tolerance: float,
+) -> Dict[str, Any]:
+    """Lowest threshold whose cascaded final_score stays within ``tolerance`` of the LLM."""
+
+    cheap_scores = np.array([evaluate_response(response, gts)[1]["final_score"] for (response, _), gts in zip(cheap, gt_candidates)])
+    llm_scores = np.array([evaluate_response(response, gts)[1]["final_score"] for response, gts in zip(llm, gt_candidates)])
+    confidence = np.array([conf for _, conf in cheap])
+    llm_final = float(llm_scores.mean())
+
+    curve = []
+    best = {"threshold": NEVER, "final_score": llm_final, "avoided": 0.0}
+    for threshold in sorted(set(confidence.tolist()), reverse=True):
+        answered = confidence >= threshold
+        final = float(np.where(answered, cheap_scores, llm_scores).mean())
+        point = {"threshold": threshold, "final_score": final, "avoided": float(answered.mean())}
+        curve.append(point)
+        if llm_final - final <= tolerance:
+            best = point
+    return {"llm_final_score": llm_final, "classifier_final_score": float(cheap_scores.mean()), "chosen": best, "curve": curve}
+
+
+def train(args: argparse.Namespace) -> None:
+    gt_datasets = [load_json(path) for path in args.ground_truths]
+    ids, texts, labels, human = training_set(sorted(glob.glob(args.train_glob)), gt_datasets)
+    print(f"Training articles: {len(ids)} ({sum(human)} with human labels)")
+
+    llm_index = flatten_articles(load_json(args.llm_predictions))
+    gt_indices = [flatten_articles(gt) for gt in gt_datasets]
+    evaluable = [
+        idx for idx, article_id in enumerate(ids)
+        if human[idx] and isinstance(llm_index.get(article_id, {}).get("response"), dict)
+    ]
+    if not evaluable:
+        raise ValueError("No annotated articles with LLM predictions to tune the threshold on.")
+
+    oof = out_of_fold(texts, labels, min(args.folds, len(ids)), args.seed)
+    tuning = tune_threshold(
+        [oof[idx] for idx in evaluable],
+        [llm_index[ids[idx]]["response"] for idx in evaluable],
+        [[index[ids[idx]]["response"] for index in gt_indices if ids[idx] in index] for idx in evaluable],
+        args.tolerance,
+    )
+    chosen = tuning["chosen"]
+    print(f"Tuned on {len(evaluable)} annotated articles (out-of-fold).")
+    print(f"LLM-only final_score: {tuning['llm_final_score']:.3f} | classifier-only: {tuning['classifier_final_score']:.3f}")
+    print(
+        f"Threshold {chosen['threshold']:.3f}: final_score {chosen['final_score']:.3f} "
+        f"(tolerance {args.tolerance}), LLM calls avoided {chosen['avoided'] * 100:.1f}%"
+    )
+
+    model = CascadeModel(threshold=chosen["threshold"]).fit(texts, labels)
+    model.save(args.model)
+    print(f"Model written to {args.model}")
+    if args.save_curve:
+        args.save_curve.parent.mkdir(parents=True, exist_ok=True)
+        with args.save_curve.open("w", encoding="utf-8") as f:
+            json.dump(tuning, f, indent=2)
+
+
+def report(args: argparse.Namespace) -> None:
+    dataset = load_json(args.predictions)
+    rows = [item for items in dataset.values() if isinstance(items, list) for item in items]
+    routed = [item["cascade"]["answered_by"] for item in rows if isinstance(item.get("cascade"), dict)]
+    if not routed:
+        print("No cascade rows found.")
+        return
+    avoided = routed.count("classifier")
+    print(f"Rows: {len(routed)} | answered by classifier: {avoided} | LLM calls avoided: {avoided / len(routed) * 100:.1f}%")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train and inspect the classifier cascade.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fit = sub.add_parser("train", help="Train the classifier and tune its threshold.")
+    fit.add_argument("--train-glob", default=DEFAULT_TRAIN_GLOB, help="Dumps providing article texts and LLM labels.")
+    fit.add_argument("--ground-truths", dest="ground_truths", type=Path, nargs="+", default=list(DEFAULT_GROUND_TRUTHS))
+    fit.add_argument("--llm-predictions", type=Path, default=DEFAULT_LLM_PREDICTIONS, help="LLM dump to compare against when tuning.")
+    fit.add_argument("--tolerance", type=float, default=0.05, help="Allowed final_score drop versus the LLM alone.")
+    fit.add_argument("--folds", type=int, default=5)
+    fit.add_argument("--seed", type=int, default=0)
+    fit.add_argument("--model", type=Path, default=DEFAULT_MODEL_PATH)
+    fit.add_argument("--save-curve", type=Path, help="Optional JSON path for the threshold/score/avoided curve.")
+
+    show = sub.add_parser("report", help="Fraction of LLM calls avoided in a cascade dump.")
+    show.add_argument("predictions", type=Path)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.command == "train":
+        train(args)
+    else:
+        report(args)
+
+
+if __name__ == "__main__":
+    main()
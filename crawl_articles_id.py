@@ -1,7 +1,49 @@
+"""Collect article IDs from VnExpress category pages.
+
+``crawl_article_links`` / ``crawl_article_links_xpath`` fetch one page. ``Crawler``
+walks many categories and their paginated listings (``<category>-p2``, ``-p3``...)
+concurrently behind a per-host politeness limiter, extracts article IDs with lxml in the
+same pass, skips IDs seen in earlier runs (persisted in a crawl state file) and writes
+``test_list_*.json``-format output. The state file also keeps each listing's ETag /
+Last-Modified; re-crawls send conditional requests, and a ``304 Not Modified`` ends the
+walk of that category without downloading or parsing anything:
+
+    python crawl_articles_id.py --categories tam-su/hen-ho kinh-doanh/doanh-nghiep --pages 3
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlparse
+
 import requests
 from bs4 import BeautifulSoup
 from lxml import html
+
+from utils import RateLimiter
+
 URL = "https://vnexpress.net/tam-su/hen-ho"
+BASE_URL = "https://vnexpress.net"
+DEFAULT_STATE_PATH = Path("./data/crawl_state.json")
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/122.0.0.0 Safari/537.36"
+    )
+}
+ARTICLE_ID_RE = re.compile(r"-(\d+)\.html")
+# Article links on listing pages: titles inside <article> cards and thumbnail anchors.
+ARTICLE_LINK_XPATH = (
+    "//article//h2/a/@href | //article//h3/a/@href"
+    " | //a[starts-with(@data-medium, 'Item-')][@data-thumb]/@href"
+)
 
 def crawl_article_links(url: str):
     headers = {
@@ -65,11 +107,240 @@ def crawl_article_links_xpath(url: str):
     unique_links = list(dict.fromkeys(links))
     return unique_links
 
+def article_id_from_url(link: str) -> Optional[int]:
+    match = ARTICLE_ID_RE.search(link)
+    return int(match.group(1)) if match else None
+
+
+def extract_article_ids(page_html: str) -> List[int]:
+    """Article IDs linked from a listing page, in page order, without duplicates."""
+
+    tree = html.fromstring(page_html)
+    ids = (article_id_from_url(link) for link in tree.xpath(ARTICLE_LINK_XPATH))
+    return list(dict.fromkeys(article_id for article_id in ids if article_id is not None))
+
+
+class Page(NamedTuple):
+    url: str
+    status: int
+    html: Optional[str]
+    validators: Dict[str, str]
+
+
+def page_url(category: str, page: int) -> str:
+    path = category.strip("/")
+    return f"{BASE_URL}/{path}" if page <= 1 else f"{BASE_URL}/{path}-p{page}"
+
+
+class CrawlState:
+    """Article IDs emitted by earlier crawls and per-URL cache validators, persisted as JSON."""
+
+    def __init__(self, path: Path = DEFAULT_STATE_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.seen: Set[int] = set()
+        self.validators: Dict[str, Dict[str, str]] = {}
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                payload = json.load(f)
+            self.seen = set(payload.get("seen", []))
+            self.validators = payload.get("validators", {})
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            cached = self.validators.get(url, {})
+        headers = {}
+        if "etag" in cached:
+            headers["If-None-Match"] = cached["etag"]
+        if "last_modified" in cached:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return headers
+
+    def has_validators(self, url: str) -> bool:
+        with self._lock:
+            return bool(self.validators.get(url))
+
+    def set_validators(self, url: str, validators: Dict[str, str]) -> None:
+        with self._lock:
+            if validators:
+                self.validators[url] = validators
+            else:
+                self.validators.pop(url, None)
+
+    def claim(self, article_ids: Iterable[int], limit: Optional[int] = None) -> List[int]:
+        """Mark up to ``limit`` unseen IDs as seen and return them."""
+
+        with self._lock:
+            new_ids = [article_id for article_id in article_ids if article_id not in self.seen]
+            if limit is not None:
+                new_ids = new_ids[:limit]
+            self.seen.update(new_ids)
+        return new_ids
+
+    def release(self, article_ids: Iterable[int]) -> None:
+        """Forget claimed IDs so a later crawl claims them again."""
+
+        with self._lock:
+            self.seen.difference_update(article_ids)
+
+    def save(self, exclude_ids: Iterable[int] = (), exclude_urls: Iterable[str] = ()) -> None:
+        """Persist the state, leaving out IDs and page validators still being processed."""
+
+        excluded_urls = set(exclude_urls)
+        # Copy under the lock; sorting and writing happen outside it so claim() never waits on disk.
+        with self._lock:
+            seen = self.seen.difference(exclude_ids)
+            validators = {url: dict(value) for url, value in self.validators.items() if url not in excluded_urls}
+        payload = {"seen": sorted(seen), "validators": validators}
+        with self._save_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".json.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self.path)
+
+
+class Crawler:
+    """Concurrent, polite crawler over paginated category listings."""
+
+    def __init__(
+        self,
+        state: Optional[CrawlState] = None,
+        rate: float = 2.0,
+        workers: int = 4,
+        timeout: float = 10,
+    ):
+        self.state = state if state is not None else CrawlState()
+        self.rate = rate
+        self.workers = workers
+        self.timeout = timeout
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._limiters_lock = threading.Lock()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "bytes": 0, "pages_parsed": 0}
+
+    def _count(self, **deltas: int) -> None:
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def _limiter(self, url: str) -> RateLimiter:
+        host = urlparse(url).netloc
+        with self._limiters_lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(self.rate)
+            return self._limiters[host]
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            self._local.session = session
+        return session
+
+    def fetch_page(self, url: str) -> Page:
+        """Conditionally GET a listing page (``html`` is ``None`` on 304 and 404)."""
+
+        self._limiter(url).acquire()
+        resp = self._session().get(url, headers=self.state.conditional_headers(url), timeout=self.timeout)
+        self._count(requests=1)
+        if resp.status_code in (304, 404):
+            self._count(not_modified=int(resp.status_code == 304))
+            return Page(url, resp.status_code, None, {})
+        resp.raise_for_status()
+        self._count(bytes=len(resp.content))
+        validators = {}
+        if resp.headers.get("ETag"):
+            validators["etag"] = resp.headers["ETag"]
+        if resp.headers.get("Last-Modified"):
+            validators["last_modified"] = resp.headers["Last-Modified"]
+        return Page(url, resp.status_code, resp.text, validators)
+
+    def iter_pages(self, category: str, max_pages: int = 1) -> Iterator[Tuple[Page, List[int]]]:
+        """Yield each listing page with its article IDs.
+
+        Stops at a missing or empty page, and at a 304 when every deeper page was fetched
+        before: an unchanged listing page means nothing new was published in the category.
+        Deeper pages without stored validators (``max_pages`` was raised, or an earlier
+        crawl stopped sooner) are still fetched.
+        """
+
+        for number in range(1, max_pages + 1):
+            page = self.fetch_page(page_url(category, number))
+            if page.status == 304:
+                deeper = (page_url(category, deeper) for deeper in range(number + 1, max_pages + 1))
+                if all(self.state.has_validators(url) for url in deeper):
+                    return
+                continue
+            if page.html is None:
+                return
+            self._count(pages_parsed=1)
+            ids = extract_article_ids(page.html)
+            if not ids:
+                return
+            yield page, ids
+
+    def crawl_category(self, category: str, max_pages: int = 1, limit: Optional[int] = None) -> List[int]:
+        """Unseen article IDs of one category (at most ``limit``), marked as seen."""
+
+        collected: List[int] = []
+        for page, ids in self.iter_pages(category, max_pages):
+            room = None if limit is None else limit - len(collected)
+            collected.extend(self.state.claim(ids, room))
+            if limit is not None and len(collected) >= limit:
+                # The page may hold unseen IDs beyond the limit: keep it uncached.
+                self.state.set_validators(page.url, {})
+                break
+            self.state.set_validators(page.url, page.validators)
+        return collected
+
+    def crawl(self, categories: Iterable[str], max_pages: int = 1, limit: Optional[int] = None) -> Dict[str, List[int]]:
+        """New article IDs per category, crawling categories concurrently."""
+
+        categories = list(dict.fromkeys(categories))
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(categories)))) as executor:
+            results = executor.map(lambda category: self.crawl_category(category, max_pages, limit), categories)
+            return dict(zip(categories, results))
+
+
+def write_test_list(path: Path, articles: Dict[str, List[int]]) -> None:
+    """Write ``{"articles_id": {category: [ids]}}`` laid out like the existing test lists."""
+
+    rows = [f"        {json.dumps(category, ensure_ascii=False)}: {json.dumps(ids)}" for category, ids in articles.items()]
+    body = ",\n".join(rows)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        f.write('{\n    "articles_id": {\n' + body + "\n    }\n}\n")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Crawl category listings into a test_list_*.json file.")
+    parser.add_argument("--categories", nargs="+", default=[urlparse(URL).path.strip("/")], help="Category paths, e.g. tam-su/hen-ho.")
+    parser.add_argument("--pages", type=int, default=1, help="Listing pages to walk per category.")
+    parser.add_argument("--per-category", type=int, help="Keep at most this many new IDs per category.")
+    parser.add_argument("--workers", type=int, default=4, help="Categories crawled concurrently.")
+    parser.add_argument("--rate", type=float, default=2.0, help="Maximum requests per second per host.")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE_PATH, help="Crawl state file (seen IDs).")
+    parser.add_argument("--output", type=Path, help="Output path (default: ./data/test_list_<dd_mm_yyyy>.json).")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    crawler = Crawler(CrawlState(args.state), rate=args.rate, workers=args.workers)
+    articles = crawler.crawl(args.categories, args.pages, args.per_category)
+    crawler.state.save()
+
+    output = args.output or Path(f"./data/test_list_{date.today():%d_%m_%Y}.json")
+    write_test_list(output, articles)
+    total = sum(len(ids) for ids in articles.values())
+    print(f"Wrote {total} new article IDs in {len(articles)} categories to {output}")
+    print(f"Requests: {crawler.stats['requests']} (304: {crawler.stats['not_modified']}), "
+          f"downloaded {crawler.stats['bytes']} bytes, parsed {crawler.stats['pages_parsed']} pages")
+
+
 if __name__ == "__main__":
-    links = crawl_article_links_xpath(URL)
-    print(links)
-    out_id = []
-    for link in links:
-        out_id.append(int(link.split(".")[1].split("-")[-1]))
-    
-    print(out_id[:10])
+    main()
@@ -0,0 +1,308 @@
+"""Near-duplicate detection over article texts (MinHash + LSH).
+
+Syndicated and updated versions of a story get new article IDs with nearly identical
+text. ``DedupIndex`` keeps a MinHash signature of every labeled text (the output of
+``build_input_data``) in an LSH table, so a new text is matched against all earlier ones
+with a handful of dict lookups:
+
+- texts are lower-cased, split into words and shingled into word ``shingle_size``-grams;
+- each shingle is hashed once, and ``num_perm`` multiply-shift hashes give the signature;
+- the signature is cut into bands whose size is picked from ``threshold``, and any text
+  sharing a band is a candidate. Candidates are kept when their estimated Jaccard
+  similarity (share of equal signature slots) reaches ``threshold``.
+
+``batch_infer.py --dedup-index`` and the service (``DEDUP_THRESHOLD``) use it to label a
+near-duplicate with the earlier result instead of calling the model. Entries are keyed by
+article ID (``entry_key``); only raw text without an ID falls back to a text hash, so an
+index built from dumps never matches an article against its own entry. The CLI builds an
+index from existing dumps and measures the hit rate and lookup time on a dump:
+
+    python dedup.py build --output data/dedup_index.npz
+    python dedup.py scan data/qwen3_infer_27_11_2025.json --index data/dedup_index.npz
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 3
+DEFAULT_INDEX_PATH = Path("./data/dedup_index.npz")
+DEFAULT_DUMPS = "./data/qwen3_infer_*.json"
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Odd 64-bit multipliers for combining word hashes into shingle hashes.
+SHINGLE_MULTIPLIERS = np.array(
+    [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD],
+    dtype=np.uint64,
+)
+
+
+def entry_key(article_id: Optional[int], fallback: Hashable) -> Hashable:
+    """Index key of a text: its article ID, or ``fallback`` (a text hash) for raw text."""
+
+    return int(article_id) if article_id is not None else fallback
+
+
+class Match(NamedTuple):
+    key: Any
+    similarity: float
+    result: Optional[Dict[str, Any]]
+
+
+def shingle_hashes(text: str, shingle_size: int = DEFAULT_SHINGLE_SIZE) -> np.ndarray:
+    """64-bit hashes of the distinct word ``shingle_size``-grams of ``text``."""
+
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.zeros(1, dtype=np.uint64)
+    tokens = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    size = min(shingle_size, len(tokens), len(SHINGLE_MULTIPLIERS))
+    count = len(tokens) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes ^= tokens[offset:offset + count] * SHINGLE_MULTIPLIERS[offset]
+    return np.unique(hashes)
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """``(bands, rows)`` whose LSH S-curve midpoint is the highest one not above ``threshold``.
+
+    Staying at or below the threshold favours recall; the Jaccard check on candidates
+    removes the extra false positives.
+    """
+
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1.0 / bands) ** (1.0 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+class DedupIndex:
+    """Thread-safe MinHash/LSH index of labeled texts with hit-rate statistics."""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        max_entries: Optional[int] = None,
+        seed: int = 1,
+    ) -> None:
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1].")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.seed = seed
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self._a = (rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64)
+        self._entries: "OrderedDict[Hashable, Tuple[np.ndarray, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._buckets: List[Dict[bytes, set]] = [defaultdict(set) for _ in range(self.bands)]
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text, self.shingle_size)
+        # Multiply-shift hashing: the top 32 bits of a*x + b (mod 2^64).
+        return ((self._a * hashes + self._b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, key: Hashable, text: str, result: Optional[Dict[str, Any]] = None) -> None:
+        self.add_signature(key, self.signature(text), result)
+
+    def add_signature(self, key: Hashable, signature: np.ndarray, result: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, result)
+            for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+                bucket[band_key].add(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        signature, _ = self._entries.pop(key)
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            members = bucket.get(band_key)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del bucket[band_key]
+
+    def query(self, text: str, exclude: Optional[Hashable] = None) -> Optional[Match]:
+        return self.query_signature(self.signature(text), exclude)
+
+    def query_signature(self, signature: np.ndarray, exclude: Optional[Hashable] = None) -> Optional[Match]:
+        """Most similar indexed entry at or above the threshold, if any."""
+
+        started = time.perf_counter()
+        best: Optional[Match] = None
+        with self._lock:
+            candidates = set()
+            for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+                candidates |= bucket.get(band_key, set())
+            candidates.discard(exclude)
+            for key in candidates:
+                other, result = self._entries[key]
+                similarity = float(np.count_nonzero(other == signature)) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                    best = Match(key, similarity, result)
+            self.lookups += 1
+            self.hits += best is not None
+            self.lookup_seconds += time.perf_counter() - started
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "mean_lookup_ms": self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+                "threshold": self.threshold,
+                "bands": self.bands,
+                "rows": self.rows,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def save(self, path: Path) -> None:
+        """Write signatures, keys and results to one ``.npz`` file (no pickling)."""
+
+        with self._lock:
+            keys = list(self._entries)
+            signatures = np.stack([self._entries[key][0] for key in keys]) if keys else np.zeros((0, self.num_perm), dtype=np.uint32)
+            meta = {
+                "threshold": self.threshold,
+                "num_perm": self.num_perm,
+                "shingle_size": self.shingle_size,
+                "max_entries": self.max_entries,
+                "seed": self.seed,
+                "keys": keys,
+                "results": [self._entries[key][1] for key in keys],
+            }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            np.savez(f, signatures=signatures, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+
+    @classmethod
+    def load(cls, path: Path, threshold: Optional[float] = None) -> "DedupIndex":
+        """Load an index; ``threshold`` overrides the saved one (signatures stay valid)."""
+
+        with np.load(path, allow_pickle=False) as data:
+            signatures = data["signatures"]
+            meta = json.loads(str(data["meta"]))
+        index = cls(threshold or meta["threshold"], meta["num_perm"], meta["shingle_size"], meta["max_entries"], meta["seed"])
+        for key, signature, result in zip(meta["keys"], signatures, meta["results"]):
+            index.add_signature(key, signature, result)
+        return index
+
+
+def iter_dump_rows(pattern: str):
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            dataset = json.load(f)
+        for items in dataset.values():
+            for item in items if isinstance(items, list) else []:
+                if isinstance(item.get("data"), str):
+                    yield item
+
+
+def build(args: argparse.Namespace) -> None:
+    index = DedupIndex(args.threshold, args.num_perm, args.shingle_size)
+    for item in iter_dump_rows(args.dumps):
+        if isinstance(item.get("response"), dict):
+            index.add(int(item["article_id"]), item["data"], item["response"])
+    index.save(args.output)
+    print(f"Indexed {len(index)} labeled articles into {args.output} (bands={index.bands}, rows={index.rows})")
+
+
+def scan(args: argparse.Namespace) -> None:
+    """Look up every row of a dump (then index it), as a batch run would."""
+
+    if args.index and args.index.exists():
+        index = DedupIndex.load(args.index, args.threshold)
+    else:
+        index = DedupIndex(args.threshold, args.num_perm, args.shingle_size)
+    signature_seconds: List[float] = []
+    lookup_seconds: List[float] = []
+    agree = compared = 0
+    for item in iter_dump_rows(str(args.dump)):
+        article_id = int(item["article_id"])
+        started = time.perf_counter()
+        signature = index.signature(item["data"])
+        hashed = time.perf_counter()
+        match = index.query_signature(signature, exclude=article_id)
+        signature_seconds.append(hashed - started)
+        lookup_seconds.append(time.perf_counter() - hashed)
+        response = item.get("response")
+        if match is not None:
+            print(f"{article_id} ~ {match.key} (similarity {match.similarity:.2f})")
+            if isinstance(response, dict) and isinstance(match.result, dict):
+                compared += 1
+                agree += response.get("user_need") == match.result.get("user_need")
+        index.add_signature(article_id, signature, response if isinstance(response, dict) else None)
+
+    stats = index.stats()
+    print(f"\nLookups: {stats['lookups']} | hits: {stats['hits']} | hit rate: {stats['hit_rate'] * 100:.1f}%")
+    if lookup_seconds:
+        for name, samples in (("signature", signature_seconds), ("lookup", lookup_seconds)):
+            values = np.asarray(samples) * 1000
+            print(f"{name:<9} p50 {np.percentile(values, 50):.3f} ms | p99 {np.percentile(values, 99):.3f} ms")
+    if compared:
+        print(f"user_need agreement with the earlier result: {agree}/{compared}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Near-duplicate article index (MinHash + LSH).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimum estimated Jaccard similarity.")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="MinHash signature length.")
+    parser.add_argument("--shingle-size", type=int, default=DEFAULT_SHINGLE_SIZE, help="Words per shingle.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="Index the labeled rows of existing dumps.")
+    build_parser.add_argument("--dumps", default=DEFAULT_DUMPS, help="Glob of grouped dumps.")
+    build_parser.add_argument("--output", type=Path, default=DEFAULT_INDEX_PATH)
+
+    scan_parser = sub.add_parser("scan", help="Report near-duplicates, hit rate and lookup time for a dump.")
+    scan_parser.add_argument("dump", type=Path)
+    scan_parser.add_argument("--index", type=Path, help="Start from a saved index instead of an empty one.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.command == "build":
+        build(args)
+    else:
+        scan(args)
+
+
+if __name__ == "__main__":
+    main()
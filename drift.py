@@ -0,0 +1,300 @@
+"""Rolling label distributions and drift alerts for the service.
+
+``analyze_responses.py`` counts labels offline from a saved dump. ``DriftMonitor`` keeps
+the same counts online, over the last ``DRIFT_WINDOW`` results of every category plus an
+``_all`` window:
+
+- categories are keyed like the dumps and test lists (``kinhdoanh/doanh-nghiep``,
+  ``vnexpress/tam-su``): ``category_key`` derives that slug from the category URL of the
+  article payload. Only categories present in the baseline get their own window; the
+  rest count towards ``_all`` only, so the number of windows is bounded;
+
+- each window is a ``deque`` plus one ``Counter`` per field. Recording a result is O(1):
+  the label leaving the window is decremented and the new one incremented;
+- after every update the window's distribution of ``user_need``/``I1``/``I3``/``I4`` is
+  compared with the baseline dump using Jensen-Shannon divergence (base 2, so in [0, 1]).
+  The baseline is that category's distribution in the dump. Categories with fewer
+  than ``DRIFT_MIN_BASELINE_ROWS`` rows there (10, the size of each category in the
+  default dump) are compared with the dump's overall distribution instead;
+- once a window holds ``DRIFT_MIN_SAMPLES`` results, a divergence above
+  ``DRIFT_JSD_THRESHOLD`` raises an alert. The alert clears only when the divergence drops
+  below ``DRIFT_CLEAR_RATIO`` times the threshold, so a window hovering near the threshold
+  does not flap. Alerts are logged once when they start and once when they clear.
+
+The service exposes ``GET /drift`` and ``drift_*`` entries in ``/metrics``. The same
+comparison runs offline between two dumps:
+
+    python drift.py --baseline data/qwen3_infer_27_11_2025.json --current data/qwen3_infer_2025_qc_selected.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+import threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+from evaluate import load_json
+from output_parser import IMPACT_FIELDS
+
+
+FIELDS = ("user_need",) + IMPACT_FIELDS
+OVERALL = "_all"
+DRIFT_BASELINE = os.getenv("DRIFT_BASELINE", "./data/qwen3_infer_27_11_2025.json")
+DRIFT_WINDOW = int(os.getenv("DRIFT_WINDOW", "500"))
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", "100"))
+DRIFT_JSD_THRESHOLD = float(os.getenv("DRIFT_JSD_THRESHOLD", "0.1"))
+DRIFT_CLEAR_RATIO = float(os.getenv("DRIFT_CLEAR_RATIO", "0.8"))
+DRIFT_MIN_BASELINE_ROWS = int(os.getenv("DRIFT_MIN_BASELINE_ROWS", "10"))
+
+logger = logging.getLogger(__name__)
+
+Distribution = Dict[str, float]
+
+
+def category_slug(url: str) -> Optional[str]:
+    """``https://kinhdoanh.vnexpress.net/doanh-nghiep`` -> ``kinhdoanh/doanh-nghiep``.
+
+    Sections on the main site take the ``vnexpress`` prefix (``vnexpress/tam-su``).
+    """
+
+    parsed = urlparse(url if "//" in url else f"https://vnexpress.net/{url.lstrip('/')}")
+    host = (parsed.hostname or "").lower()
+    if not host.endswith("vnexpress.net"):
+        return None
+    site = host[: -len("vnexpress.net")].rstrip(".").removeprefix("www") or "vnexpress"
+    path = parsed.path.strip("/")
+    return f"{site}/{path}" if path else site
+
+
+def category_key(api_data: Mapping[str, Any]) -> Optional[str]:
+    """The dump/test list category of an article payload, or ``None`` if it has no URL."""
+
+    category = (api_data.get("data") or {}).get("article_category")
+    for entry in category if isinstance(category, list) else [category]:
+        if isinstance(entry, Mapping):
+            url = entry.get("cate_url") or entry.get("url") or entry.get("share_url")
+            if isinstance(url, str) and url.strip():
+                return category_slug(url.strip())
+    return None
+
+
+def normalize(counts: Mapping[Any, float]) -> Distribution:
+    total = sum(counts.values())
+    return {str(label): count / total for label, count in counts.items() if count} if total else {}
+
+
+def js_divergence(p: Mapping[str, float], q: Mapping[str, float]) -> float:
+    """Jensen-Shannon divergence (base 2) between two label distributions."""
+
+    divergence = 0.0
+    for label in set(p) | set(q):
+        pi, qi = p.get(label, 0.0), q.get(label, 0.0)
+        mi = (pi + qi) / 2
+        if pi:
+            divergence += 0.5 * pi * math.log2(pi / mi)
+        if qi:
+            divergence += 0.5 * qi * math.log2(qi / mi)
+    return max(0.0, divergence)
+
+
+def dump_distributions(dataset: Mapping[str, Any], min_rows: int = 1) -> Dict[str, Dict[str, Distribution]]:
+    """``category -> field -> distribution`` of a grouped dump, plus ``_all``.
+
+    Categories with fewer than ``min_rows`` labeled rows are left out.
+    """
+
+    counts: Dict[str, Dict[str, Counter]] = {}
+    rows: Counter = Counter()
+    for category, items in dataset.items():
+        for item in items if isinstance(items, list) else []:
+            response = item.get("response") if isinstance(item, dict) else None
+            if not isinstance(response, dict):
+                continue
+            for key in (category, OVERALL):
+                rows[key] += 1
+                fields = counts.setdefault(key, {field: Counter() for field in FIELDS})
+                for field in FIELDS:
+                    if response.get(field) is not None:
+                        fields[field][str(response[field])] += 1
+    return {
+        key: {field: normalize(counter) for field, counter in fields.items()}
+        for key, fields in counts.items() if key == OVERALL or rows[key] >= min_rows
+    }
+
+
+class LabelWindow:
+    """The last ``size`` results of one category with per-field label counts."""
+
+    def __init__(self, size: int) -> None:
+        self.entries: deque = deque()
+        self.size = size
+        self.counts: Dict[str, Counter] = {field: Counter() for field in FIELDS}
+        self.total = 0
+        self.alerting: Dict[str, bool] = {field: False for field in FIELDS}
+
+    def add(self, labels: Mapping[str, str]) -> None:
+        if len(self.entries) == self.size:
+            for field, label in self.entries.popleft().items():
+                self.counts[field][label] -= 1
+                if not self.counts[field][label]:
+                    del self.counts[field][label]
+        self.entries.append(labels)
+        for field, label in labels.items():
+            self.counts[field][label] += 1
+        self.total += 1
+
+    def distributions(self) -> Dict[str, Distribution]:
+        return {field: normalize(counter) for field, counter in self.counts.items()}
+
+
+class DriftMonitor:
+    """Thread-safe per-category windows compared against a baseline dump."""
+
+    def __init__(
+        self,
+        baseline: Optional[Mapping[str, Mapping[str, Distribution]]] = None,
+        window: int = DRIFT_WINDOW,
+        min_samples: int = DRIFT_MIN_SAMPLES,
+        threshold: float = DRIFT_JSD_THRESHOLD,
+        baseline_path: Optional[str] = None,
+    ) -> None:
+        self.baseline = dict(baseline or {})
+        self.baseline_path = baseline_path
+        self.window = window
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self.windows: Dict[str, LabelWindow] = {}
+        self.untracked = 0
+        self.alerts_raised = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "DriftMonitor":
+        baseline = None
+        if DRIFT_BASELINE and Path(DRIFT_BASELINE).exists():
+            baseline = dump_distributions(load_json(Path(DRIFT_BASELINE)), DRIFT_MIN_BASELINE_ROWS)
+        else:
+            logger.warning("Drift baseline %s not found; distributions are tracked without alerts", DRIFT_BASELINE)
+        return cls(baseline, baseline_path=DRIFT_BASELINE if baseline else None)
+
+    def baseline_for(self, category: str) -> Optional[Mapping[str, Distribution]]:
+        return self.baseline.get(category) or self.baseline.get(OVERALL)
+
+    def record(self, category: Optional[str], response: Mapping[str, Any]) -> None:
+        labels = {field: str(response[field]) for field in FIELDS if response.get(field) is not None}
+        if not labels:
+            return
+        with self._lock:
+            keys = {OVERALL}
+            if category in self.baseline:
+                keys.add(category)
+            elif category:
+                self.untracked += 1
+            for key in keys:
+                window = self.windows.get(key)
+                if window is None:
+                    window = self.windows[key] = LabelWindow(self.window)
+                window.add(labels)
+                self._check(key, window, labels)
+
+    def _check(self, category: str, window: LabelWindow, labels: Iterable[str]) -> None:
+        baseline = self.baseline_for(category)
+        if baseline is None:
+            return
+        for field in labels:
+            size = sum(window.counts[field].values())
+            divergence = js_divergence(normalize(window.counts[field]), baseline.get(field, {}))
+            limit = self.threshold * (DRIFT_CLEAR_RATIO if window.alerting[field] else 1.0)
+            alerting = size >= self.min_samples and divergence > limit
+            if alerting and not window.alerting[field]:
+                self.alerts_raised += 1
+                logger.warning(
+                    "Label drift in %s/%s: JSD %.3f > %.3f over the last %d results",
+                    category, field, divergence, self.threshold, size,
+                )
+            elif window.alerting[field] and not alerting:
+                logger.info("Label drift in %s/%s cleared (JSD %.3f)", category, field, divergence)
+            window.alerting[field] = alerting
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            categories = {}
+            for category, window in sorted(self.windows.items()):
+                current = window.distributions()
+                baseline = self.baseline_for(category)
+                categories[category] = {
+                    "window": len(window.entries),
+                    "seen": window.total,
+                    "distribution": current,
+                    "jsd": {
+                        field: round(js_divergence(current[field], baseline.get(field, {})), 4)
+                        for field in FIELDS if current[field]
+                    } if baseline else {},
+                    "alerts": [field for field, alerting in window.alerting.items() if alerting],
+                }
+            return {
+                "baseline": self.baseline_path,
+                "window_size": self.window,
+                "min_samples": self.min_samples,
+                "threshold": self.threshold,
+                "alerts_raised": self.alerts_raised,
+                # Results whose category has no baseline (counted in _all only).
+                "untracked": self.untracked,
+                "categories": categories,
+            }
+
+    def metrics(self) -> Dict[str, float]:
+        snapshot = self.snapshot()
+        metrics: Dict[str, float] = {
+            "drift_alerts_raised": snapshot["alerts_raised"],
+            "drift_alerts_active": sum(len(entry["alerts"]) for entry in snapshot["categories"].values()),
+        }
+        for field, value in snapshot["categories"].get(OVERALL, {}).get("jsd", {}).items():
+            metrics[f"drift_jsd_{field}"] = value
+        return metrics
+
+
+def compare_dumps(baseline_path: Path, current_path: Path) -> Dict[str, Dict[str, Tuple[float, int]]]:
+    """``category -> field -> (JSD, rows)`` of a dump against a baseline dump."""
+
+    baseline = dump_distributions(load_json(baseline_path), DRIFT_MIN_BASELINE_ROWS)
+    current_data = load_json(current_path)
+    current = dump_distributions(current_data)
+    rows = {
+        category: sum(1 for item in items if isinstance(item, dict) and isinstance(item.get("response"), dict))
+        for category, items in current_data.items() if isinstance(items, list)
+    }
+    rows[OVERALL] = sum(rows.values())
+    report = {}
+    for category, fields in current.items():
+        reference = baseline.get(category) or baseline[OVERALL]
+        report[category] = {field: (js_divergence(fields[field], reference.get(field, {})), rows.get(category, 0)) for field in FIELDS}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare label distributions of a dump against a baseline dump.")
+    parser.add_argument("--baseline", type=Path, default=Path(DRIFT_BASELINE))
+    parser.add_argument("--current", type=Path, required=True)
+    parser.add_argument("--threshold", type=float, default=DRIFT_JSD_THRESHOLD)
+    parser.add_argument("--min-rows", type=int, default=20, help="Only flag categories with at least this many rows.")
+    args = parser.parse_args()
+
+    report = compare_dumps(args.baseline, args.current)
+    print(f"{'category':<24} {'rows':>5} " + " ".join(f"{field:>9}" for field in FIELDS))
+    for category, fields in sorted(report.items()):
+        rows = next(iter(fields.values()))[1]
+        flagged = rows >= args.min_rows
+        cells = " ".join(f"{value:>8.3f}{'!' if flagged and value > args.threshold else ' '}" for value, _ in fields.values())
+        print(f"{category:<24} {rows:>5} {cells}")
+    print(f"\n! = JSD above {args.threshold} with at least {args.min_rows} rows")
+
+
+if __name__ == "__main__":
+    main()
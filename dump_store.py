@@ -0,0 +1,337 @@
+"""Columnar, deduplicated storage for inference dumps.
+
+The ``data/qwen3_infer_*.json`` files are indent=4 JSON that repeat the full article
+text (``data`` field) for every variant run. This module stores the same rows as:
+
+- a **shared text store**: one append-only blob (``texts.bin``) plus an index of
+  ``sha256 -> (offset, length)``; each distinct article text is written once no matter
+  how many dumps reference it, and reads go through ``mmap``;
+- a **columnar dump** directory per run with one ``.npy`` file per column
+  (``article_id``, ``category``, ``user_need``, ``I1``/``I3``/``I4``, token usage and the
+  text reference), loaded with ``mmap_mode="r"``; rarely used or irregular fields
+  (``url``, ``prompt_variant``, ``usage_by_stage``, unparseable responses, usage dicts
+  with missing or null counts) go to a row-aligned ``extras.json``.
+
+``to_grouped`` converts back to the grouped ``{category: [rows]}`` JSON that
+``evaluate.py`` and ``analyze_responses.py`` read, so the conversion round-trips:
+
+    python dump_store.py to-columnar data/qwen3_infer_2025_qc_selected.json
+    python dump_store.py to-json data/columnar/qwen3_infer_2025_qc_selected --out /tmp/x.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from evaluate import USER_NEED_GROUPS
+
+
+DEFAULT_TEXT_STORE = Path("./data/text_store")
+DEFAULT_COLUMNAR_ROOT = Path("./data/columnar")
+FORMAT_VERSION = 1
+
+USER_NEED_LABELS = tuple(USER_NEED_GROUPS)
+USER_NEED_CODES = {label: code for code, label in enumerate(USER_NEED_LABELS)}
+IMPACT_FIELDS = ("I1", "I3", "I4")
+RESPONSE_FIELDS = ("user_need",) + IMPACT_FIELDS
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+CORE_KEYS = ("article_id", "response", "data", "url")
+NO_TEXT = -1
+MISSING = -1
+
+
+class TextStore:
+    """Content-addressed, append-only store of article texts."""
+
+    def __init__(self, root: Path = DEFAULT_TEXT_STORE) -> None:
+        self.root = Path(root)
+        self.blob_path = self.root / "texts.bin"
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+        if self.index_path.exists():
+            with self.index_path.open(encoding="utf-8") as f:
+                self._index = {digest: (entry[0], entry[1]) for digest, entry in json.load(f).items()}
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def put(self, text: str) -> Tuple[str, int, int]:
+        """Store ``text`` once; return ``(digest, offset, length)``."""
+
+        digest = self.digest(text)
+        with self._lock:
+            if digest in self._index:
+                offset, length = self._index[digest]
+                return digest, offset, length
+            encoded = text.encode("utf-8")
+            self.root.mkdir(parents=True, exist_ok=True)
+            with self.blob_path.open("ab") as blob:
+                offset = blob.tell()
+                blob.write(encoded)
+            self._index[digest] = (offset, len(encoded))
+            return digest, offset, len(encoded)
+
+    def flush(self) -> None:
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(".json.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({digest: list(entry) for digest, entry in self._index.items()}, f)
+            os.replace(tmp, self.index_path)
+
+    def get(self, offset: int, length: int) -> str:
+        if not length:
+            # The blob may still be empty, and an empty file cannot be mapped.
+            return ""
+        end = offset + length
+        with self._lock:
+            if self._mmap is None or end > self._mapped_size:
+                if self._mmap is not None:
+                    self._mmap.close()
+                with self.blob_path.open("rb") as blob:
+                    self._mmap = mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mapped_size = len(self._mmap)
+            return self._mmap[offset:end].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def _encode_response(response: Any) -> Optional[Tuple[int, int, int, int]]:
+    """Column codes for a regular response, or ``None`` if it must be kept verbatim."""
+
+    if not isinstance(response, dict) or set(response) - set(RESPONSE_FIELDS):
+        return None
+    if list(response) != [field for field in RESPONSE_FIELDS if field in response]:
+        return None
+    need = response.get("user_need")
+    need_code = MISSING if need is None else USER_NEED_CODES.get(need)
+    if need_code is None:
+        return None
+    impacts = []
+    for field in IMPACT_FIELDS:
+        value = response.get(field)
+        if value is None:
+            impacts.append(MISSING)
+        elif isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 100:
+            impacts.append(value)
+        else:
+            return None
+    return (need_code, *impacts)
+
+
+def _encode_usage(usage: Any) -> Optional[Tuple[int, ...]]:
+    """Column values for a complete usage dict, or ``None`` if it must be kept verbatim."""
+
+    if not isinstance(usage, dict) or list(usage) != list(USAGE_FIELDS):
+        return None
+    values = tuple(usage.values())
+    if not all(isinstance(value, int) and not isinstance(value, bool) and value >= 0 for value in values):
+        return None
+    return values
+
+
+def write_columnar(dataset: Mapping[str, Any], out_dir: Path, text_store: TextStore) -> Dict[str, Any]:
+    """Write a grouped dump as columns under ``out_dir``; texts go to ``text_store``."""
+
+    categories: List[str] = []
+    columns: Dict[str, List[int]] = {name: [] for name in ("article_id", "category", "text_offset", "text_length", *RESPONSE_FIELDS, *USAGE_FIELDS)}
+    extras: List[Optional[Dict[str, Any]]] = []
+
+    for category, items in dataset.items():
+        if not isinstance(items, list):
+            continue
+        category_code = len(categories)
+        categories.append(category)
+        for item in items:
+            extra: Dict[str, Any] = {key: value for key, value in item.items() if key not in CORE_KEYS and key != "usage"}
+            columns["article_id"].append(int(item["article_id"]))
+            columns["category"].append(category_code)
+
+            text = item.get("data")
+            if isinstance(text, str):
+                _, offset, length = text_store.put(text)
+            else:
+                offset, length = NO_TEXT, 0
+                if "data" in item:
+                    extra["data"] = text
+            columns["text_offset"].append(offset)
+            columns["text_length"].append(length)
+
+            codes = _encode_response(item.get("response")) if "response" in item else None
+            if codes is None:
+                codes = (MISSING,) * len(RESPONSE_FIELDS)
+                if "response" in item:
+                    extra["response"] = item["response"]
+                else:
+                    extra["_no_response"] = True
+            for field, code in zip(RESPONSE_FIELDS, codes):
+                columns[field].append(code)
+
+            usage_codes = _encode_usage(item.get("usage"))
+            for field, code in zip(USAGE_FIELDS, usage_codes or (MISSING,) * len(USAGE_FIELDS)):
+                columns[field].append(code)
+            if usage_codes is None and "usage" in item:
+                extra["usage"] = item["usage"]
+
+            if "url" in item:
+                extra["url"] = item["url"]
+            else:
+                extra["_no_url"] = True
+            extras.append(extra or None)
+
+    dtypes = {"article_id": np.int64, "category": np.int32, "text_offset": np.int64, "text_length": np.int64, "user_need": np.int8}
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, values in columns.items():
+        dtype = dtypes.get(name, np.int8 if name in IMPACT_FIELDS else np.int64)
+        np.save(out_dir / f"{name}.npy", np.array(values, dtype=dtype))
+    with (out_dir / "extras.json").open("w", encoding="utf-8") as f:
+        json.dump(extras, f, ensure_ascii=False)
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "rows": len(extras),
+        "categories": categories,
+        "user_need_labels": list(USER_NEED_LABELS),
+        "text_store": os.path.relpath(text_store.root.resolve(), out_dir.resolve()),
+    }
+    with (out_dir / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    text_store.flush()
+    return meta
+
+
+class ColumnarDump:
+    """Memory-mapped view of a columnar dump."""
+
+    def __init__(self, path: Path, text_store: Optional[TextStore] = None) -> None:
+        self.path = Path(path)
+        with (self.path / "meta.json").open(encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar format version: {self.meta.get('format_version')!r}")
+        self.categories: List[str] = self.meta["categories"]
+        self.text_store = text_store or TextStore((self.path / self.meta["text_store"]).resolve())
+        self._extras: Optional[List[Optional[Dict[str, Any]]]] = None
+
+    def column(self, name: str) -> np.ndarray:
+        return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+    @property
+    def extras(self) -> List[Optional[Dict[str, Any]]]:
+        if self._extras is None:
+            with (self.path / "extras.json").open(encoding="utf-8") as f:
+                self._extras = json.load(f)
+        return self._extras
+
+    def __len__(self) -> int:
+        return int(self.meta["rows"])
+
+    def text(self, row: int) -> Optional[str]:
+        offset = int(self.column("text_offset")[row])
+        if offset == NO_TEXT:
+            return None
+        return self.text_store.get(offset, int(self.column("text_length")[row]))
+
+    def to_grouped(self, include_text: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """Rebuild the grouped JSON (``{category: [rows]}``) used by ``evaluate.py``."""
+
+        ids = self.column("article_id").tolist()
+        category_codes = self.column("category").tolist()
+        offsets = self.column("text_offset").tolist()
+        lengths = self.column("text_length").tolist()
+        responses = {field: self.column(field).tolist() for field in RESPONSE_FIELDS}
+        usages = {field: self.column(field).tolist() for field in USAGE_FIELDS}
+
+        grouped: Dict[str, List[Dict[str, Any]]] = {category: [] for category in self.categories}
+        for row, extra in enumerate(self.extras):
+            extra = dict(extra or {})
+            item: Dict[str, Any] = {"article_id": ids[row]}
+
+            if not extra.pop("_no_response", False):
+                if "response" in extra:
+                    item["response"] = extra.pop("response")
+                else:
+                    response: Dict[str, Any] = {}
+                    if responses["user_need"][row] != MISSING:
+                        response["user_need"] = USER_NEED_LABELS[responses["user_need"][row]]
+                    for field in IMPACT_FIELDS:
+                        if responses[field][row] != MISSING:
+                            response[field] = responses[field][row]
+                    item["response"] = response
+
+            if offsets[row] != NO_TEXT:
+                if include_text:
+                    item["data"] = self.text_store.get(offsets[row], lengths[row])
+            elif "data" in extra:
+                item["data"] = extra.pop("data")
+
+            if not extra.pop("_no_url", False):
+                item["url"] = extra.pop("url", None)
+            if usages["total_tokens"][row] != MISSING:
+                item["usage"] = {field: usages[field][row] for field in USAGE_FIELDS}
+            elif "usage" in extra:
+                item["usage"] = extra.pop("usage")
+            item.update(extra)
+            grouped[self.categories[category_codes[row]]].append(item)
+        return grouped
+
+
+def load_predictions(path: Path) -> Dict[str, Any]:
+    """Load grouped predictions from a JSON file or a columnar dump directory."""
+
+    if Path(path).is_dir():
+        return ColumnarDump(path).to_grouped(include_text=False)
+    with Path(path).open(encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Convert inference dumps between grouped JSON and the columnar format.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    to_cols = sub.add_parser("to-columnar", help="Convert grouped JSON dumps to columnar directories.")
+    to_cols.add_argument("inputs", type=Path, nargs="+", help="Grouped JSON dumps.")
+    to_cols.add_argument("--root", type=Path, default=DEFAULT_COLUMNAR_ROOT, help="Directory receiving one columnar dump per input.")
+    to_cols.add_argument("--text-store", type=Path, default=DEFAULT_TEXT_STORE, help="Shared text store directory.")
+
+    to_json = sub.add_parser("to-json", help="Convert a columnar dump back to grouped JSON.")
+    to_json.add_argument("input", type=Path, help="Columnar dump directory.")
+    to_json.add_argument("--out", type=Path, required=True, help="Output JSON path.")
+    to_json.add_argument("--no-text", action="store_true", help="Omit article text (data field).")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    if args.command == "to-columnar":
+        store = TextStore(args.text_store)
+        for path in args.inputs:
+            with path.open(encoding="utf-8") as f:
+                dataset = json.load(f)
+            before = len(store)
+            meta = write_columnar(dataset, args.root / path.stem, store)
+            print(f"{path} -> {args.root / path.stem}: {meta['rows']} rows, {len(store) - before} new texts ({len(store)} stored)")
+    else:
+        grouped = ColumnarDump(args.input).to_grouped(include_text=not args.no_text)
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        with args.out.open("w", encoding="utf-8") as f:
+            json.dump(grouped, f, ensure_ascii=False, indent=4)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -216,6 +216,25 @@ def evaluate_dataset(model_dataset: Mapping[str, Any], gt_datasets: Union[Iterab
     return {"summary": summary, "results": results}
 
 
+def repair_predictions(dataset: MutableMapping[str, Any]) -> int:
+    """Normalize prediction labels/levels in place (see ``output_parser``); return rows changed."""
+
+    from output_parser import normalize_response
+
+    repaired = 0
+    for items in dataset.values():
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get("response"), dict):
+                continue
+            repairs: List[str] = []
+            item["response"] = normalize_response(item["response"], repairs)
+            if repairs:
+                repaired += 1
+    return repaired
+
+
 def format_score(value: float, maximum: float) -> str:
     percent = (value / maximum * 100) if maximum else 0.0
     return f"{value:.3f} / {maximum:g} | {percent:.0f}%"
@@ -246,7 +265,7 @@ def parse_args() -> argparse.Namespace:
         "--predictions",
         type=Path,
         default=Path("./data/qwen3_infer_2025_qc_selected.json"),
-        help="Path to the model prediction JSON file.",
+        help="Path to the model prediction JSON file or a columnar dump directory (dump_store.py).",
     )
     parser.add_argument(
         "--ground-truths",
@@ -261,16 +280,39 @@ def parse_args() -> argparse.Namespace:
         type=Path,
         help="Optional path to write detailed per-article scores as JSON.",
     )
+    parser.add_argument(
+        "--engine",
+        choices=("python", "numpy"),
+        default="python",
+        help="Scoring engine; numpy uses the vectorized engine in evaluate_vectorized.py.",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Normalize prediction labels and snap impact values to allowed levels before scoring.",
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
 
-    model_dataset = load_json(args.predictions)
+    if args.predictions.is_dir():
+        from dump_store import load_predictions
+
+        model_dataset = load_predictions(args.predictions)
+    else:
+        model_dataset = load_json(args.predictions)
     gt_datasets = [load_json(path) for path in args.ground_truths]
+    if args.repair:
+        print(f"Repaired prediction rows: {repair_predictions(model_dataset)}")
 
-    evaluation = evaluate_dataset(model_dataset, gt_datasets)
+    if args.engine == "numpy":
+        from evaluate_vectorized import evaluate_dataset_vectorized
+
+        evaluation = evaluate_dataset_vectorized(model_dataset, gt_datasets)
+    else:
+        evaluation = evaluate_dataset(model_dataset, gt_datasets)
     print_summary(evaluation)
 
     if args.save:
@@ -0,0 +1,186 @@
+"""Bootstrap confidence intervals and paired significance tests for prediction files.
+
+``print_summary`` only reports point averages, so a 2% gain between
+``qwen3_infer_2025_qc_selected.json`` and ``..._seperated_prompt.json`` could be noise.
+This module adds:
+
+- percentile bootstrap CIs for every averaged score of one prediction file;
+- for two files, a paired bootstrap CI of the per-article score difference and a
+  sign-flip permutation test (p-value), over the articles both files scored.
+
+Resampling is vectorized: each chunk of resamples is a ``(chunk, N)`` matrix of
+multinomial counts (or random signs), and all metric means come out of a single matrix
+product with the ``(N, metrics)`` score matrix. 10,000 resamples over thousands of
+articles take a few seconds.
+
+    python evaluate_bootstrap.py --predictions data/a.json --compare data/b.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from evaluate import DEFAULT_GROUND_TRUTHS, load_json
+from evaluate_vectorized import SCORE_KEYS, score_arrays
+
+
+CHUNK = 500
+
+
+def score_matrix(model_dataset: Mapping[str, Any], gt_datasets: Sequence[Mapping[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return article ids ``(N,)`` and per-article scores ``(N, len(SCORE_KEYS))``."""
+
+    scored = score_arrays(model_dataset, gt_datasets)
+    matrix = np.column_stack([scored["scores"][key].astype(np.float64) for key in SCORE_KEYS])
+    return scored["article_ids"], matrix
+
+
+def bootstrap_means(scores: np.ndarray, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """``(resamples, metrics)`` means of ``scores`` rows resampled with replacement."""
+
+    n = scores.shape[0]
+    probabilities = np.full(n, 1.0 / n)
+    out = np.empty((resamples, scores.shape[1]))
+    for start in range(0, resamples, CHUNK):
+        stop = min(start + CHUNK, resamples)
+        counts = rng.multinomial(n, probabilities, size=stop - start)
+        out[start:stop] = counts @ scores / n
+    return out
+
+
+def sign_flip_means(diffs: np.ndarray, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """``(resamples, metrics)`` means of ``diffs`` under random per-article sign flips."""
+
+    n = diffs.shape[0]
+    out = np.empty((resamples, diffs.shape[1]))
+    for start in range(0, resamples, CHUNK):
+        stop = min(start + CHUNK, resamples)
+        signs = rng.integers(0, 2, size=(stop - start, n), dtype=np.int8) * 2 - 1
+        out[start:stop] = signs @ diffs / n
+    return out
+
+
+def percentile_interval(samples: np.ndarray, alpha: float) -> Tuple[np.ndarray, np.ndarray]:
+    lower, upper = np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+    return lower, upper
+
+
+def confidence_intervals(scores: np.ndarray, resamples: int = 10_000, alpha: float = 0.05, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    if scores.shape[0] == 0:
+        raise ValueError("No evaluated articles to bootstrap.")
+    rng = np.random.default_rng(seed)
+    means = bootstrap_means(scores, resamples, rng)
+    lower, upper = percentile_interval(means, alpha)
+    point = scores.mean(axis=0)
+    return {
+        key: {"mean": float(point[idx]), "ci_low": float(lower[idx]), "ci_high": float(upper[idx])}
+        for idx, key in enumerate(SCORE_KEYS)
+    }
+
+
+def paired_comparison(
+    ids_a: np.ndarray,
+    scores_a: np.ndarray,
+    ids_b: np.ndarray,
+    scores_b: np.ndarray,
+    resamples: int = 10_000,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Compare A - B on the articles both files scored."""
+
+    common, pos_a, pos_b = np.intersect1d(ids_a, ids_b, assume_unique=True, return_indices=True)
+    if common.size == 0:
+        raise ValueError("The two prediction files share no evaluated articles.")
+    diffs = scores_a[pos_a] - scores_b[pos_b]
+    observed = diffs.mean(axis=0)
+
+    rng = np.random.default_rng(seed)
+    boot = bootstrap_means(diffs, resamples, rng)
+    lower, upper = percentile_interval(boot, alpha)
+    flipped = sign_flip_means(diffs, resamples, rng)
+    # +1 smoothing keeps p > 0 with a finite number of permutations.
+    exceed = (np.abs(flipped) >= np.abs(observed) - 1e-12).sum(axis=0)
+    p_values = (exceed + 1) / (resamples + 1)
+
+    return {
+        "paired_articles": int(common.size),
+        "metrics": {
+            key: {
+                "mean_a": float(scores_a[pos_a, idx].mean()),
+                "mean_b": float(scores_b[pos_b, idx].mean()),
+                "diff": float(observed[idx]),
+                "ci_low": float(lower[idx]),
+                "ci_high": float(upper[idx]),
+                "p_value": float(p_values[idx]),
+            }
+            for idx, key in enumerate(SCORE_KEYS)
+        },
+    }
+
+
+def print_intervals(name: str, intervals: Mapping[str, Mapping[str, float]], alpha: float) -> None:
+    print(f"{name} ({(1 - alpha) * 100:.0f}% bootstrap CI):")
+    for key, stats in intervals.items():
+        print(f"  {key:<15}: {stats['mean']:.3f} [{stats['ci_low']:.3f}, {stats['ci_high']:.3f}]")
+
+
+def print_comparison(comparison: Mapping[str, Any], alpha: float) -> None:
+    print(f"\nPaired comparison A - B over {comparison['paired_articles']} articles:")
+    for key, stats in comparison["metrics"].items():
+        flag = " *" if stats["p_value"] < alpha else ""
+        print(
+            f"  {key:<15}: {stats['mean_a']:.3f} vs {stats['mean_b']:.3f} | diff {stats['diff']:+.3f} "
+            f"[{stats['ci_low']:+.3f}, {stats['ci_high']:+.3f}] p={stats['p_value']:.4f}{flag}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals and paired tests for prediction files.")
+    parser.add_argument("--predictions", type=Path, default=Path("./data/qwen3_infer_2025_qc_selected.json"), help="Prediction file A.")
+    parser.add_argument("--compare", type=Path, help="Optional prediction file B for a paired comparison.")
+    parser.add_argument(
+        "--ground-truths",
+        dest="ground_truths",
+        type=Path,
+        nargs="+",
+        default=list(DEFAULT_GROUND_TRUTHS),
+        help="Ground truth JSON files.",
+    )
+    parser.add_argument("--resamples", type=int, default=10_000, help="Number of bootstrap resamples / permutations.")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level (CI width is 1 - alpha).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--save", type=Path, help="Optional path to write the intervals and comparison as JSON.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    gt_datasets = [load_json(path) for path in args.ground_truths]
+
+    ids_a, scores_a = score_matrix(load_json(args.predictions), gt_datasets)
+    report: Dict[str, Any] = {"a": {"path": str(args.predictions), "intervals": confidence_intervals(scores_a, args.resamples, args.alpha, args.seed)}}
+    print_intervals(f"A: {args.predictions}", report["a"]["intervals"], args.alpha)
+
+    if args.compare:
+        ids_b, scores_b = score_matrix(load_json(args.compare), gt_datasets)
+        report["b"] = {"path": str(args.compare), "intervals": confidence_intervals(scores_b, args.resamples, args.alpha, args.seed)}
+        print()
+        print_intervals(f"B: {args.compare}", report["b"]["intervals"], args.alpha)
+        report["comparison"] = paired_comparison(ids_a, scores_a, ids_b, scores_b, args.resamples, args.alpha, args.seed)
+        print_comparison(report["comparison"], args.alpha)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with args.save.open("w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
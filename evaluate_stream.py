@@ -0,0 +1,313 @@
+"""Streaming evaluation of large prediction dumps in constant memory.
+
+``evaluate.py`` loads the whole prediction file (indent=4 JSON with full article text)
+and then builds a second flattened index of it. For multi-GB backfill dumps this module
+instead:
+
+- reads predictions incrementally, either JSONL (one ``{"article_id", "response",
+  "category"?}`` object per line) or the existing grouped ``{category: [rows]}`` JSON,
+  which is parsed item by item with ``json.JSONDecoder.raw_decode`` over a sliding buffer;
+- looks ground truth up in an index built once from the (small) annotation files, which
+  can be saved with ``--save-gt-index`` and reused with ``--gt-index``;
+- scores rows in fixed-size batches with the vectorized engine and keeps only running
+  totals, so memory is bounded by the ground truth size and the batch size.
+
+Only prediction IDs that appear in the ground truth are remembered (for duplicate and
+missing detection); IDs without ground truth are counted and sampled, not stored.
+
+    python evaluate_stream.py --predictions backfill.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, TextIO, Tuple
+
+from evaluate import DEFAULT_GROUND_TRUTHS, flatten_articles, load_json, print_summary
+from evaluate_vectorized import (
+    IMPACT_METRICS,
+    IMPACT_VALUES,
+    SCORE_KEYS,
+    USER_NEED_LABELS,
+    encode_ground_truth,
+    encode_responses,
+    score_encoded,
+)
+
+
+CHUNK_SIZE = 1 << 20
+MISSING_SAMPLE_SIZE = 1000
+WHITESPACE = " \t\n\r"
+
+Row = Tuple[int, Optional[str], Mapping[str, Any]]
+
+
+class GroupedJSONReader:
+    """Incrementally yield ``(category, item)`` pairs from a ``{category: [items]}`` file."""
+
+    def __init__(self, stream: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so the buffer stays around one chunk plus one item.
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input.")
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {self.buf[self.pos]!r}.")
+        self.pos += 1
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value straddles the chunk boundary.
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buf) and not self.eof and not isinstance(value, (dict, list, str)):
+                if self._fill():
+                    continue
+            self.pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            category = self._value()
+            self._expect(":")
+            if self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield category, self._value()
+                        if self._peek() == ",":
+                            self.pos += 1
+                            continue
+                        self._expect("]")
+                        break
+            else:
+                self._value()
+            if self._peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+def iter_grouped_predictions(stream: TextIO) -> Iterator[Row]:
+    for category, item in GroupedJSONReader(stream):
+        if isinstance(item, dict) and "article_id" in item and "response" in item:
+            yield int(item["article_id"]), category, item["response"]
+
+
+def iter_jsonl_predictions(stream: TextIO) -> Iterator[Row]:
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as exc:
+            raise ValueError(f"Invalid JSON on line {line_no}: {exc}") from exc
+        if isinstance(item, dict) and "article_id" in item and "response" in item:
+            yield int(item["article_id"]), item.get("category"), item["response"]
+
+
+def iter_predictions(path: Path, fmt: str = "auto") -> Iterator[Row]:
+    if fmt == "auto":
+        fmt = "jsonl" if path.suffix in (".jsonl", ".ndjson") else "grouped"
+    with path.open(encoding="utf-8") as stream:
+        if fmt == "jsonl":
+            yield from iter_jsonl_predictions(stream)
+        else:
+            yield from iter_grouped_predictions(stream)
+
+
+def build_gt_index(gt_datasets: Sequence[Mapping[str, Any]]) -> List[Dict[int, Dict[str, Any]]]:
+    """One ``article_id -> {"category", "response"}`` map per annotator."""
+
+    return [
+        {article_id: {"category": entry["category"], "response": entry["response"]} for article_id, entry in flatten_articles(gt).items()}
+        for gt in gt_datasets
+    ]
+
+
+def save_gt_index(gt_indices: Sequence[Mapping[int, Mapping[str, Any]]], path: Path) -> None:
+    payload = [{str(article_id): entry for article_id, entry in index.items()} for index in gt_indices]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+
+def load_gt_index(path: Path) -> List[Dict[int, Dict[str, Any]]]:
+    with path.open(encoding="utf-8") as f:
+        payload = json.load(f)
+    return [{int(article_id): entry for article_id, entry in index.items()} for index in payload]
+
+
+class StreamingEvaluator:
+    """Running totals over batches of prediction rows."""
+
+    def __init__(
+        self,
+        gt_indices: Sequence[Mapping[int, Mapping[str, Any]]],
+        batch_size: int = 10_000,
+        results_out: Optional[TextIO] = None,
+    ) -> None:
+        if not gt_indices:
+            raise ValueError("At least one ground truth dataset is required.")
+        self.gt_indices = gt_indices
+        self.gt_ids = set()
+        for index in gt_indices:
+            self.gt_ids.update(index)
+        self.batch_size = batch_size
+        self.results_out = results_out
+
+        self.totals = {key: 0.0 for key in SCORE_KEYS}
+        self.count = 0
+        self.seen: set = set()
+        self.missing_in_gt_count = 0
+        self.missing_in_gt_sample: List[int] = []
+        self._batch: List[Row] = []
+
+    def update(self, article_id: int, category: Optional[str], response: Mapping[str, Any]) -> None:
+        if article_id not in self.gt_ids:
+            self.missing_in_gt_count += 1
+            if len(self.missing_in_gt_sample) < MISSING_SAMPLE_SIZE:
+                self.missing_in_gt_sample.append(article_id)
+            return
+        if article_id in self.seen:
+            raise ValueError(f"Duplicate article_id detected: {article_id}")
+        self.seen.add(article_id)
+        self._batch.append((article_id, category, response))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        ids = [article_id for article_id, _, _ in self._batch]
+        model = encode_responses([response for _, _, response in self._batch])
+        gt = encode_ground_truth(ids, self.gt_indices)
+        scores = score_encoded(model, gt)
+        for key in SCORE_KEYS:
+            self.totals[key] += float(scores[key].sum())
+        self.count += len(ids)
+
+        if self.results_out is not None:
+            columns = {key: scores[key].tolist() for key in SCORE_KEYS}
+            for pos, (article_id, category, response) in enumerate(self._batch):
+                record = {
+                    "article_id": article_id,
+                    "category": category,
+                    "model_response": response,
+                    "ground_truth": {
+                        "user_need": USER_NEED_LABELS[int(scores["gt_user_need"][pos])],
+                        **{metric: int(IMPACT_VALUES[scores[f"gt_{metric}"][pos]]) for metric in IMPACT_METRICS},
+                    },
+                    **{key: columns[key][pos] for key in SCORE_KEYS},
+                }
+                self.results_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._batch = []
+
+    def summary(self) -> Dict[str, Any]:
+        self.flush()
+        averages = {key: (self.totals[key] / self.count) if self.count else 0.0 for key in SCORE_KEYS}
+        return {
+            "evaluated": self.count,
+            "missing_in_predictions": sorted(self.gt_ids - self.seen),
+            "missing_in_ground_truth": sorted(self.missing_in_gt_sample),
+            "missing_in_ground_truth_count": self.missing_in_gt_count,
+            "averages": averages,
+            "totals": dict(self.totals),
+        }
+
+
+def evaluate_stream(
+    predictions: Path,
+    gt_indices: Sequence[Mapping[int, Mapping[str, Any]]],
+    fmt: str = "auto",
+    batch_size: int = 10_000,
+    results_out: Optional[TextIO] = None,
+) -> Dict[str, Any]:
+    evaluator = StreamingEvaluator(gt_indices, batch_size=batch_size, results_out=results_out)
+    for article_id, category, response in iter_predictions(predictions, fmt):
+        evaluator.update(article_id, category, response)
+    return {"summary": evaluator.summary(), "results": []}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Evaluate large prediction files incrementally in constant memory.")
+    parser.add_argument("--predictions", type=Path, required=True, help="Prediction file (.jsonl or grouped JSON).")
+    parser.add_argument("--format", choices=("auto", "jsonl", "grouped"), default="auto", help="Prediction file format (auto: by extension).")
+    parser.add_argument(
+        "--ground-truths",
+        dest="ground_truths",
+        type=Path,
+        nargs="+",
+        default=list(DEFAULT_GROUND_TRUTHS),
+        help="Ground truth JSON files (ignored when --gt-index is given).",
+    )
+    parser.add_argument("--gt-index", type=Path, help="Prebuilt ground truth index from --save-gt-index.")
+    parser.add_argument("--save-gt-index", type=Path, help="Write the ground truth index for reuse and continue.")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows scored per vectorized batch.")
+    parser.add_argument("--save-results", type=Path, help="Optional JSONL path for per-article scores (streamed).")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    if args.gt_index:
+        gt_indices = load_gt_index(args.gt_index)
+    else:
+        gt_indices = build_gt_index([load_json(path) for path in args.ground_truths])
+    if args.save_gt_index:
+        save_gt_index(gt_indices, args.save_gt_index)
+
+    if args.save_results:
+        args.save_results.parent.mkdir(parents=True, exist_ok=True)
+        with args.save_results.open("w", encoding="utf-8") as out:
+            evaluation = evaluate_stream(args.predictions, gt_indices, args.format, args.batch_size, out)
+    else:
+        evaluation = evaluate_stream(args.predictions, gt_indices, args.format, args.batch_size)
+
+    print_summary(evaluation)
+    if evaluation["summary"]["missing_in_ground_truth_count"] > MISSING_SAMPLE_SIZE:
+        print(f"(showing {MISSING_SAMPLE_SIZE} of {evaluation['summary']['missing_in_ground_truth_count']} IDs without ground truth)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Vectorized (NumPy) engine for ``evaluate.evaluate_dataset``.
+
+User-need labels and impact levels are encoded as small integer arrays once, and every
+rubric score is a lookup into a precomputed table:
+
+- ``NEED_SCORE[model, gt]``: 2 exact, 1 same Smartocto group, 0 otherwise
+- ``IMPACT_SCORE[model, gt]``: 2 exact, 1 adjacent level, 0 otherwise
+
+Ground truth from A annotators is stacked into ``(A, N)`` arrays (``-1`` where an
+annotator did not label the article), so best-over-annotators is a masked ``max`` over
+axis 0 for all articles at once. Ties resolve to the first annotator, exactly like the
+loop in ``evaluate_response``, and the returned ``summary``/``results`` structure is the
+same as ``evaluate.evaluate_dataset``.
+
+Benchmark against the pure-Python engine with ``python evaluate_vectorized.py``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+from evaluate import (
+    IMPACT_INDEX,
+    IMPACT_LEVELS,
+    USER_NEED_GROUPS,
+    evaluate_dataset,
+    flatten_articles,
+)
+
+
+MISSING = -1
+
+USER_NEED_LABELS: Tuple[str, ...] = tuple(USER_NEED_GROUPS)
+USER_NEED_CODES = {label: code for code, label in enumerate(USER_NEED_LABELS)}
+GROUP_LABELS: Tuple[str, ...] = tuple(dict.fromkeys(USER_NEED_GROUPS.values()))
+NEED_TO_GROUP = np.array([GROUP_LABELS.index(USER_NEED_GROUPS[label]) for label in USER_NEED_LABELS], dtype=np.int8)
+IMPACT_METRICS = ("I1", "I3", "I4")
+
+NEED_SCORE = np.where(
+    np.eye(len(USER_NEED_LABELS), dtype=bool),
+    2,
+    (NEED_TO_GROUP[:, None] == NEED_TO_GROUP[None, :]).astype(np.int8),
+).astype(np.int8)
+_impact_distance = np.abs(np.arange(len(IMPACT_LEVELS))[:, None] - np.arange(len(IMPACT_LEVELS))[None, :])
+IMPACT_SCORE = np.select([_impact_distance == 0, _impact_distance == 1], [2, 1], 0).astype(np.int8)
+IMPACT_VALUES = np.array(IMPACT_LEVELS, dtype=np.int16)
+IMPACT_LOOKUP = np.full(max(IMPACT_LEVELS) + 1, MISSING, dtype=np.int8)
+IMPACT_LOOKUP[list(IMPACT_INDEX)] = list(IMPACT_INDEX.values())
+
+SCORE_KEYS = ("score_userneed", "score_I1", "score_I3", "score_I4", "score_emotion", "final_score")
+
+
+def encode_user_need(values: Iterable[Any]) -> np.ndarray:
+    try:
+        return np.fromiter((USER_NEED_CODES[value] for value in values), dtype=np.int8)
+    except KeyError as exc:
+        raise ValueError(f"Unknown user need label: {exc.args[0]!r}") from exc
+
+
+def encode_impact(values: Iterable[Any]) -> np.ndarray:
+    values = list(values)
+    try:
+        raw = np.fromiter(values, dtype=np.int64, count=len(values))
+    except (TypeError, ValueError):
+        # Levels stored as strings ("5") in some dumps.
+        raw = np.fromiter((int(value) for value in values), dtype=np.int64, count=len(values))
+    valid = (raw >= 0) & (raw < len(IMPACT_LOOKUP))
+    codes = np.full(raw.shape, MISSING, dtype=np.int8)
+    codes[valid] = IMPACT_LOOKUP[raw[valid]]
+    if (codes == MISSING).any():
+        raise ValueError(f"Invalid impact value: {values[int(np.argmax(codes == MISSING))]!r}")
+    return codes
+
+
+def encode_responses(responses: Sequence[Mapping[str, Any]]) -> Dict[str, np.ndarray]:
+    """Encode a list of response dicts into ``{"user_need": codes, "I1": idx, ...}``."""
+
+    encoded = {"user_need": encode_user_need(resp["user_need"] for resp in responses)}
+    for metric in IMPACT_METRICS:
+        encoded[metric] = encode_impact(resp[metric] for resp in responses)
+    return encoded
+
+
+def encode_ground_truth(article_ids: Sequence[int], gt_indices: Sequence[Mapping[int, Mapping[str, Any]]]) -> Dict[str, np.ndarray]:
+    """Stack annotators into ``(A, N)`` code arrays, ``MISSING`` where an article is unlabeled."""
+
+    fields = ("user_need",) + IMPACT_METRICS
+    stacked = {field: np.full((len(gt_indices), len(article_ids)), MISSING, dtype=np.int8) for field in fields}
+    for row, index in enumerate(gt_indices):
+        positions = [pos for pos, article_id in enumerate(article_ids) if article_id in index]
+        if not positions:
+            continue
+        responses = [index[article_ids[pos]]["response"] for pos in positions]
+        encoded = encode_responses(responses)
+        for field in fields:
+            stacked[field][row, positions] = encoded[field]
+    return stacked
+
+
+def best_over_annotators(table: np.ndarray, model: np.ndarray, gt: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (best score, code of the first annotator achieving it) per article."""
+
+    scores = table[model[None, :], np.where(gt == MISSING, 0, gt)].astype(np.int8)
+    scores[gt == MISSING] = -1
+    winner = scores.argmax(axis=0)
+    columns = np.arange(gt.shape[1])
+    return scores[winner, columns], gt[winner, columns]
+
+
+def score_encoded(model: Mapping[str, np.ndarray], gt: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Per-article rubric scores plus the resolved ground-truth codes."""
+
+    if gt["user_need"].shape[1] and (gt["user_need"] == MISSING).all(axis=0).any():
+        raise ValueError("No ground truth responses provided for evaluation.")
+
+    need_score, need_gt = best_over_annotators(NEED_SCORE, model["user_need"], gt["user_need"])
+    out: Dict[str, np.ndarray] = {"score_userneed": need_score, "gt_user_need": need_gt}
+    for metric in IMPACT_METRICS:
+        score, resolved = best_over_annotators(IMPACT_SCORE, model[metric], gt[metric])
+        out[f"score_{metric}"] = score
+        out[f"gt_{metric}"] = resolved
+
+    emotion_points = out["score_I1"].astype(np.int16) + out["score_I3"] + out["score_I4"]
+    out["score_emotion"] = emotion_points / 6
+    out["final_score"] = out["score_userneed"] + out["score_emotion"]
+    return out
+
+
+def align(model_dataset: Mapping[str, Any], gt_sources: Sequence[Mapping[str, Any]]):
+    model_index = flatten_articles(model_dataset)
+    gt_indices = [flatten_articles(gt) for gt in gt_sources]
+
+    gt_union_ids = set()
+    for index in gt_indices:
+        gt_union_ids.update(index.keys())
+
+    common_ids = sorted(set(model_index).intersection(gt_union_ids))
+    missing_in_model = sorted(gt_union_ids - set(model_index))
+    missing_in_gt = sorted(set(model_index) - gt_union_ids)
+    return model_index, gt_indices, common_ids, missing_in_model, missing_in_gt
+
+
+def score_arrays(model_dataset: Mapping[str, Any], gt_datasets: Union[Iterable[Mapping[str, Any]], Mapping[str, Any]]) -> Dict[str, Any]:
+    """Align and score, returning per-article arrays (used by the bootstrap tools too)."""
+
+    gt_sources = [gt_datasets] if isinstance(gt_datasets, Mapping) else list(gt_datasets)
+    if not gt_sources:
+        raise ValueError("At least one ground truth dataset is required.")
+
+    model_index, gt_indices, common_ids, missing_in_model, missing_in_gt = align(model_dataset, gt_sources)
+    model = encode_responses([model_index[article_id]["response"] for article_id in common_ids])
+    gt = encode_ground_truth(common_ids, gt_indices)
+    scores = score_encoded(model, gt)
+
+    return {
+        "article_ids": np.array(common_ids, dtype=np.int64),
+        "categories": [model_index[article_id]["category"] for article_id in common_ids],
+        "scores": scores,
+        "model_index": model_index,
+        "gt_indices": gt_indices,
+        "missing_in_predictions": missing_in_model,
+        "missing_in_ground_truth": missing_in_gt,
+    }
+
+
+def evaluate_dataset_vectorized(
+    model_dataset: Mapping[str, Any],
+    gt_datasets: Union[Iterable[Mapping[str, Any]], Mapping[str, Any]],
+    include_results: bool = True,
+) -> Dict[str, Any]:
+    """Drop-in replacement for ``evaluate.evaluate_dataset``.
+
+    ``include_results=False`` skips building the per-article result dicts, which
+    dominates the run time once the scoring itself is vectorized.
+    """
+
+    scored = score_arrays(model_dataset, gt_datasets)
+    scores = scored["scores"]
+    count = len(scored["article_ids"])
+
+    totals = {key: float(scores[key].sum()) for key in SCORE_KEYS}
+    averages = {key: (totals[key] / count) if count else 0.0 for key in SCORE_KEYS}
+    summary = {
+        "evaluated": count,
+        "missing_in_predictions": scored["missing_in_predictions"],
+        "missing_in_ground_truth": scored["missing_in_ground_truth"],
+        "averages": averages,
+        "totals": totals,
+    }
+    if not include_results:
+        return {"summary": summary, "results": []}
+
+    model_index = scored["model_index"]
+    gt_indices = scored["gt_indices"]
+    columns = {key: scores[key].tolist() for key in SCORE_KEYS}
+    resolved_need = [USER_NEED_LABELS[code] for code in scores["gt_user_need"].tolist()]
+    resolved_impacts = {metric: IMPACT_VALUES[scores[f"gt_{metric}"]].tolist() for metric in IMPACT_METRICS}
+
+    results = []
+    for pos, article_id in enumerate(scored["article_ids"].tolist()):
+        results.append({
+            "article_id": article_id,
+            "category": model_index[article_id]["category"],
+            "model_response": model_index[article_id]["response"],
+            "ground_truth": {
+                "user_need": resolved_need[pos],
+                **{metric: resolved_impacts[metric][pos] for metric in IMPACT_METRICS},
+            },
+            "ground_truth_candidates": [idx[article_id]["response"] for idx in gt_indices if article_id in idx],
+            **{key: columns[key][pos] for key in SCORE_KEYS},
+        })
+    return {"summary": summary, "results": results}
+
+
+def synthetic_datasets(rows: int, annotators: int = 2, seed: int = 0) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Random prediction/ground-truth datasets in the grouped JSON shape."""
+
+    rng = random.Random(seed)
+
+    def response() -> Dict[str, Any]:
+        return {
+            "user_need": rng.choice(USER_NEED_LABELS),
+            "I1": rng.choice(IMPACT_LEVELS),
+            "I3": rng.choice(IMPACT_LEVELS),
+            "I4": rng.choice(IMPACT_LEVELS),
+        }
+
+    categories = [f"category-{idx}" for idx in range(20)]
+    model: Dict[str, List[Dict[str, Any]]] = {category: [] for category in categories}
+    gts: List[Dict[str, List[Dict[str, Any]]]] = [{category: [] for category in categories} for _ in range(annotators)]
+    for article_id in range(rows):
+        category = categories[article_id % len(categories)]
+        model[category].append({"article_id": article_id, "response": response()})
+        for gt in gts:
+            gt[category].append({"article_id": article_id, "response": response()})
+    return model, gts
+
+
+def benchmark(sizes: Sequence[int], annotators: int = 2, reference_max: int = 100_000) -> List[Dict[str, Any]]:
+    rows = []
+    for size in sizes:
+        model, gts = synthetic_datasets(size, annotators)
+        entry: Dict[str, Any] = {"rows": size}
+
+        start = time.perf_counter()
+        scored = score_arrays(model, gts)
+        entry["vectorized_end_to_end_s"] = time.perf_counter() - start
+
+        gt_codes = encode_ground_truth(scored["article_ids"].tolist(), scored["gt_indices"])
+        model_codes = encode_responses([scored["model_index"][i]["response"] for i in scored["article_ids"].tolist()])
+        start = time.perf_counter()
+        score_encoded(model_codes, gt_codes)
+        entry["vectorized_scoring_s"] = time.perf_counter() - start
+
+        if size <= reference_max:
+            start = time.perf_counter()
+            reference = evaluate_dataset(model, gts)
+            entry["python_s"] = time.perf_counter() - start
+            vectorized = evaluate_dataset_vectorized(model, gts, include_results=False)
+            entry["max_abs_diff"] = max(
+                abs(reference["summary"]["averages"][key] - vectorized["summary"]["averages"][key]) for key in SCORE_KEYS
+            )
+        rows.append(entry)
+        print(json.dumps(entry))
+    return rows
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized evaluation engine against evaluate.evaluate_dataset.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000], help="Row counts to benchmark.")
+    parser.add_argument("--annotators", type=int, default=2, help="Number of synthetic ground truth annotators.")
+    parser.add_argument("--reference-max", type=int, default=100_000, help="Largest size also run through the pure-Python engine.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    benchmark(args.sizes, args.annotators, args.reference_max)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Run several prompt variants over one test list and score them side by side.
+
+Comparing pipelines used to mean running ``qwen3_infer.py`` and
+``qwen3_infer_seperate_prompt.py`` separately, each refetching every article, and then
+``evaluate.py`` on each output. This runner:
+
+1. fetches every article of the test list once (``load_article``, so a prefetched
+   corpus is used when present) and keeps the contexts in memory;
+2. runs every (article, variant) pair on one thread pool. Tasks are interleaved by
+   article so all variants of an article are in flight together, and every variant
+   reuses the fetched context;
+3. writes one grouped dump per variant and prints one scoreboard with the
+   ``evaluate.py`` averages, latency percentiles and token cost per variant.
+
+Variants are ``batch_infer`` variant names, optionally with sampling settings passed to
+the runner, e.g. ``vote:n=3,temperature=0.5``:
+
+    python experiment.py --variants single separate vote:n=3 vote:n=5,temperature=0.9 \\
+        --test-path data/test_list_12_12_2025_qc_selected.json --name prompts_dec
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import inspect
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from article_corpus import load_article
+from batch_infer import VARIANT_RUNNERS, infer_context
+from evaluate import DEFAULT_GROUND_TRUTHS, evaluate_dataset, load_json
+
+
+DEFAULT_OUTPUT_ROOT = Path("./data/experiments")
+SCORE_KEYS = ("score_userneed", "score_I1", "score_I3", "score_I4", "score_emotion", "final_score")
+
+
+def parse_variant(spec: str) -> Tuple[str, Callable[[str], Any]]:
+    """``name[:key=value,...]`` -> (label, runner) with the settings bound."""
+
+    name, _, settings = spec.partition(":")
+    if name not in VARIANT_RUNNERS:
+        raise ValueError(f"Unknown variant {name!r}; expected one of {sorted(VARIANT_RUNNERS)}.")
+    runner = VARIANT_RUNNERS[name]
+    if not settings:
+        return spec, runner
+
+    accepted = inspect.signature(runner).parameters
+    kwargs: Dict[str, Any] = {}
+    for item in settings.split(","):
+        key, _, value = item.partition("=")
+        if key not in accepted or key == "context":
+            raise ValueError(f"Variant {name!r} does not take {key!r}.")
+        kwargs[key] = json.loads(value)
+    return spec, functools.partial(runner, **kwargs)
+
+
+def fetch_one(article_id: int) -> Tuple[Any, Any]:
+    """``load_article``, with a failed fetch recorded as a missing article."""
+
+    try:
+        return load_article(article_id)
+    except Exception as exc:
+        print(f"Fetch failed for article {article_id}: {type(exc).__name__}: {exc}")
+        return None, None
+
+
+def fetch_all(article_ids: Sequence[int], workers: int) -> Dict[int, Tuple[Any, Any]]:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(article_ids, executor.map(fetch_one, article_ids)))
+
+
+def run_experiment(
+    articles: Mapping[str, List[int]],
+    variants: Sequence[str],
+    workers: int = 8,
+    fetch_workers: int = 8,
+) -> Dict[str, Dict[str, Any]]:
+    """Return ``label -> {"dataset", "latencies", "errors"}`` for every variant."""
+
+    runners = dict(parse_variant(spec) for spec in variants)
+
+    unique_ids = list(dict.fromkeys(int(article_id) for ids in articles.values() for article_id in ids))
+    started = time.perf_counter()
+    loaded = fetch_all(unique_ids, fetch_workers)
+    print(f"Fetched {len(loaded)} articles once in {time.perf_counter() - started:.1f}s for {len(runners)} variants")
+
+    results = {label: {"dataset": {category: [] for category in articles}, "latencies": [], "errors": 0} for label in runners}
+    lock = threading.Lock()
+
+    def task(category: str, article_id: int, label: str) -> None:
+        api_data, context = loaded[article_id]
+        task_started = time.perf_counter()
+        try:
+            row, _ = infer_context(article_id, api_data, context, label, runner=runners[label])
+        except Exception as exc:
+            row = {"article_id": article_id, "response": None, "prompt_variant": label, "error": f"{type(exc).__name__}: {exc}"}
+        elapsed = time.perf_counter() - task_started
+        row["latency_s"] = round(elapsed, 4)
+        with lock:
+            result = results[label]
+            result["dataset"][category].append(row)
+            if row.get("response") is None:
+                result["errors"] += 1
+            elif context is not None:
+                result["latencies"].append(elapsed)
+
+    jobs = [(category, int(article_id), label) for category, ids in articles.items() for article_id in ids for label in runners]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(task, *job) for job in jobs]:
+            future.result()
+
+    # Rows finish out of order; restore the test list order per category.
+    for result in results.values():
+        for category, ids in articles.items():
+            position = {int(article_id): idx for idx, article_id in enumerate(ids)}
+            result["dataset"][category].sort(key=lambda row: position[int(row["article_id"])])
+    return results
+
+
+def scoreboard(results: Mapping[str, Mapping[str, Any]], gt_datasets: Sequence[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    board = []
+    for label, result in results.items():
+        dataset = result["dataset"]
+        rows = [row for items in dataset.values() for row in items]
+        tokens = {key: sum(int((row.get("usage") or {}).get(key, 0) or 0) for row in rows) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+        evaluation = evaluate_dataset(dataset, gt_datasets)
+        latencies = np.asarray(result["latencies"]) * 1000
+        entry: Dict[str, Any] = {
+            "variant": label,
+            "articles": len(rows),
+            "errors": result["errors"],
+            "evaluated": evaluation["summary"]["evaluated"],
+            **{key: round(evaluation["summary"]["averages"][key], 4) for key in SCORE_KEYS},
+            "tokens": tokens,
+            "tokens_per_article": round(tokens["total_tokens"] / len(rows), 1) if rows else 0.0,
+        }
+        if latencies.size:
+            entry["latency_ms"] = {f"p{pct}": round(float(value), 1) for pct, value in zip((50, 95), np.percentile(latencies, (50, 95)))}
+        board.append(entry)
+    return sorted(board, key=lambda entry: entry["final_score"], reverse=True)
+
+
+def print_scoreboard(board: Sequence[Mapping[str, Any]]) -> None:
+    header = f"{'variant':<28} {'n':>4} {'err':>4} {'user_need':>9} {'I1':>6} {'I3':>6} {'I4':>6} {'final':>6} {'p50 ms':>8} {'p95 ms':>8} {'tok/art':>8}"
+    print(header)
+    print("-" * len(header))
+    for entry in board:
+        latency = entry.get("latency_ms", {})
+        print(
+            f"{entry['variant']:<28} {entry['evaluated']:>4} {entry['errors']:>4} {entry['score_userneed']:>9.3f} "
+            f"{entry['score_I1']:>6.3f} {entry['score_I3']:>6.3f} {entry['score_I4']:>6.3f} {entry['final_score']:>6.3f} "
+            f"{latency.get('p50', float('nan')):>8.0f} {latency.get('p95', float('nan')):>8.0f} {entry['tokens_per_article']:>8.0f}"
+        )
+
+
+def file_label(label: str) -> str:
+    return re.sub(r"[^A-Za-z0-9.-]+", "_", label)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run prompt variants side by side on one test list.")
+    parser.add_argument("--test-path", type=Path, default=Path("./data/test_list_12_12_2025_qc_selected.json"))
+    parser.add_argument("--variants", nargs="+", default=["single", "separate"], help="Variant specs: name[:key=value,...].")
+    parser.add_argument("--name", help="Experiment name (output directory under --output-root; defaults to a timestamp).")
+    parser.add_argument("--output-root", type=Path, default=DEFAULT_OUTPUT_ROOT)
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent (article, variant) inferences.")
+    parser.add_argument("--fetch-workers", type=int, default=8, help="Concurrent article fetches.")
+    parser.add_argument(
+        "--ground-truths",
+        dest="ground_truths",
+        type=Path,
+        nargs="+",
+        default=list(DEFAULT_GROUND_TRUTHS),
+        help="Ground truth JSON files.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    with args.test_path.open(encoding="utf-8") as f:
+        articles = json.load(f)["articles_id"]
+
+    results = run_experiment(articles, args.variants, args.workers, args.fetch_workers)
+    board = scoreboard(results, [load_json(path) for path in args.ground_truths])
+
+    out_dir = args.output_root / (args.name or time.strftime("%Y%m%d_%H%M%S"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for label, result in results.items():
+        with (out_dir / f"{file_label(label)}.json").open("w", encoding="utf-8") as f:
+            json.dump(result["dataset"], f, ensure_ascii=False, indent=4)
+    with (out_dir / "scoreboard.json").open("w", encoding="utf-8") as f:
+        json.dump({"test_path": str(args.test_path), "variants": list(args.variants), "scoreboard": board}, f, ensure_ascii=False, indent=2)
+
+    print()
+    print_scoreboard(board)
+    print(f"\nDumps and scoreboard written to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
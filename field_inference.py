@@ -0,0 +1,179 @@
+"""Field-selective inference: run only the prompt stage the caller needs.
+
+Three prompt stages cover the output fields:
+
+- ``full``      -> ``qwen3_infer.build_prompt``: user_need, I1, I3, I4 in one call
+- ``user_need`` -> ``qwen3_infer_seperate_prompt.build_user_need_prompt``: user_need only
+- ``scores``    -> ``qwen3_infer_seperate_prompt.build_scoring_prompt``: I1, I3, I4 only
+
+``select_stage`` picks the cheapest stage covering the fields that are not cached yet
+(one combined prefill beats two separate ones when everything is missing). Results are
+cached per field and keyed by the article text, so a later request for the other
+fields only runs the missing stage.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from output_parser import repair_json_output
+from qwen3_infer import build_prompt, query_model_with_usage
+from qwen3_infer_seperate_prompt import build_scoring_prompt, build_user_need_prompt
+
+
+USER_NEED_FIELDS = ("user_need",)
+SCORE_FIELDS = ("I1", "I3", "I4")
+ALL_FIELDS = USER_NEED_FIELDS + SCORE_FIELDS
+
+STAGE_PROMPTS: Dict[str, Callable[[str], str]] = {
+    "full": build_prompt,
+    "user_need": build_user_need_prompt,
+    "scores": build_scoring_prompt,
+}
+STAGE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "full": ALL_FIELDS,
+    "user_need": USER_NEED_FIELDS,
+    "scores": SCORE_FIELDS,
+}
+
+
+def normalize_fields(fields: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Validate requested fields; ``None`` or empty means all fields."""
+
+    if not fields:
+        return ALL_FIELDS
+    requested = set(fields)
+    unknown = requested - set(ALL_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {sorted(unknown)}; expected a subset of {list(ALL_FIELDS)}.")
+    return tuple(field for field in ALL_FIELDS if field in requested)
+
+
+def select_stage(fields: Iterable[str], cached: Mapping[str, Any]) -> Optional[str]:
+    """Return the cheapest stage producing every missing field, or ``None`` if all are cached."""
+
+    missing = {field for field in fields if field not in cached}
+    need_user_need = bool(missing.intersection(USER_NEED_FIELDS))
+    need_scores = bool(missing.intersection(SCORE_FIELDS))
+    if need_user_need and need_scores:
+        return "full"
+    if need_user_need:
+        return "user_need"
+    if need_scores:
+        return "scores"
+    return None
+
+
+def text_key(article_text: str) -> str:
+    return hashlib.sha1(article_text.encode("utf-8")).hexdigest()
+
+
+class FieldCache:
+    """LRU cache of per-field results keyed by article text."""
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return {}
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+    def update(self, key: str, values: Mapping[str, Any]) -> None:
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            entry.update(values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def extract_stage_fields(stage: str, raw_output: str) -> Tuple[Dict[str, Any], List[str]]:
+    parsed, repairs = repair_json_output(raw_output)
+    if not isinstance(parsed, dict):
+        raise ValueError("Model response could not be parsed as JSON.")
+    return {field: parsed[field] for field in STAGE_FIELDS[stage] if field in parsed}, repairs
+
+
+def finish(fields: Tuple[str, ...], values: Mapping[str, Any]) -> Dict[str, Any]:
+    missing = [field for field in fields if field not in values]
+    if missing:
+        raise ValueError(f"Model response is missing fields: {missing}")
+    return {field: values[field] for field in fields}
+
+
+def infer_fields(
+    article_text: str,
+    fields: Optional[Iterable[str]] = None,
+    cache: Optional[FieldCache] = None,
+    query_fn: Callable[[str], Tuple[str, Dict[str, int]]] = query_model_with_usage,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Return the requested fields plus details (stage run, raw output, usage, cache hits)."""
+
+    fields = normalize_fields(fields)
+    key = text_key(article_text)
+    values = cache.get(key) if cache is not None else {}
+    cached_fields = [field for field in fields if field in values]
+
+    stage = select_stage(fields, values)
+    raw_output, usage, repairs = None, None, []
+    if stage is not None:
+        raw_output, usage = query_fn(STAGE_PROMPTS[stage](article_text))
+        produced, repairs = extract_stage_fields(stage, raw_output)
+        logging.info(f"Context: {repr(article_text)} ==> STAGE {stage}: {produced}")
+        values.update(produced)
+        if cache is not None:
+            cache.update(key, produced)
+
+    details = {
+        "stage": stage,
+        "cached_fields": cached_fields,
+        "raw_output": raw_output,
+        "usage": usage,
+        "repairs": repairs,
+    }
+    return finish(fields, values), details
+
+
+async def ainfer_fields(
+    article_text: str,
+    fields: Optional[Iterable[str]],
+    cache: Optional[FieldCache],
+    query_fn: Callable[[str], Awaitable[Tuple[str, Dict[str, int]]]],
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Async counterpart of ``infer_fields`` for the service (``query_fn`` is awaited)."""
+
+    fields = normalize_fields(fields)
+    key = text_key(article_text)
+    values = cache.get(key) if cache is not None else {}
+    cached_fields = [field for field in fields if field in values]
+
+    stage = select_stage(fields, values)
+    raw_output, usage, repairs = None, None, []
+    if stage is not None:
+        raw_output, usage = await query_fn(STAGE_PROMPTS[stage](article_text))
+        produced, repairs = extract_stage_fields(stage, raw_output)
+        values.update(produced)
+        if cache is not None:
+            cache.update(key, produced)
+
+    details = {
+        "stage": stage,
+        "cached_fields": cached_fields,
+        "raw_output": raw_output,
+        "usage": usage,
+        "repairs": repairs,
+    }
+    return finish(fields, values), details
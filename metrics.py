@@ -0,0 +1,30 @@
+"""Process-wide counters exposed by the service on ``GET /metrics``."""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Counters:
+    """Thread-safe named counters (usable from request handlers and worker threads)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[str, float] = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(sorted(self._values.items()))
+
+
+COUNTERS = Counters()
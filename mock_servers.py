@@ -0,0 +1,244 @@
+"""Local stand-ins for the vLLM server and the VnExpress article API.
+
+- ``/v1/chat/completions``: OpenAI-compatible chat endpoint. Each call sleeps for
+  ``ttft + completion_tokens / token_rate`` (at most ``slots`` generations run at once,
+  like a GPU batch) and answers with a model response taken from the fixture dumps.
+- ``/ar/get_full?article_id=...``: serves fixture articles rebuilt from the ``data``
+  field of ``data/qwen3_infer_*.json``; unknown IDs get a fixture article chosen by ID,
+  so load tests can use any number of distinct IDs.
+
+Point the code at them with ``LOCAL_BASE_URL`` and ``ARTICLE_API_URL`` (``benchmark.py``
+does this), or run them standalone:
+
+    python mock_servers.py --llm-port 8808 --article-port 8809 --ttft 0.2 --token-rate 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+DEFAULT_FIXTURES = "./data/qwen3_infer_*.json"
+
+
+def load_fixtures(pattern: str = DEFAULT_FIXTURES) -> Tuple[Dict[int, Dict[str, Any]], List[str]]:
+    """Article payloads keyed by ID and the pool of valid model answers."""
+
+    articles: Dict[int, Dict[str, Any]] = {}
+    answers: List[str] = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            dataset = json.load(f)
+        for items in dataset.values():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                text = item.get("data")
+                if isinstance(text, str) and int(item["article_id"]) not in articles:
+                    title, _, rest = text.partition("\n\n")
+                    lead, _, content = rest.partition("\n\n")
+                    articles[int(item["article_id"])] = {
+                        "article_id": int(item["article_id"]),
+                        "title": title,
+                        "lead": lead,
+                        "content": content,
+                        "share_url": item.get("url") or f"https://vnexpress.net/fixture-{item['article_id']}.html",
+                    }
+                if isinstance(item.get("response"), dict):
+                    answers.append(json.dumps(item["response"], ensure_ascii=False))
+    if not articles or not answers:
+        raise ValueError(f"No fixture articles/answers found in {pattern}")
+    return articles, answers
+
+
+class MockState:
+    def __init__(
+        self,
+        articles: Dict[int, Dict[str, Any]],
+        answers: List[str],
+        ttft: float = 0.2,
+        token_rate: float = 50.0,
+        completion_tokens: Optional[int] = None,
+        slots: int = 16,
+        article_latency: float = 0.05,
+    ) -> None:
+        self.articles = articles
+        self.article_ids = sorted(articles)
+        self.answers = answers
+        self.ttft = ttft
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.article_latency = article_latency
+        self.slots = threading.BoundedSemaphore(slots)
+        self.lock = threading.Lock()
+        self.counts = {"chat": 0, "article": 0}
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counts[name] += 1
+
+    def article(self, article_id: int) -> Dict[str, Any]:
+        if article_id in self.articles:
+            return self.articles[article_id]
+        fixture = self.articles[self.article_ids[article_id % len(self.article_ids)]]
+        # The ID in the title keeps the text unique, so text-keyed caches in the app
+        # cannot answer an ID that reuses a fixture.
+        return {
+            **fixture,
+            "article_id": article_id,
+            "title": f"{fixture['title']} ({article_id})",
+            "share_url": f"https://vnexpress.net/fixture-{article_id}.html",
+        }
+
+    def answer(self, prompt: str, index: int = 0) -> str:
+        digest = hashlib.sha1(f"{prompt}\0{index}".encode("utf-8")).digest()
+        return self.answers[int.from_bytes(digest[:4], "big") % len(self.answers)]
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _send_json(self, status: int, payload: Any) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            if url.path.rstrip("/").endswith("/ar/get_full"):
+                try:
+                    article_id = int(parse_qs(url.query)["article_id"][0])
+                except (KeyError, ValueError):
+                    self._send_json(400, {"error": "article_id is required"})
+                    return
+                state.count("article")
+                time.sleep(state.article_latency)
+                self._send_json(200, {"code": 0, "data": state.article(article_id)})
+            elif url.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+            n = max(1, int(body.get("n") or 1))
+            answers = [state.answer(prompt, index) for index in range(n)]
+            prompt_tokens = max(1, len(prompt) // 4)
+            per_choice = state.completion_tokens or max(1, len(answers[0]) // 4)
+            completion_tokens = per_choice * n
+
+            state.count("chat")
+            with state.slots:
+                time.sleep(state.ttft + per_choice / state.token_rate)
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [
+                    {"index": index, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}
+                    for index, answer in enumerate(answers)
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+    return Handler
+
+
+class MockServer:
+    """A threaded HTTP server running in a background thread."""
+
+    def __init__(self, state: MockState, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(state))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_mock_servers(
+    state: MockState,
+    host: str = "127.0.0.1",
+    llm_port: int = 0,
+    article_port: int = 0,
+) -> Dict[str, Any]:
+    """Start both servers; return them with the env vars pointing the code at them."""
+
+    llm = MockServer(state, host, llm_port).start()
+    article = MockServer(state, host, article_port).start()
+    return {
+        "llm": llm,
+        "article": article,
+        "env": {
+            "LOCAL_BASE_URL": f"{llm.base_url}/v1",
+            "ARTICLE_API_URL": f"{article.base_url}/ar/get_full",
+        },
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run mock vLLM and article API servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--llm-port", type=int, default=8808)
+    parser.add_argument("--article-port", type=int, default=8809)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Glob of grouped dumps providing articles and answers.")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Generated tokens per second per request.")
+    parser.add_argument("--completion-tokens", type=int, help="Fixed completion length (default: answer length / 4).")
+    parser.add_argument("--slots", type=int, default=16, help="Concurrent generations before requests queue.")
+    parser.add_argument("--article-latency", type=float, default=0.05, help="Seconds per article API call.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    articles, answers = load_fixtures(args.fixtures)
+    state = MockState(articles, answers, args.ttft, args.token_rate, args.completion_tokens, args.slots, args.article_latency)
+    servers = start_mock_servers(state, args.host, args.llm_port, args.article_port)
+    for name, value in servers["env"].items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servers["llm"].stop()
+        servers["article"].stop()
+
+
+if __name__ == "__main__":
+    main()
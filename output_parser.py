@@ -0,0 +1,318 @@
+"""Tolerant parsing and value repair for model JSON outputs.
+
+``parse_json_output`` used to give up on the first ``json.loads`` error, which failed the
+request (or left a ``None`` row in batch dumps) for outputs that are obviously usable:
+a ``<think>`` block with braces in it, trailing commas, single quotes, a label written
+as ``"update Me"`` or an impact score of 6. ``repair_json_output`` fixes those locally
+and reports every repair it made so the rate of each defect can be tracked.
+
+Repairs, in the order they are tried:
+
+- ``unquote_string``: the whole answer is a quoted string literal holding the JSON
+- ``strip_thinking`` / ``strip_code_fence``: drop ``<think>...</think>`` and markdown fences
+- ``close_brace``: the object was truncated before its closing brace
+- ``smart_quotes``, ``comments``, ``trailing_comma``, ``single_quotes``, ``unquoted_keys``,
+  ``python_literals``: textual JSON fixes, applied until the candidate parses
+- ``regex_fallback``: pull the fields out with regexes when nothing parses
+- ``key:<name>``, ``user_need:<label>``, ``<metric>:<old>-><new>``: value normalization
+"""
+
+from __future__ import annotations
+
+import ast
+import json
+import re
+import unicodedata
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from evaluate import IMPACT_LEVELS, USER_NEED_GROUPS
+
+
+IMPACT_FIELDS = ("I1", "I3", "I4")
+
+THINK_BLOCK_RE = re.compile(r"<think>.*?</think>", re.S | re.I)
+CODE_FENCE_RE = re.compile(r"```(?:json)?", re.I)
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+LINE_COMMENT_RE = re.compile(r"//[^\n]*")
+UNQUOTED_KEY_RE = re.compile(r'([{,]\s*)([A-Za-z_][A-Za-z0-9_ ]*?)\s*:')
+SINGLE_QUOTED_RE = re.compile(r"'([^'\"]*)'")
+PYTHON_LITERAL_RE = re.compile(r"\b(True|False|None)\b")
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+FALLBACK_FIELD_RES = {
+    "user_need": re.compile(r"user[\s_]*need\W{0,4}\s*[:=]\s*[\"'“]?([^\"'”,}\n]+)", re.I),
+    **{metric: re.compile(rf"\b{metric}\b\W{{0,4}}\s*[:=]\s*[\"']?(-?\d+(?:\.\d+)?)", re.I) for metric in IMPACT_FIELDS},
+}
+
+KEY_ALIASES = {
+    "userneed": "user_need",
+    "user_need": "user_need",
+    "userneeds": "user_need",
+    "i1": "I1",
+    "i3": "I3",
+    "i4": "I4",
+}
+
+# One distinctive word per label, used when the label is paraphrased ("perspective").
+LABEL_KEYWORDS = {
+    "update": "Update me",
+    "engaged": "Keep me engaged",
+    "engage": "Keep me engaged",
+    "educate": "Educate me",
+    "perspective": "Give me perspective",
+    "inspire": "Inspire me",
+    "divert": "Divert me",
+    "help": "Help me",
+    "connect": "Connect me",
+}
+
+# Keywords directly preceded by one of these are skipped: "Don't update me"
+# is not "Update me". "t" is what ``fold_text`` leaves of "don't", "isn't", ...
+NEGATIONS = {"not", "no", "never", "t", "dont", "without", "khong", "chang"}
+
+# Vietnamese renderings of the labels (the prompts are in Vietnamese), already folded.
+VIETNAMESE_LABELS = {
+    "cap nhat cho toi": "Update me",
+    "cap nhat toi": "Update me",
+    "giu toi tuong tac": "Keep me engaged",
+    "giu chan toi": "Keep me engaged",
+    "thu hut toi": "Keep me engaged",
+    "giao duc toi": "Educate me",
+    "giai thich cho toi": "Educate me",
+    "cho toi goc nhin": "Give me perspective",
+    "dua ra goc nhin": "Give me perspective",
+    "truyen cam hung cho toi": "Inspire me",
+    "truyen cam hung": "Inspire me",
+    "giai tri cho toi": "Divert me",
+    "giup toi giai tri": "Divert me",
+    "giup toi": "Help me",
+    "ket noi toi": "Connect me",
+    "ket noi voi toi": "Connect me",
+}
+
+
+class ParseResult(NamedTuple):
+    data: Optional[Dict[str, Any]]
+    repairs: List[str]
+
+
+def fold_text(value: str) -> str:
+    """Lowercase, strip diacritics/punctuation and collapse whitespace."""
+
+    decomposed = unicodedata.normalize("NFKD", value.replace("đ", "d").replace("Đ", "D"))
+    without_marks = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    words = re.sub(r"[^a-z0-9]+", " ", without_marks.lower())
+    return " ".join(words.split())
+
+
+FOLDED_LABELS = {**VIETNAMESE_LABELS, **{fold_text(label): label for label in USER_NEED_GROUPS}}
+
+
+def normalize_user_need(value: Any) -> Optional[str]:
+    """Map a label variant (English or Vietnamese) onto one of the 8 ``USER_NEED_GROUPS`` keys, or ``None``."""
+
+    if not isinstance(value, str):
+        return None
+    if value in USER_NEED_GROUPS:
+        return value
+    folded = fold_text(value)
+    if folded in FOLDED_LABELS:
+        return FOLDED_LABELS[folded]
+    words = folded.split()
+    matches = {
+        LABEL_KEYWORDS[word]
+        for pos, word in enumerate(words)
+        if word in LABEL_KEYWORDS and (pos == 0 or words[pos - 1] not in NEGATIONS)
+    }
+    if len(matches) == 1:
+        return matches.pop()
+    return None
+
+
+def snap_impact(value: Any) -> Optional[int]:
+    """Snap a numeric-ish value to the nearest level in ``IMPACT_LEVELS`` (ties go down)."""
+
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        match = NUMBER_RE.search(value)
+        if not match:
+            return None
+        number = float(match.group())
+    else:
+        return None
+    return min(IMPACT_LEVELS, key=lambda level: (abs(level - number), level))
+
+
+def strip_wrappers(text: str, repairs: List[str]) -> str:
+    cleaned = THINK_BLOCK_RE.sub("", text)
+    lowered = cleaned.lower()
+    if "</think>" in lowered:
+        # Opening tag was cut off (or sent as a prefix): keep what follows the close.
+        cleaned = cleaned[lowered.rfind("</think>") + len("</think>"):]
+    elif "<think>" in lowered:
+        # Unclosed block: the answer, if any, is the last object in the text.
+        cleaned = re.sub(r"<think>", "", cleaned, flags=re.I)
+    if cleaned != text:
+        repairs.append("strip_thinking")
+
+    unfenced = CODE_FENCE_RE.sub("", cleaned)
+    if unfenced != cleaned:
+        repairs.append("strip_code_fence")
+    return unfenced
+
+
+def object_candidates(text: str) -> List[Tuple[str, bool]]:
+    """Top-level ``{...}`` spans (string-aware), plus a trailing unclosed one if any.
+
+    Each item is ``(candidate, closed)``.
+    """
+
+    candidates: List[Tuple[str, bool]] = []
+    depth = 0
+    start = -1
+    quote: Optional[str] = None
+    escaped = False
+    for pos, ch in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+            continue
+        if ch == "\"" and depth:
+            quote = ch
+        elif ch == "{":
+            if depth == 0:
+                start = pos
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                candidates.append((text[start:pos + 1], True))
+    if depth and start >= 0:
+        candidates.append((text[start:] + "}" * depth, False))
+    return candidates
+
+
+TEXT_FIXES = (
+    ("smart_quotes", lambda s: s.replace("“", '"').replace("”", '"').replace("„", '"').replace("‘", "'").replace("’", "'")),
+    ("comments", lambda s: LINE_COMMENT_RE.sub("", s)),
+    ("trailing_comma", lambda s: TRAILING_COMMA_RE.sub(r"\1", s)),
+    ("single_quotes", lambda s: SINGLE_QUOTED_RE.sub(r'"\1"', s)),
+    ("unquoted_keys", lambda s: UNQUOTED_KEY_RE.sub(r'\1"\2":', s)),
+    ("python_literals", lambda s: PYTHON_LITERAL_RE.sub(lambda m: {"True": "true", "False": "false", "None": "null"}[m.group()], s)),
+)
+
+
+def loads_with_fixes(candidate: str) -> Tuple[Optional[Any], List[str]]:
+    try:
+        return json.loads(candidate), []
+    except ValueError:
+        pass
+
+    applied: List[str] = []
+    fixed = candidate
+    for name, fix in TEXT_FIXES:
+        updated = fix(fixed)
+        if updated == fixed:
+            continue
+        fixed = updated
+        applied.append(name)
+        try:
+            return json.loads(fixed), applied
+        except ValueError:
+            continue
+
+    try:
+        return ast.literal_eval(candidate), ["python_literal"]
+    except (ValueError, SyntaxError):
+        return None, []
+
+
+def regex_fields(text: str) -> Dict[str, Any]:
+    found: Dict[str, Any] = {}
+    for field, pattern in FALLBACK_FIELD_RES.items():
+        match = pattern.search(text)
+        if match:
+            found[field] = match.group(1).strip()
+    return found
+
+
+def normalize_response(data: Dict[str, Any], repairs: List[str]) -> Dict[str, Any]:
+    """Canonicalize keys, the user_need label and impact levels; record each change."""
+
+    normalized: Dict[str, Any] = {}
+    for key, value in data.items():
+        canonical = KEY_ALIASES.get(fold_text(str(key)).replace(" ", ""), key) if isinstance(key, str) else key
+        if canonical != key:
+            repairs.append(f"key:{key}")
+        normalized[canonical] = value
+
+    if "user_need" in normalized:
+        label = normalize_user_need(normalized["user_need"])
+        if label is not None and label != normalized["user_need"]:
+            repairs.append(f"user_need:{normalized['user_need']}")
+            normalized["user_need"] = label
+
+    for metric in IMPACT_FIELDS:
+        if metric not in normalized:
+            continue
+        original = normalized[metric]
+        snapped = snap_impact(original)
+        if snapped is None:
+            continue
+        if str(snapped) != str(original).strip():
+            repairs.append(f"{metric}:{original}->{snapped}")
+        normalized[metric] = snapped
+    return normalized
+
+
+def repair_json_output(raw_output: Optional[str]) -> ParseResult:
+    """Parse a model answer into a response dict, repairing common defects."""
+
+    if not isinstance(raw_output, str) or not raw_output.strip():
+        return ParseResult(None, [])
+
+    repairs: List[str] = []
+    text = raw_output.strip()
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "\"'":
+        # Some backends return the JSON as a quoted string literal.
+        try:
+            unquoted = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            unquoted = None
+        if isinstance(unquoted, str):
+            text = unquoted
+            repairs.append("unquote_string")
+    text = strip_wrappers(text, repairs)
+
+    parsed: Optional[Dict[str, Any]] = None
+    fallback: Optional[Tuple[Dict[str, Any], List[str]]] = None
+    # Prefer the last object that looks like an answer; reasoning text tends to come first.
+    for candidate, closed in reversed(object_candidates(text)):
+        value, applied = loads_with_fixes(candidate)
+        if not isinstance(value, dict):
+            continue
+        applied = applied if closed else ["close_brace", *applied]
+        if any(fold_text(str(key)).replace(" ", "") in KEY_ALIASES for key in value):
+            parsed = value
+            repairs.extend(applied)
+            break
+        if fallback is None:
+            fallback = (value, applied)
+
+    if parsed is None and fallback is not None:
+        parsed, applied = fallback
+        repairs.extend(applied)
+    if parsed is None:
+        found = regex_fields(text)
+        if not found:
+            return ParseResult(None, repairs)
+        parsed = found
+        repairs.append("regex_fallback")
+
+    return ParseResult(normalize_response(parsed, repairs), repairs)
@@ -0,0 +1,329 @@
+"""Streaming crawl -> fetch/clean -> inference pipeline.
+
+Instead of crawling to a test list, prefetching it and then running inference as
+separate whole-file steps, articles flow through four stages connected by bounded
+queues:
+
+    categories -> [crawl] -> ids -> [fetch] -> inputs -> [infer] -> rows -> [write]
+
+Every stage has its own worker count. A full queue blocks the stage feeding it
+(backpressure), so a slow model never lets fetched inputs pile up in memory, while a
+deep ``inputs`` queue keeps inference workers busy even when the crawler is slow.
+Rows are appended to a JSONL file (``evaluate_stream.py`` reads it directly) as soon as
+they are labelled. With ``--poll-interval`` the categories are re-crawled periodically
+and only new article IDs enter the pipeline (see ``crawl_articles_id.CrawlState``).
+An ID is saved as seen only once its row is written; IDs whose fetch or inference
+failed are released, with their category's page validators, and claimed again by the
+next crawl. The state file is rewritten at most every ``--save-interval`` seconds and
+once at shutdown.
+
+    python pipeline.py --categories tam-su/hen-ho the-gioi --pages 2 --infer-workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO
+
+from article_corpus import load_article
+from batch_infer import VARIANTS, infer_context
+from crawl_articles_id import DEFAULT_STATE_PATH, CrawlState, Crawler, page_url
+from field_inference import ALL_FIELDS, FieldCache
+
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+
+
+class Stage:
+    """A pool of worker threads moving items from ``inbox`` to ``outbox``.
+
+    ``fn`` maps one item to zero or more output items. When every worker has received
+    ``STOP`` the last one to exit forwards one ``STOP`` per downstream worker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Iterable[Any]],
+        workers: int,
+        inbox: "queue.Queue[Any]",
+        outbox: Optional["queue.Queue[Any]"] = None,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.downstream_workers = 0
+        self.processed = 0
+        self.errors = 0
+        self.emitted = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+        self._alive = self.workers
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            waited = time.perf_counter()
+            item = self.inbox.get()
+            started = time.perf_counter()
+            if item is STOP:
+                break
+            ok = True
+            try:
+                for output in self.fn(item):
+                    if self.outbox is not None:
+                        self.outbox.put(output)
+                    with self._lock:
+                        self.emitted += 1
+            except Exception:
+                ok = False
+                logger.exception("%s stage failed on %r", self.name, item)
+            with self._lock:
+                self.processed += 1
+                self.errors += 0 if ok else 1
+                self.idle_seconds += started - waited
+                self.busy_seconds += time.perf_counter() - started
+
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.outbox is not None:
+            for _ in range(self.downstream_workers):
+                self.outbox.put(STOP)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "emitted": self.emitted,
+                "errors": self.errors,
+                "busy_s": round(self.busy_seconds, 2),
+                "idle_s": round(self.idle_seconds, 2),
+                "queued": self.inbox.qsize(),
+            }
+
+
+class Pipeline:
+    """Crawl, fetch and infer articles continuously, writing JSONL rows."""
+
+    def __init__(
+        self,
+        out: TextIO,
+        crawler: Crawler,
+        variant: str = "single",
+        fields: Optional[Iterable[str]] = None,
+        max_pages: int = 1,
+        per_category: Optional[int] = None,
+        crawl_workers: int = 2,
+        fetch_workers: int = 8,
+        infer_workers: int = 4,
+        queue_size: int = 64,
+        save_interval: float = 30.0,
+    ) -> None:
+        self.out = out
+        self.crawler = crawler
+        self.variant = variant
+        self.fields = list(fields) if fields else None
+        self.cache = FieldCache() if self.fields else None
+        self.max_pages = max_pages
+        self.per_category = per_category
+        # Claimed IDs without a written row yet -> category.
+        self.pending: Dict[int, str] = {}
+        self._pending_lock = threading.Lock()
+        self.save_interval = save_interval
+        self._saved_at = time.monotonic()
+
+        self.categories: "queue.Queue[Any]" = queue.Queue()
+        self.ids: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.inputs: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.rows: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.stages = [
+            Stage("crawl", self.crawl, crawl_workers, self.categories, self.ids),
+            Stage("fetch", self.fetch, fetch_workers, self.ids, self.inputs),
+            Stage("infer", self.infer, infer_workers, self.inputs, self.rows),
+            Stage("write", self.write, 1, self.rows),
+        ]
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            upstream.downstream_workers = downstream.workers
+
+    def category_urls(self, category: str) -> List[str]:
+        return [page_url(category, number) for number in range(1, self.max_pages + 1)]
+
+    def save_state(self) -> None:
+        with self._pending_lock:
+            pending = dict(self.pending)
+        # Pending IDs and their listing validators stay out of the file, so a restart
+        # refetches those pages and claims the IDs again.
+        urls = [url for category in set(pending.values()) for url in self.category_urls(category)]
+        self.crawler.state.save(exclude_ids=pending, exclude_urls=urls)
+
+    def maybe_save(self) -> None:
+        with self._pending_lock:
+            due = time.monotonic() - self._saved_at >= self.save_interval
+            if due:
+                self._saved_at = time.monotonic()
+        if due:
+            self.save_state()
+
+    def finish(self, article_id: int) -> None:
+        with self._pending_lock:
+            self.pending.pop(article_id, None)
+        self.maybe_save()
+
+    def release(self, category: str, article_id: int) -> None:
+        """Give a failed ID back to the crawler; its pages must not answer 304 next time."""
+
+        with self._pending_lock:
+            self.pending.pop(article_id, None)
+        self.crawler.state.release([article_id])
+        for url in self.category_urls(category):
+            self.crawler.state.set_validators(url, {})
+        self.maybe_save()
+
+    def crawl(self, category: str):
+        for article_id in self.crawler.crawl_category(category, self.max_pages, self.per_category):
+            with self._pending_lock:
+                self.pending[article_id] = category
+            yield category, article_id
+
+    def fetch(self, item):
+        category, article_id = item
+        try:
+            api_data, context = load_article(article_id)
+        except Exception:
+            self.release(category, article_id)
+            raise
+        yield category, article_id, api_data, context
+
+    def infer(self, item):
+        category, article_id, api_data, context = item
+        try:
+            row, _ = infer_context(article_id, api_data, context, self.variant, self.fields, self.cache)
+        except Exception:
+            self.release(category, article_id)
+            raise
+        yield {"category": category, **row}
+
+    def write(self, row):
+        self.out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.out.flush()
+        if row.get("response") is None and row.get("data") is not None:
+            # The model failed on a fetched article: retry it on the next crawl.
+            self.release(row["category"], row["article_id"])
+        else:
+            self.finish(row["article_id"])
+        return ()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def run(
+        self,
+        categories: List[str],
+        poll_interval: Optional[float] = None,
+        rounds: Optional[int] = None,
+        log_interval: float = 10.0,
+        stop: Optional[threading.Event] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Run until the crawl is exhausted (or ``stop`` is set when polling)."""
+
+        stop = stop or threading.Event()
+        for stage in self.stages:
+            stage.start()
+
+        done = threading.Event()
+
+        def log_progress() -> None:
+            while not done.wait(log_interval):
+                logger.info("pipeline %s", json.dumps(self.stats()))
+
+        logger_thread = threading.Thread(target=log_progress, daemon=True)
+        logger_thread.start()
+
+        completed_rounds = 0
+        try:
+            while True:
+                for category in categories:
+                    self.categories.put(category)
+                completed_rounds += 1
+                if poll_interval is None or (rounds is not None and completed_rounds >= rounds):
+                    break
+                if stop.wait(poll_interval):
+                    break
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.categories.put(STOP)
+            for stage in self.stages:
+                stage.join()
+            self.save_state()
+            done.set()
+        return self.stats()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Streaming crawl -> fetch -> inference pipeline.")
+    parser.add_argument("--categories", nargs="+", required=True, help="Category paths, e.g. tam-su/hen-ho.")
+    parser.add_argument("--pages", type=int, default=1, help="Listing pages to walk per category and round.")
+    parser.add_argument("--per-category", type=int, help="At most this many new IDs per category and round.")
+    parser.add_argument("--variant", choices=VARIANTS, default="single")
+    parser.add_argument("--fields", nargs="+", choices=ALL_FIELDS, help="Only compute these fields (overrides --variant).")
+    parser.add_argument("--crawl-workers", type=int, default=2)
+    parser.add_argument("--fetch-workers", type=int, default=8)
+    parser.add_argument("--infer-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=64, help="Capacity of each inter-stage queue.")
+    parser.add_argument("--crawl-rate", type=float, default=2.0, help="Maximum crawl requests per second per host.")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE_PATH, help="Crawl state file (seen IDs).")
+    parser.add_argument("--poll-interval", type=float, help="Re-crawl every N seconds instead of stopping after one pass.")
+    parser.add_argument("--rounds", type=int, help="Stop after this many crawl rounds when polling.")
+    parser.add_argument("--log-interval", type=float, default=10.0, help="Seconds between stage statistics log lines.")
+    parser.add_argument("--save-interval", type=float, default=30.0, help="Seconds between crawl state writes.")
+    parser.add_argument("--output", type=Path, default=Path("./data/pipeline_output.jsonl"), help="JSONL output (appended).")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    crawler = Crawler(CrawlState(args.state), rate=args.crawl_rate, workers=args.crawl_workers)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("a", encoding="utf-8") as out:
+        pipeline = Pipeline(
+            out,
+            crawler,
+            variant=args.variant,
+            fields=args.fields,
+            max_pages=args.pages,
+            per_category=args.per_category,
+            crawl_workers=args.crawl_workers,
+            fetch_workers=args.fetch_workers,
+            infer_workers=args.infer_workers,
+            queue_size=args.queue_size,
+            save_interval=args.save_interval,
+        )
+        stats = pipeline.run(args.categories, args.poll_interval, args.rounds, args.log_interval)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Parallel, incremental rendering of confusion-matrix PNGs.
+
+Each plot is described by a small JSON-serializable job (title, labels, matrix, axis
+labels, output path). A job's SHA-256 over its content is recorded in
+``<out_dir>/.plot_manifest.json``; on the next run only jobs whose digest changed (or
+whose PNG is missing) are rendered. Rendering happens in a process pool, and matplotlib
+is imported inside the worker with the headless ``Agg`` backend, so importing this
+module (or ``test.py``) does not pay the matplotlib import cost.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+MANIFEST_NAME = ".plot_manifest.json"
+# Bump when the drawing code changes so existing images are re-rendered.
+RENDER_VERSION = 1
+
+
+def make_job(
+    title: str,
+    labels: Sequence[str],
+    matrix: Sequence[Sequence[int]],
+    path: Path,
+    xlabel: str = "Model",
+    ylabel: str = "Human",
+) -> Dict[str, Any]:
+    return {
+        "title": title,
+        "labels": [str(label) for label in labels],
+        "matrix": [[int(value) for value in row] for row in matrix],
+        "path": str(path),
+        "xlabel": xlabel,
+        "ylabel": ylabel,
+    }
+
+
+def job_digest(job: Mapping[str, Any]) -> str:
+    payload = {key: value for key, value in job.items() if key != "path"}
+    payload["render_version"] = RENDER_VERSION
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def render_matrix(job: Mapping[str, Any]) -> str:
+    """Draw one confusion matrix to ``job["path"]`` (runs in a worker process)."""
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    labels = job["labels"]
+    matrix = job["matrix"]
+    fig, ax = plt.subplots(figsize=(6, 5))
+    im = ax.imshow(matrix, cmap="Blues")
+    ax.set_title(job["title"])
+    ax.set_xlabel(job["xlabel"])
+    ax.set_ylabel(job["ylabel"])
+    ax.set_xticks(range(len(labels)))
+    ax.set_yticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=45, ha="right")
+    ax.set_yticklabels(labels)
+
+    # Annotate cells with counts
+    for i in range(len(labels)):
+        for j in range(len(labels)):
+            ax.text(j, i, matrix[i][j], ha="center", va="center", color="black")
+
+    fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
+    fig.tight_layout()
+    path = Path(job["path"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+    return str(path)
+
+
+def load_manifest(out_dir: Path) -> Dict[str, str]:
+    path = out_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    try:
+        with path.open(encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def save_manifest(out_dir: Path, manifest: Mapping[str, str]) -> None:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out_dir / (MANIFEST_NAME + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=2)
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+
+
+def render_all(
+    jobs: Sequence[Mapping[str, Any]],
+    out_dir: Path,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> Tuple[List[str], List[str]]:
+    """Render changed jobs in parallel; return (rendered paths, skipped paths)."""
+
+    manifest = load_manifest(out_dir)
+    pending: List[Tuple[Mapping[str, Any], str]] = []
+    skipped: List[str] = []
+    for job in jobs:
+        name = Path(job["path"]).name
+        digest = job_digest(job)
+        if not force and manifest.get(name) == digest and Path(job["path"]).exists():
+            skipped.append(job["path"])
+        else:
+            pending.append((job, digest))
+
+    rendered: List[str] = []
+    if pending:
+        max_workers = min(len(pending), workers or os.cpu_count() or 1)
+        if max_workers == 1:
+            results = [render_matrix(job) for job, _ in pending]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(render_matrix, [job for job, _ in pending]))
+        for (job, digest), path in zip(pending, results):
+            manifest[Path(job["path"]).name] = digest
+            rendered.append(path)
+        save_manifest(out_dir, manifest)
+    return rendered, skipped
@@ -1,5 +1,6 @@
 import requests
 import json
+import os
 import sys
 import logging
 import logging.config
@@ -7,7 +8,11 @@ import yaml
 from tqdm import tqdm
 from g4f import Client
 import ast
-from openai import OpenAI
+from output_parser import repair_json_output
+from replay import recordable
+from openai import AsyncOpenAI, OpenAI
+import asyncio
+from typing import Optional
 client = Client()
 
 global local_infer
@@ -104,7 +109,63 @@ def norm_output_open_ai(answer):
 
     return json.loads(norm_answer) 
 
-def query_local(prompt: str) -> str:
+LOCAL_MODEL_NAME = "Qwen/Qwen3-14B-AWQ"
+LOCAL_BASE_URL = os.getenv("LOCAL_BASE_URL", "http://157.10.188.151:8808/v1")
+LOCAL_API_KEY = "123456"
+LOCAL_SYSTEM_PROMPT = """
+        Bạn là trợ lý biên tập thông minh, nhiệm vụ của bạn là phân loại bài viết vào đúng 1 user need trong 8 nhóm Smartocto 2.0 và chấm ba chỉ số I1, I3, I4. Các giá trị I1/I3/I4 bắt buộc phải thuộc tập {1, 3, 5, 7, 9} và phải chọn mức gần nhất theo mô tả chuẩn. Luôn trả lời bằng **Định dạng JSON**, không thêm bất kỳ chữ nào ngoài JSON, với các trường: user_need, I1, I3, I4. Trước khi xuất kết quả, phải tự kiểm tra tất cả giá trị đều hợp lệ và đúng danh sách cho phép.
+        """
+LOCAL_MAX_TOKENS = 4096
+
+_local_client = None
+
+
+def get_local_client() -> OpenAI:
+    # One pooled client for the whole process so concurrent callers reuse
+    # keep-alive connections to the vLLM server instead of reconnecting.
+    global _local_client
+    if _local_client is None:
+        _local_client = OpenAI(
+            base_url=LOCAL_BASE_URL,
+            api_key=LOCAL_API_KEY,
+        )
+    return _local_client
+
+
+_async_local_client = None
+
+
+def get_async_local_client() -> AsyncOpenAI:
+    global _async_local_client
+    if _async_local_client is None:
+        _async_local_client = AsyncOpenAI(
+            base_url=LOCAL_BASE_URL,
+            api_key=LOCAL_API_KEY,
+        )
+    return _async_local_client
+
+
+def usage_to_dict(usage) -> dict:
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    if not isinstance(usage, dict):
+        usage = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+            "completion_tokens": getattr(usage, "completion_tokens", 0),
+            "total_tokens": getattr(usage, "total_tokens", 0),
+        }
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    total_tokens = int(usage.get("total_tokens") or (prompt_tokens + completion_tokens))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens,
+    }
+
+
+@recordable("local")
+def query_local_with_usage(prompt: str):
     # infer using OLLAMA local server
     OLLAMA = False
     if OLLAMA:
@@ -125,44 +186,119 @@ def query_local(prompt: str) -> str:
         response = requests.post(OLLAMA_URL, json=payload)
         
         response.raise_for_status()
-        return response.json()["response"]
+        body = response.json()
+        usage = usage_to_dict({
+            "prompt_tokens": body.get("prompt_eval_count", 0),
+            "completion_tokens": body.get("eval_count", 0),
+        })
+        return body["response"], usage
     else:
         # infer using vLLM local server
         # print("Using OpenAI client for local inference...")
-        model_name = "Qwen/Qwen3-14B-AWQ"
-        base_url = "http://157.10.188.151:8808/v1"
-        api_key = "123456"
-        client = OpenAI(
-            base_url=base_url,
-            api_key=api_key,
-        )
-        system_prompt = """
-        Bạn là trợ lý biên tập thông minh, nhiệm vụ của bạn là phân loại bài viết vào đúng 1 user need trong 8 nhóm Smartocto 2.0 và chấm ba chỉ số I1, I3, I4. Các giá trị I1/I3/I4 bắt buộc phải thuộc tập {1, 3, 5, 7, 9} và phải chọn mức gần nhất theo mô tả chuẩn. Luôn trả lời bằng **Định dạng JSON**, không thêm bất kỳ chữ nào ngoài JSON, với các trường: user_need, I1, I3, I4. Trước khi xuất kết quả, phải tự kiểm tra tất cả giá trị đều hợp lệ và đúng danh sách cho phép.
-        """
-        response = client.chat.completions.create(
-            model=model_name,
+        response = get_local_client().chat.completions.create(
+            model=LOCAL_MODEL_NAME,
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": LOCAL_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt},
             ],
             seed=4545,
             temperature=0.1,
-            max_tokens=4096,
+            max_tokens=LOCAL_MAX_TOKENS,
             top_p=0.95
         )
         answer = response.choices[0].message.content
-        import pdb
-        # pdb.set_trace()
-        return answer
+        return answer, usage_to_dict(getattr(response, "usage", None))
 
-def query_model(prompt: str) -> str:
+@recordable("local_samples")
+def query_local_samples_with_usage(prompt: str, n: int, temperature: float):
+    # One request with n choices: vLLM prefills the prompt once and shares it
+    # across the samples, so k votes cost one prefill plus k decodes.
+    response = get_local_client().chat.completions.create(
+        model=LOCAL_MODEL_NAME,
+        messages=[
+            {"role": "system", "content": LOCAL_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        n=n,
+        seed=4545,
+        temperature=temperature,
+        max_tokens=LOCAL_MAX_TOKENS,
+        top_p=0.95
+    )
+    answers = [choice.message.content for choice in response.choices]
+    return answers, usage_to_dict(getattr(response, "usage", None))
+
+def query_local(prompt: str) -> str:
+    answer, _ = query_local_with_usage(prompt)
+    return answer
+
+def query_model_with_usage(prompt: str):
     if local_infer:
-        return query_local(prompt)
+        return query_local_with_usage(prompt)
     else:
-        return query_g4f(prompt)
+        return query_g4f_with_usage(prompt)
+
+def query_model_samples_with_usage(prompt: str, n: int, temperature: float):
+    if local_infer:
+        return query_local_samples_with_usage(prompt, n, temperature)
+    # g4f has no n parameter; fall back to n separate calls.
+    answers, usages = [], []
+    for _ in range(n):
+        answer, usage = query_g4f_with_usage(prompt)
+        answers.append(answer)
+        usages.append(usage)
+    return answers, {key: sum(usage[key] for usage in usages) for key in usage_to_dict(None)}
+
+def query_model(prompt: str) -> str:
+    answer, _ = query_model_with_usage(prompt)
+    return answer
+
+@recordable("local")
+async def aquery_local_with_usage(prompt: str, timeout: Optional[float] = None, priority: Optional[int] = None):
+    # Cancelling the awaiting task closes the HTTP connection, which makes vLLM
+    # abort the generation instead of finishing it for nobody. ``priority`` is only
+    # accepted by servers started with ``--scheduling-policy priority``.
+    response = await get_async_local_client().chat.completions.create(
+        model=LOCAL_MODEL_NAME,
+        messages=[
+            {"role": "system", "content": LOCAL_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        seed=4545,
+        temperature=0.1,
+        max_tokens=LOCAL_MAX_TOKENS,
+        top_p=0.95,
+        timeout=timeout,
+        extra_body={"priority": priority} if priority is not None else None,
+    )
+    answer = response.choices[0].message.content
+    return answer, usage_to_dict(getattr(response, "usage", None))
+
+async def aprime_local(prompt: str, timeout: Optional[float] = None) -> None:
+    # A one-token generation with the same system prompt and message layout as real
+    # requests, so vLLM's prefix cache holds the static part of ``prompt`` afterwards.
+    await get_async_local_client().chat.completions.create(
+        model=LOCAL_MODEL_NAME,
+        messages=[
+            {"role": "system", "content": LOCAL_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.0,
+        max_tokens=1,
+        timeout=timeout,
+    )
+
+async def aquery_model_with_usage(prompt: str, timeout: Optional[float] = None, priority: Optional[int] = None):
+    if local_infer:
+        if priority is not None:
+            return await aquery_local_with_usage(prompt, timeout=timeout, priority=priority)
+        return await aquery_local_with_usage(prompt, timeout=timeout)
+    # g4f has no cancellable transport here; stop waiting at the deadline at least.
+    return await asyncio.wait_for(asyncio.to_thread(query_g4f_with_usage, prompt), timeout)
     
 
-def query_g4f(prompt: str) -> str:
+@recordable("g4f")
+def query_g4f_with_usage(prompt: str):
     # print("Using G4F client for inference...")
     response = client.chat.completions.create(
         model="Qwen/Qwen3-14B",
@@ -174,26 +310,28 @@ def query_g4f(prompt: str) -> str:
         # stream=True
     )
     
-    return response.choices[0].message.content
+    return response.choices[0].message.content, usage_to_dict(getattr(response, "usage", None))
+
+def query_g4f(prompt: str) -> str:
+    answer, _ = query_g4f_with_usage(prompt)
+    return answer
 
 def parse_json_output(raw_output: str):
-    try:
-        # Find the first JSON-like block
-        start = raw_output.find("{")
-        end = raw_output.rfind("}") + 1
-        json_str = raw_output[start:end]
-        parsed = json.loads(json_str)
-        return parsed
-    except Exception as e:
-        print("⚠️  Failed to parse JSON:", e)
+    # Tolerant parse: strips <think> blocks, fixes common JSON defects and
+    # normalizes labels/levels instead of failing the whole article.
+    parsed, repairs = repair_json_output(raw_output)
+    if parsed is None:
+        print("⚠️  Failed to parse JSON")
         print("Raw output was:")
         print(raw_output)
         return None
-from utils import get_article_data, build_input_data
+    if repairs:
+        logging.info(f"Repaired model output: {repairs}")
+    return parsed
+from article_corpus import load_article
 
 def single_query(article_id: int):
-    api_data = get_article_data(int(article_id))
-    context = build_input_data(api_data)
+    api_data, context = load_article(int(article_id))
     print(f"Context used: {context}")
     prompt = build_prompt(context)
     # print(f"📝 Prompt: \n{prompt}")
@@ -215,13 +353,12 @@ def infer_test_file(test_path: str):
             output_dict.setdefault(key, [])
             for id in tqdm(articles["articles_id"][key]):
                 
-                api_data = get_article_data(int(id))
-                context = build_input_data(api_data)
+                api_data, context = load_article(int(id))
 
                 url = api_data["data"]["share_url"] if api_data else None
                 prompt = build_prompt(context)
                 # print(f"📝 Prompt: \n{prompt}")
-                raw_output = query_model(prompt)
+                raw_output, usage = query_model_with_usage(prompt)
                 try:
                     result = parse_json_output(raw_output)
                     logging.info(f"Context: {repr(context)} ==> RESPONSE: {result}")
@@ -231,7 +368,10 @@ def infer_test_file(test_path: str):
                     "article_id": id,
                     "response": result,
                     "data": context,
-                    "url": url
+                    "url": url,
+                    "prompt_variant": "single",
+                    "usage": usage,
+                    "usage_by_stage": {"full": usage},
                 })
                 print(json.dumps(result, indent=2, ensure_ascii=False))
     suffix = "_".join(test_path.split('_')[-3:])
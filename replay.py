@@ -0,0 +1,283 @@
+"""Record/replay of upstream calls (article API and model queries).
+
+Functions decorated with ``@recordable(kind)`` (``utils.get_article_data`` and the
+``query_*_with_usage`` functions of the qwen3 modules) behave normally unless a mode is
+set through the environment:
+
+- ``UPSTREAM_MODE=record``: every call's arguments, result (or exception), start offset
+  and duration are appended to ``UPSTREAM_STORE`` (JSONL, one call per line);
+- ``UPSTREAM_MODE=replay``: calls are answered from the store instead of the network.
+  Identical requests are replayed in their recorded order. ``REPLAY_SPEED=recorded``
+  (default) sleeps for the recorded duration, ``fast`` returns immediately, and a number
+  scales the recorded durations (``2`` = twice as fast). A request that was never
+  recorded raises ``ReplayMiss``. A recorded exception is raised again as its own class
+  (``requests``/``openai`` errors keep their type, so callers map them to the same
+  status codes), falling back to ``ReplayedError`` when that class is not importable.
+
+Replaying a whole batch run this way makes it deterministic and, at ``fast`` speed,
+leaves only our own overhead to profile:
+
+    UPSTREAM_MODE=record UPSTREAM_STORE=data/recordings/run.jsonl python batch_infer.py ...
+    UPSTREAM_MODE=replay UPSTREAM_STORE=data/recordings/run.jsonl REPLAY_SPEED=fast python batch_infer.py ...
+    python replay.py data/recordings/run.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+MODES = ("off", "record", "replay")
+DEFAULT_STORE = Path("./data/recordings/upstream.jsonl")
+
+
+class ReplayMiss(KeyError):
+    """The replayed run made a request that was not recorded."""
+
+
+class ReplayedError(RuntimeError):
+    """Stands in for a recorded exception whose class is not available."""
+
+
+def describe_error(error: BaseException) -> Dict[str, Any]:
+    described: Dict[str, Any] = {
+        "type": type(error).__name__,
+        "module": type(error).__module__,
+        "qualname": type(error).__qualname__,
+        "message": str(error),
+    }
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if isinstance(status_code, int):
+        described["status_code"] = status_code
+    return described
+
+
+def rebuild_error(error: Dict[str, Any]) -> Exception:
+    """An instance of the recorded exception class, or a ``ReplayedError``."""
+
+    message = error.get("message", "")
+    # Only modules the process already imported: a store never triggers imports.
+    cls: Any = sys.modules.get(error.get("module") or "")
+    for part in (error.get("qualname") or "").split("."):
+        cls = getattr(cls, part, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        return ReplayedError(f"{error['type']}: {message}")
+    try:
+        rebuilt = cls(message)
+    except TypeError:
+        # Client errors such as openai.APIStatusError need live request/response objects.
+        rebuilt = cls.__new__(cls)
+        Exception.__init__(rebuilt, message)
+    for name, value in (("message", message), ("status_code", error.get("status_code"))):
+        if value is not None and not hasattr(rebuilt, name):
+            try:
+                setattr(rebuilt, name, value)
+            except AttributeError:
+                pass
+    return rebuilt
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    payload = json.dumps([kind, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class Recorder:
+    """Append-only JSONL store of upstream calls, used for recording or replaying."""
+
+    def __init__(self, mode: str, path: Path, speed: str = "recorded") -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown upstream mode {mode!r}; expected one of {MODES}.")
+        self.mode = mode
+        self.path = Path(path)
+        self.scale = 0.0 if speed == "fast" else 1.0 if speed == "recorded" else 1.0 / float(speed)
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        if mode == "replay":
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+        elif mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def record(
+        self,
+        kind: str,
+        key: str,
+        request: Dict[str, Any],
+        started: float,
+        duration: float,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        entry = {
+            "kind": kind,
+            "key": key,
+            "request": request,
+            "started": round(started - self._origin, 6),
+            "duration": round(duration, 6),
+        }
+        if error is None:
+            entry["result"] = list(result) if isinstance(result, tuple) else result
+            entry["tuple"] = isinstance(result, tuple)
+        else:
+            entry["error"] = describe_error(error)
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+    def lookup(self, kind: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise ReplayMiss(f"No recorded {kind} call for key {key}")
+            # Repeated identical requests replay in recorded order, then keep the last one.
+            position = min(self._cursor[key], len(entries) - 1)
+            self._cursor[key] += 1
+        return entries[position]
+
+    def delay(self, entry: Dict[str, Any]) -> float:
+        return entry["duration"] * self.scale
+
+    @staticmethod
+    def outcome(entry: Dict[str, Any]) -> Any:
+        if "error" in entry:
+            raise rebuild_error(entry["error"])
+        result = entry["result"]
+        return tuple(result) if entry.get("tuple") else result
+
+
+_recorder: Optional[Recorder] = None
+_configured = False
+_config_lock = threading.Lock()
+
+
+def configure(mode: str = "off", path: Path = DEFAULT_STORE, speed: str = "recorded") -> Optional[Recorder]:
+    """Set the process-wide recorder (overrides the environment)."""
+
+    global _recorder, _configured
+    with _config_lock:
+        _recorder = None if mode == "off" else Recorder(mode, path, speed)
+        _configured = True
+    return _recorder
+
+
+def get_recorder() -> Optional[Recorder]:
+    if not _configured:
+        configure(
+            os.getenv("UPSTREAM_MODE", "off"),
+            Path(os.getenv("UPSTREAM_STORE", str(DEFAULT_STORE))),
+            os.getenv("REPLAY_SPEED", "recorded"),
+        )
+    return _recorder
+
+
+def recordable(kind: str, ignore: Tuple[str, ...] = ("timeout",)) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Record or replay calls to the decorated (sync or async) function.
+
+    Requests are keyed by ``kind`` and the bound arguments minus ``ignore`` (per-call
+    budgets such as ``timeout`` must not change which recording answers a request), so
+    the sync and async variants of a call share recordings.
+    """
+
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(fn)
+
+        def describe(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+            bound = signature.bind(*args, **kwargs)
+            request = {name: value for name, value in bound.arguments.items() if name not in ignore}
+            return request_key(kind, request), request
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                recorder = get_recorder()
+                if recorder is None:
+                    return await fn(*args, **kwargs)
+                key, request = describe(args, kwargs)
+                if recorder.mode == "replay":
+                    entry = recorder.lookup(kind, key)
+                    await asyncio.sleep(recorder.delay(entry))
+                    return recorder.outcome(entry)
+                started = time.monotonic()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as exc:
+                    recorder.record(kind, key, request, started, time.monotonic() - started, error=exc)
+                    raise
+                recorder.record(kind, key, request, started, time.monotonic() - started, result)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            recorder = get_recorder()
+            if recorder is None:
+                return fn(*args, **kwargs)
+            key, request = describe(args, kwargs)
+            if recorder.mode == "replay":
+                entry = recorder.lookup(kind, key)
+                time.sleep(recorder.delay(entry))
+                return recorder.outcome(entry)
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as exc:
+                recorder.record(kind, key, request, started, time.monotonic() - started, error=exc)
+                raise
+            recorder.record(kind, key, request, started, time.monotonic() - started, result)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def summarize(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Calls, errors and recorded time per kind."""
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            stats = summary.setdefault(entry["kind"], {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+            stats["calls"] += 1
+            stats["errors"] += int("error" in entry)
+            stats["total_s"] += entry["duration"]
+            stats["max_s"] = max(stats["max_s"], entry["duration"])
+    for stats in summary.values():
+        stats["mean_s"] = round(stats["total_s"] / stats["calls"], 4)
+        stats["total_s"] = round(stats["total_s"], 3)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize a recorded upstream store.")
+    parser.add_argument("store", type=Path, nargs="?", default=DEFAULT_STORE)
+    args = parser.parse_args()
+    print(json.dumps(summarize(args.store), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Self-consistency voting over ``n`` completions from one request.
+
+Labels from the model still flip between runs at ``temperature=0.1``. Instead of
+running the prompt k times (k full prefills), the ``vote`` variant asks vLLM for ``n``
+choices in a single call (``query_model_samples_with_usage``), so the prompt is
+prefilled once, then aggregates:
+
+- ``user_need`` by majority (ties go to the label sampled first);
+- ``I1``/``I3``/``I4`` by the low median, so the result is always a sampled level;
+- per-field agreement (share of samples equal to the voted value) as a confidence,
+  with ``overall`` being their mean.
+
+Rows carry the voted ``response`` plus ``confidence`` and ``samples``, and
+``prompt_variant`` is ``vote:n=<n>`` so ``token_report.py`` keeps them apart from other
+variants. This script runs a test list through ``batch_infer`` with the vote variant
+and reports accuracy (``evaluate.py`` rubric), tokens and accuracy by confidence bucket:
+
+    python self_consistency.py --test-path data/test_list_12_12_2025_qc_selected.json --samples 5
+    python self_consistency.py --evaluate-only data/qwen3_infer_vote_qc_selected.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from evaluate import DEFAULT_GROUND_TRUTHS, evaluate_dataset, load_json, print_summary
+from output_parser import IMPACT_FIELDS, snap_impact
+
+
+DEFAULT_SAMPLES = 5
+DEFAULT_TEMPERATURE = 0.7
+CONFIDENCE_BUCKETS = (0.0, 0.5, 0.7, 0.9, 1.0)
+
+
+def vote(samples: Sequence[Optional[Mapping[str, Any]]]) -> Tuple[Optional[Dict[str, Any]], Dict[str, float]]:
+    """Aggregate parsed samples; return ``(response, confidence)``."""
+
+    parsed = [sample for sample in samples if isinstance(sample, Mapping)]
+    if not parsed:
+        return None, {"overall": 0.0}
+
+    response: Dict[str, Any] = {}
+    confidence: Dict[str, float] = {}
+    labels = [sample["user_need"] for sample in parsed if isinstance(sample.get("user_need"), str)]
+    if labels:
+        counts = Counter(labels)
+        top = max(counts.values())
+        winner = next(label for label in labels if counts[label] == top)
+        response["user_need"] = winner
+        confidence["user_need"] = top / len(parsed)
+
+    for field in IMPACT_FIELDS:
+        values = [snapped for snapped in (snap_impact(sample.get(field)) for sample in parsed) if snapped is not None]
+        if not values:
+            continue
+        # median_low, not median: {1, 9, 9, 1} must vote 1, not an unsampled 5.
+        value = statistics.median_low(values)
+        response[field] = value
+        confidence[field] = sum(1 for item in values if item == value) / len(parsed)
+
+    confidence["overall"] = sum(confidence.values()) / len(confidence) if confidence else 0.0
+    return response or None, confidence
+
+
+def run_vote(
+    context: str,
+    n: int = DEFAULT_SAMPLES,
+    temperature: float = DEFAULT_TEMPERATURE,
+) -> Tuple[Optional[dict], Dict[str, Dict[str, int]], Dict[str, Any]]:
+    """Runner for ``batch_infer``: one ``n``-choice request, voted."""
+
+    from qwen3_infer import build_prompt, parse_json_output, query_model_samples_with_usage
+
+    answers, usage = query_model_samples_with_usage(build_prompt(context), n, temperature)
+    samples = [parse_json_output(answer) for answer in answers]
+    response, confidence = vote(samples)
+    return response, {"full": usage}, {"prompt_variant": f"vote:n={n}", "confidence": confidence, "samples": samples}
+
+
+def confidence_report(evaluation: Mapping[str, Any], dataset: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """Mean final_score per overall-confidence bucket (is the confidence calibrated?)."""
+
+    confidence = {
+        int(item["article_id"]): item.get("confidence", {}).get("overall")
+        for items in dataset.values() if isinstance(items, list)
+        for item in items
+    }
+    buckets: List[Dict[str, Any]] = []
+    edges = list(zip(CONFIDENCE_BUCKETS, CONFIDENCE_BUCKETS[1:]))
+    for idx, (low, high) in enumerate(edges):
+        last = idx == len(edges) - 1
+        scores = [
+            entry["final_score"] for entry in evaluation["results"]
+            if confidence.get(int(entry["article_id"])) is not None
+            and low <= confidence[int(entry["article_id"])] and (confidence[int(entry["article_id"])] < high or last)
+        ]
+        buckets.append({
+            "confidence": f"[{low:.1f}, {high:.1f}{']' if last else ')'}",
+            "articles": len(scores),
+            "final_score": sum(scores) / len(scores) if scores else None,
+        })
+    return buckets
+
+
+def total_usage(dataset: Mapping[str, Any]) -> Dict[str, int]:
+    total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for items in dataset.values():
+        for item in items if isinstance(items, list) else []:
+            for key in total:
+                total[key] += int((item.get("usage") or {}).get(key, 0) or 0)
+    return total
+
+
+def report(dataset: Mapping[str, Any], gt_paths: Sequence[Path]) -> None:
+    evaluation = evaluate_dataset(dataset, [load_json(path) for path in gt_paths])
+    print_summary(evaluation)
+    usage = total_usage(dataset)
+    evaluated = evaluation["summary"]["evaluated"]
+    print(f"\nTokens: {usage['total_tokens']} total ({usage['prompt_tokens']} prompt, {usage['completion_tokens']} completion)")
+    if evaluated:
+        print(f"Tokens per article: {usage['total_tokens'] / evaluated:.0f}")
+    print("\nAccuracy by vote confidence:")
+    for bucket in confidence_report(evaluation, dataset):
+        score = "-" if bucket["final_score"] is None else f"{bucket['final_score']:.3f} / 3"
+        print(f"  {bucket['confidence']:<12} n={bucket['articles']:<4} final_score={score}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Self-consistency voting with n samples per request.")
+    parser.add_argument("--test-path", type=Path, default=Path("./data/test_list_12_12_2025_qc_selected.json"))
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="Completions per request (n).")
+    parser.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE, help="Sampling temperature for the votes.")
+    parser.add_argument("--output", type=Path, help="Output path (default: ./data/qwen3_infer_vote_<suffix of test list>).")
+    parser.add_argument("--evaluate-only", type=Path, help="Skip inference and report on an existing vote dump.")
+    parser.add_argument(
+        "--ground-truths",
+        dest="ground_truths",
+        type=Path,
+        nargs="+",
+        default=list(DEFAULT_GROUND_TRUTHS),
+        help="Ground truth JSON files.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.evaluate_only:
+        report(load_json(args.evaluate_only), args.ground_truths)
+        return
+
+    from batch_infer import configure_vote, run_batch
+
+    configure_vote(args.samples, args.temperature)
+    with args.test_path.open(encoding="utf-8") as f:
+        articles = json.load(f)["articles_id"]
+    output, _ = run_batch(articles, variant="vote")
+
+    suffix = "_".join(str(args.test_path).split("_")[-3:])
+    output_path = args.output or Path(f"./data/qwen3_infer_vote_{suffix}")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("w", encoding="utf-8") as out_f:
+        json.dump(output, out_f, ensure_ascii=False, indent=4)
+    print(f"Wrote {sum(len(rows) for rows in output.values())} rows to {output_path}\n")
+    report(output, args.ground_truths)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Shadow evaluation of a candidate prompt variant on live ``/infer`` traffic.
+
+The service answers with the ``full`` prompt. With ``SHADOW_SAMPLE_RATE`` > 0, that
+share of ``/infer`` requests is also queued here, once the primary response is ready,
+and later run through a candidate variant:
+
+- ``separate``: ``build_user_need_prompt`` + ``build_scoring_prompt``, the two prompts
+  running concurrently;
+- ``full``: ``build_prompt`` again. Requests use a fixed seed at temperature 0.1, so
+  this checks that the serving stack is deterministic rather than sampling variance.
+
+Only requests for all fields that actually ran the model are sampled. Cached fields
+would make the latency comparison meaningless.
+
+Shadow work stays off the response path and yields to live traffic:
+
+- submitting is a non-blocking ``put_nowait``; samples are dropped when the queue is full;
+- ``SHADOW_WORKERS`` workers (one by default) wait while more than
+  ``SHADOW_MAX_PRIMARY_INFLIGHT`` primary requests are in flight;
+- ``SHADOW_VLLM_PRIORITY`` can pass a vLLM request priority. This only works when the
+  server runs with ``--scheduling-policy priority``.
+
+Because the candidate only runs when the backend is quiet while the primary ran under
+whatever load it met, each latency is stored with the number of primary requests in
+flight when it started (``load``). The latency delta only uses pairs whose two loads
+fall in the same bucket of ``LOAD_BUCKETS``, and is also reported per bucket.
+
+Shadow results never enter the field cache. Each comparison (both results, per-field
+agreement, both latencies and loads) is appended to ``SHADOW_STORE``. ``GET /shadow``
+reports the live agreement rate and the latency delta over the last
+``SHADOW_LATENCY_WINDOW`` comparisons, and the CLI summarizes a store offline:
+
+    python shadow.py data/shadow/shadow.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from field_inference import ALL_FIELDS, STAGE_PROMPTS, extract_stage_fields
+
+
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+SHADOW_VARIANT = os.getenv("SHADOW_VARIANT", "separate")
+SHADOW_STORE = Path(os.getenv("SHADOW_STORE", "./data/shadow/shadow.jsonl"))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "100"))
+SHADOW_MAX_PRIMARY_INFLIGHT = int(os.getenv("SHADOW_MAX_PRIMARY_INFLIGHT", "4"))
+SHADOW_VLLM_PRIORITY = os.getenv("SHADOW_VLLM_PRIORITY")
+SHADOW_TIMEOUT = float(os.getenv("SHADOW_TIMEOUT", "300"))
+SHADOW_LATENCY_WINDOW = int(os.getenv("SHADOW_LATENCY_WINDOW", "1000"))
+BUSY_POLL_SECONDS = 0.2
+# Upper bounds of the in-flight buckets latencies are compared within.
+LOAD_BUCKETS = (1, 2, 4, 8, 16)
+
+# Candidate variant -> prompt stages it runs (see ``field_inference.STAGE_PROMPTS``).
+CANDIDATES: Dict[str, Tuple[str, ...]] = {
+    "separate": ("user_need", "scores"),
+    "full": ("full",),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def load_bucket(load: Optional[int]) -> Optional[str]:
+    if load is None:
+        return None
+    lower = 1
+    for upper in LOAD_BUCKETS:
+        if load <= upper:
+            return str(upper) if lower == upper else f"{lower}-{upper}"
+        lower = upper + 1
+    return f"{lower}+"
+
+
+def compare(primary: Mapping[str, Any], candidate: Optional[Mapping[str, Any]]) -> Dict[str, bool]:
+    return {field: candidate is not None and primary.get(field) == candidate.get(field) for field in ALL_FIELDS}
+
+
+class ShadowStats:
+    """Running agreement counts and recent latencies, shared by the workers and ``/shadow``."""
+
+    def __init__(self, latency_window: int = SHADOW_LATENCY_WINDOW) -> None:
+        self._lock = threading.Lock()
+        self.counts = {"sampled": 0, "dropped": 0, "completed": 0, "errors": 0}
+        self.agree = {field: 0 for field in ALL_FIELDS}
+        # (primary_ms, candidate_ms, primary_load, candidate_load)
+        self.samples: deque = deque(maxlen=latency_window)
+
+    def inc(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def add(self, record: Mapping[str, Any]) -> None:
+        with self._lock:
+            if record["candidate"].get("error"):
+                self.counts["errors"] += 1
+                return
+            self.counts["completed"] += 1
+            for field, same in record["agreement"].items():
+                self.agree[field] += same
+            self.samples.append(latency_sample(record))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return summarize(self.counts, self.agree, self.samples)
+
+
+def latency_sample(record: Mapping[str, Any]) -> Tuple[float, float, Optional[int], Optional[int]]:
+    primary, candidate = record["primary"], record["candidate"]
+    return primary["latency_ms"], candidate["latency_ms"], primary.get("load"), candidate.get("load")
+
+
+def delta_summary(deltas: Sequence[float]) -> Dict[str, Any]:
+    values = np.asarray(deltas)
+    return {"mean": round(float(values.mean()), 1), "p50": round(float(np.percentile(values, 50)), 1), "samples": int(values.size)}
+
+
+def summarize(
+    counts: Mapping[str, int],
+    agree: Mapping[str, int],
+    samples: Sequence[Tuple[float, float, Optional[int], Optional[int]]],
+) -> Dict[str, Any]:
+    completed = counts.get("completed", 0)
+    summary: Dict[str, Any] = {**counts}
+    summary["agreement"] = {field: round(agree[field] / completed, 4) for field in ALL_FIELDS} if completed else {}
+    if samples:
+        primary = np.asarray([sample[0] for sample in samples])
+        candidate = np.asarray([sample[1] for sample in samples])
+        summary["latency_ms"] = {
+            name: {"mean": round(float(values.mean()), 1), "p50": round(float(np.percentile(values, 50)), 1), "p95": round(float(np.percentile(values, 95)), 1)}
+            for name, values in (("primary", primary), ("candidate", candidate))
+        }
+        # Only pairs measured under comparable load; the candidate waits for a quiet backend.
+        by_load: Dict[str, List[float]] = {}
+        for primary_ms, candidate_ms, primary_load, candidate_load in samples:
+            bucket = load_bucket(primary_load)
+            if bucket is not None and bucket == load_bucket(candidate_load):
+                by_load.setdefault(bucket, []).append(candidate_ms - primary_ms)
+        matched = [delta for deltas in by_load.values() for delta in deltas]
+        if matched:
+            summary["latency_delta_ms"] = delta_summary(matched)
+            summary["latency_delta_by_load"] = {bucket: delta_summary(deltas) for bucket, deltas in by_load.items()}
+    return summary
+
+
+class ShadowRunner:
+    """Sampled, queued and low-priority execution of the candidate variant."""
+
+    def __init__(
+        self,
+        query_fn: Callable[..., Awaitable[Tuple[str, Dict[str, int]]]],
+        busy: Callable[[], bool],
+        load: Optional[Callable[[], int]] = None,
+        variant: str = SHADOW_VARIANT,
+        sample_rate: float = SHADOW_SAMPLE_RATE,
+        store: Path = SHADOW_STORE,
+        workers: int = SHADOW_WORKERS,
+        queue_size: int = SHADOW_QUEUE_SIZE,
+        priority: Optional[int] = int(SHADOW_VLLM_PRIORITY) if SHADOW_VLLM_PRIORITY else None,
+    ) -> None:
+        if variant not in CANDIDATES:
+            raise ValueError(f"Unknown shadow variant {variant!r}; expected one of {sorted(CANDIDATES)}.")
+        self.query_fn = query_fn
+        self.busy = busy
+        self.load = load
+        self.variant = variant
+        self.sample_rate = sample_rate
+        self.store = store
+        self.workers = workers
+        self.priority = priority
+        self.stats = ShadowStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        self._tasks: List[asyncio.Task] = []
+        self._write_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def start(self) -> None:
+        if not self.enabled or self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self.store.parent.mkdir(parents=True, exist_ok=True)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(
+        self,
+        article_id: Optional[int],
+        article_text: str,
+        primary: Mapping[str, Any],
+        primary_seconds: float,
+        primary_load: Optional[int] = None,
+    ) -> bool:
+        """Maybe queue a comparison; never blocks the caller.
+
+        ``primary_load`` is the number of primary requests in flight when it started.
+        """
+
+        if self._queue is None or random.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait((article_id, article_text, dict(primary), primary_seconds, primary_load))
+        except asyncio.QueueFull:
+            self.stats.inc("dropped")
+            return False
+        self.stats.inc("sampled")
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                while self.busy():
+                    await asyncio.sleep(BUSY_POLL_SECONDS)
+                record = await self.evaluate(*item)
+                self.stats.add(record)
+                await asyncio.to_thread(self._write, record)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Shadow evaluation failed")
+            finally:
+                self._queue.task_done()
+
+    async def run_candidate(self, article_text: str) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        async def stage(name: str) -> Tuple[Dict[str, Any], Dict[str, int]]:
+            kwargs: Dict[str, Any] = {"timeout": SHADOW_TIMEOUT}
+            if self.priority is not None:
+                kwargs["priority"] = self.priority
+            raw_output, usage = await self.query_fn(STAGE_PROMPTS[name](article_text), **kwargs)
+            produced, _ = extract_stage_fields(name, raw_output)
+            return produced, usage
+
+        result: Dict[str, Any] = {}
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        for produced, stage_usage in await asyncio.gather(*(stage(name) for name in CANDIDATES[self.variant])):
+            result.update(produced)
+            for key in usage:
+                usage[key] += int((stage_usage or {}).get(key, 0) or 0)
+        return result, usage
+
+    async def evaluate(
+        self,
+        article_id: Optional[int],
+        article_text: str,
+        primary: Mapping[str, Any],
+        primary_seconds: float,
+        primary_load: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        candidate: Dict[str, Any] = {"variant": self.variant}
+        if self.load is not None:
+            # The candidate counts as one more request on the backend.
+            candidate["load"] = self.load() + 1
+        try:
+            result, usage = await self.run_candidate(article_text)
+            candidate.update({"result": result, "usage": usage})
+        except Exception as exc:
+            candidate.update({"result": None, "error": f"{type(exc).__name__}: {exc}"})
+        candidate["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "article_id": article_id,
+            "primary": {"variant": "full", "result": dict(primary), "latency_ms": round(primary_seconds * 1000, 1), "load": primary_load},
+            "candidate": candidate,
+            "agreement": compare(primary, candidate["result"]),
+        }
+
+    def _write(self, record: Mapping[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._write_lock:
+            with self.store.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+
+def report(path: Path) -> Dict[str, Any]:
+    """Agreement and latency deltas of a shadow store, overall and per candidate variant."""
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            group = groups.setdefault(record["candidate"]["variant"], {
+                "counts": {"completed": 0, "errors": 0},
+                "agree": {field: 0 for field in ALL_FIELDS},
+                "samples": [],
+            })
+            if record["candidate"].get("error"):
+                group["counts"]["errors"] += 1
+                continue
+            group["counts"]["completed"] += 1
+            for field, same in record["agreement"].items():
+                group["agree"][field] += same
+            group["samples"].append(latency_sample(record))
+    return {
+        variant: summarize(group["counts"], group["agree"], group["samples"])
+        for variant, group in groups.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize a shadow evaluation store.")
+    parser.add_argument("store", type=Path, nargs="?", default=SHADOW_STORE)
+    args = parser.parse_args()
+    print(json.dumps(report(args.store), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Sharded batch inference: split a test list by hashed article ID, run shards, merge.
+
+One process cannot saturate several vLLM backends, so a test list is split into
+``--shards`` parts by a stable hash of the article ID: SHA-1, not Python's salted
+``hash``. Every host computes the same partition from the same test list. Each shard
+runs ``batch_infer.run_batch`` as an independent process and writes
+``shard-<i>-of-<n>.json`` plus a ``.meta.json`` sidecar to a shared output directory.
+
+    # one host, one process per backend (shards are assigned base URLs round-robin)
+    python shard.py launch --test-path data/test_list_27_11_2025.json --shards 4 \\
+        --base-urls http://gpu1:8808/v1 http://gpu2:8808/v1 --out-dir data/shards/27_11
+
+    # or on each of several hosts
+    python shard.py run --test-path data/test_list_27_11_2025.json --shards 4 --index 2 --out-dir data/shards/27_11
+
+    python shard.py merge --test-path data/test_list_27_11_2025.json --out-dir data/shards/27_11 \\
+        --output data/qwen3_infer_27_11_2025.json
+
+``merge`` rebuilds the grouped JSON ``evaluate.py`` expects, in test list order. It
+reports test list IDs missing from every shard, IDs emitted by more than one shard or
+more often than the test list lists them (the first row with a response is kept), rows
+for IDs outside the test list, and rows without a response. An ID listed under several
+categories is inferred once, under its first category. Only outputs of one ``--shards``
+value are merged. ``--strict`` makes missing or duplicate IDs a non-zero exit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence
+
+from batch_infer import VARIANTS, default_output_path
+
+
+def shard_of(article_id: int, shards: int) -> int:
+    digest = hashlib.sha1(str(int(article_id)).encode("ascii")).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+def split_articles(articles: Mapping[str, List[int]], shards: int, index: int) -> Dict[str, List[int]]:
+    """The part of a ``category -> ids`` test list that belongs to shard ``index``.
+
+    An ID listed under several categories is kept under the first one only.
+    """
+
+    if not 0 <= index < shards:
+        raise ValueError(f"Shard index {index} out of range for {shards} shards.")
+    assigned = set()
+    split: Dict[str, List[int]] = {}
+    for category, ids in articles.items():
+        split[category] = []
+        for article_id in ids:
+            if int(article_id) in assigned or shard_of(article_id, shards) != index:
+                continue
+            assigned.add(int(article_id))
+            split[category].append(article_id)
+    return split
+
+
+def shard_path(out_dir: Path, index: int, shards: int) -> Path:
+    return out_dir / f"shard-{index}-of-{shards}.json"
+
+
+def load_test_list(path: Path) -> Dict[str, List[int]]:
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)["articles_id"]
+
+
+def run_shard(args: argparse.Namespace) -> None:
+    from batch_infer import AIMDController, run_batch
+
+    articles = split_articles(load_test_list(args.test_path), args.shards, args.index)
+    count = sum(len(ids) for ids in articles.values())
+    print(f"Shard {args.index}/{args.shards}: {count} articles")
+
+    started = time.time()
+    controller = AIMDController(initial=args.initial_concurrency, maximum=args.max_concurrency)
+    output, _ = run_batch(articles, variant=args.variant, controller=controller, max_retries=args.max_retries)
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    path = shard_path(args.out_dir, args.index, args.shards)
+    tmp = path.with_suffix(".json.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=4)
+    os.replace(tmp, path)
+    meta = {
+        "test_path": str(args.test_path),
+        "shards": args.shards,
+        "index": args.index,
+        "variant": args.variant,
+        "articles": count,
+        "failed": sum(1 for rows in output.values() for row in rows if row.get("response") is None),
+        "base_url": os.getenv("LOCAL_BASE_URL"),
+        "host": os.uname().nodename,
+        "started": started,
+        "finished": time.time(),
+    }
+    with path.with_suffix(".meta.json").open("w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"Wrote {count} rows to {path} in {meta['finished'] - started:.1f}s")
+
+
+def launch(args: argparse.Namespace) -> None:
+    """Run every shard as a local subprocess, assigning backends round-robin."""
+
+    processes = []
+    for index in range(args.shards):
+        env = dict(os.environ)
+        if args.base_urls:
+            env["LOCAL_BASE_URL"] = args.base_urls[index % len(args.base_urls)]
+        command = [
+            sys.executable, __file__, "run",
+            "--test-path", str(args.test_path),
+            "--shards", str(args.shards),
+            "--index", str(index),
+            "--out-dir", str(args.out_dir),
+            "--variant", args.variant,
+            "--initial-concurrency", str(args.initial_concurrency),
+            "--max-concurrency", str(args.max_concurrency),
+            "--max-retries", str(args.max_retries),
+        ]
+        processes.append((index, subprocess.Popen(command, env=env)))
+
+    failed = [index for index, process in processes if process.wait() != 0]
+    if failed:
+        raise SystemExit(f"Shards failed: {failed}")
+    print(f"All {args.shards} shards finished; merge with: python shard.py merge --test-path {args.test_path} --out-dir {args.out_dir} --shards {args.shards}")
+
+
+def merge_shards(
+    articles: Mapping[str, List[int]],
+    shard_outputs: Sequence[Mapping[str, Any]],
+) -> Dict[str, Any]:
+    """Combine shard outputs in test list order; return the dataset and a problem report."""
+
+    listed = Counter(int(article_id) for ids in articles.values() for article_id in ids)
+    expected = set(listed)
+    found: Dict[int, Dict[str, Any]] = {}
+    seen: Counter = Counter()
+    sources: Dict[int, set] = {}
+    unexpected: List[int] = []
+    for source, output in enumerate(shard_outputs):
+        for rows in output.values():
+            for row in rows if isinstance(rows, list) else []:
+                article_id = int(row["article_id"])
+                seen[article_id] += 1
+                sources.setdefault(article_id, set()).add(source)
+                if article_id not in expected:
+                    unexpected.append(article_id)
+                    continue
+                # Keep the first row with a response; a later success replaces a failure.
+                if article_id not in found or (found[article_id].get("response") is None and row.get("response") is not None):
+                    found[article_id] = row
+
+    dataset: Dict[str, List[Dict[str, Any]]] = {}
+    placed = set()
+    for category, ids in articles.items():
+        dataset[category] = []
+        for article_id in map(int, ids):
+            # An ID listed under several categories is emitted once (evaluate.py rejects repeats).
+            if article_id in found and article_id not in placed:
+                dataset[category].append(found[article_id])
+                placed.add(article_id)
+
+    report = {
+        "expected": len(expected),
+        "merged": len(placed),
+        "missing": sorted(expected - set(found)),
+        # Rows from several shards, or more rows than the test list has entries.
+        "duplicates": sorted(
+            article_id for article_id, count in seen.items()
+            if len(sources[article_id]) > 1 or count > max(listed.get(article_id, 0), 1)
+        ),
+        "unexpected": sorted(set(unexpected)),
+        "failed": sorted(article_id for article_id, row in found.items() if row.get("response") is None),
+    }
+    return {"dataset": dataset, "report": report}
+
+
+def merge(args: argparse.Namespace) -> None:
+    articles = load_test_list(args.test_path)
+    paths = sorted(glob.glob(str(args.out_dir / "shard-*-of-*.json")))
+    paths = [path for path in paths if not path.endswith(".meta.json")]
+    shard_counts = {int(Path(path).stem.rsplit("-of-", 1)[1]) for path in paths}
+    if args.shards is not None:
+        paths = [path for path in paths if int(Path(path).stem.rsplit("-of-", 1)[1]) == args.shards]
+        shard_counts = {args.shards}
+    elif len(shard_counts) > 1:
+        # Leftovers of a run with another --shards value would double-count articles.
+        raise SystemExit(f"Outputs from different shard counts {sorted(shard_counts)} in {args.out_dir}; pass --shards.")
+    if not paths:
+        raise SystemExit(f"No shard outputs in {args.out_dir}")
+
+    outputs = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            outputs.append(json.load(f))
+    present = {int(Path(path).stem.split("-")[1]) for path in paths}
+    absent_shards = sorted(set(range(max(shard_counts))) - present)
+
+    merged = merge_shards(articles, outputs)
+    report = merged["report"]
+    output_path = args.output or default_output_path(args.test_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("w", encoding="utf-8") as f:
+        json.dump(merged["dataset"], f, ensure_ascii=False, indent=4)
+
+    print(f"Merged {len(paths)} shard outputs: {report['merged']}/{report['expected']} articles -> {output_path}")
+    if absent_shards:
+        print(f"Shard outputs not found: {absent_shards}")
+    for key in ("missing", "duplicates", "unexpected", "failed"):
+        if report[key]:
+            print(f"{key.capitalize()} ({len(report[key])}): {report[key]}")
+    if args.strict and (report["missing"] or report["duplicates"] or absent_shards):
+        raise SystemExit(1)
+
+
+def add_run_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--test-path", type=Path, required=True, help="Test list JSON with an articles_id mapping.")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--out-dir", type=Path, required=True, help="Directory for shard outputs (shared between hosts or copied before merging).")
+    parser.add_argument("--variant", choices=VARIANTS, default="single")
+    parser.add_argument("--initial-concurrency", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--max-retries", type=int, default=2)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sharded batch inference with a merge step.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run one shard in this process.")
+    add_run_arguments(run_parser)
+    run_parser.add_argument("--index", type=int, required=True, help="Shard index in [0, shards).")
+
+    launch_parser = sub.add_parser("launch", help="Run all shards as local subprocesses.")
+    add_run_arguments(launch_parser)
+    launch_parser.add_argument("--base-urls", nargs="+", help="vLLM base URLs assigned to shards round-robin (LOCAL_BASE_URL).")
+
+    merge_parser = sub.add_parser("merge", help="Merge shard outputs into one grouped dump.")
+    merge_parser.add_argument("--test-path", type=Path, required=True)
+    merge_parser.add_argument("--out-dir", type=Path, required=True)
+    merge_parser.add_argument("--shards", type=int, help="Only merge outputs of this shard count (required when several are present).")
+    merge_parser.add_argument("--output", type=Path, help="Merged dump path (defaults to ./data/qwen3_infer_<suffix of test list>).")
+    merge_parser.add_argument("--strict", action="store_true", help="Exit non-zero on missing or duplicate IDs.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.command == "run":
+        run_shard(args)
+    elif args.command == "launch":
+        launch(args)
+    else:
+        merge(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,18 +7,22 @@ and the human scores.
 """
 
 import argparse
+import json
 from collections import Counter
 from pathlib import Path
 from typing import Iterable, List, Mapping, Sequence, Tuple
 
-from evaluate import (
-    IMPACT_LEVELS,
-    USER_NEED_GROUPS,
-    evaluate_dataset,
-    load_json,
-    user_need_group,
+from agreement import (
+    METRIC_LABELS,
+    agreement_report,
+    encode_pairs,
+    json_ready,
+    pairs_from_datasets,
+    pairs_from_results,
+    print_agreement,
 )
-import matplotlib.pyplot as plt
+from evaluate import evaluate_dataset, load_json
+from plot_render import make_job, render_all, render_matrix
 
 
 DEFAULT_PREDICTIONS = Path("data/qwen3_infer_2025_qc_selected.json")
@@ -52,46 +56,34 @@ def most_common_pairs(results: Iterable[Mapping], n: int) -> List[Tuple[Tuple[st
     return counter.most_common(n)
 
 
-def build_confusion(
-    results: Iterable[Mapping],
+def plot_matrix(
+    title: str,
     labels: Sequence[str],
-    model_value_fn,
-    gt_value_fn,
-) -> List[List[int]]:
-    size = len(labels)
-    label_to_idx = {label: idx for idx, label in enumerate(labels)}
-    matrix = [[0 for _ in range(size)] for _ in range(size)]
+    matrix: List[List[int]],
+    path: Path,
+    xlabel: str = "Model",
+    ylabel: str = "Human",
+) -> None:
+    render_matrix(make_job(title, labels, matrix, path, xlabel=xlabel, ylabel=ylabel))
+
+
+def confusion_jobs(report, out_dir: Path, xlabel: str, ylabel: str) -> List[dict]:
+    overall = report["overall"]
+    jobs = [
+        make_job("User need confusion (8x8)", METRIC_LABELS["user_need"], overall["user_need"]["matrix"], out_dir / "user_need_confusion.png", xlabel, ylabel),
+        make_job("Group confusion (4x4)", METRIC_LABELS["group"], overall["group"]["matrix"], out_dir / "group_confusion.png", xlabel, ylabel),
+    ]
+    for key in ("I1", "I3", "I4"):
+        jobs.append(make_job(f"{key} impact confusion (5x5)", METRIC_LABELS[key], overall[key]["matrix"], out_dir / f"{key}_confusion.png", xlabel, ylabel))
+    return jobs
 
-    for entry in results:
-        model_val = model_value_fn(entry)
-        gt_val = gt_value_fn(entry)
-        if model_val not in label_to_idx or gt_val not in label_to_idx:
-            continue
-        matrix[label_to_idx[gt_val]][label_to_idx[model_val]] += 1
-    return matrix
-
-
-def plot_matrix(title: str, labels: Sequence[str], matrix: List[List[int]], path: Path) -> None:
-    fig, ax = plt.subplots(figsize=(6, 5))
-    im = ax.imshow(matrix, cmap="Blues")
-    ax.set_title(title)
-    ax.set_xlabel("Thao")
-    ax.set_ylabel("Trung")
-    ax.set_xticks(range(len(labels)))
-    ax.set_yticks(range(len(labels)))
-    ax.set_xticklabels(labels, rotation=45, ha="right")
-    ax.set_yticklabels(labels)
-
-    # Annotate cells with counts
-    for i in range(len(labels)):
-        for j in range(len(labels)):
-            ax.text(j, i, matrix[i][j], ha="center", va="center", color="black")
-
-    fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
-    fig.tight_layout()
-    path.parent.mkdir(parents=True, exist_ok=True)
-    fig.savefig(path, dpi=150)
-    plt.close(fig)
+
+def write_plots(report, args: argparse.Namespace, xlabel: str, ylabel: str) -> None:
+    if not args.plots:
+        return
+    jobs = confusion_jobs(report, args.out_dir, xlabel, ylabel)
+    rendered, skipped = render_all(jobs, args.out_dir, workers=args.plot_workers, force=args.force_plots)
+    print(f"\nConfusion matrices in {args.out_dir}: {len(rendered)} rendered, {len(skipped)} unchanged")
 
 
 def parse_args() -> argparse.Namespace:
@@ -101,12 +93,41 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--top", type=int, default=5, help="Number of top and bottom cases to show.")
     parser.add_argument("--pairs", type=int, default=5, help="Number of most common user_need pairings to show.")
     parser.add_argument("--out-dir", type=Path, default=Path("plots-trung"), help="Directory to write confusion matrix images.")
+    parser.add_argument(
+        "--compare-ground-truth",
+        dest="compare_ground_truth",
+        type=Path,
+        help="Compare --ground-truth against this second annotation file (human vs. human) instead of predictions.",
+    )
+    parser.add_argument("--by-category", action="store_true", help="Print per-category agreement.")
+    parser.add_argument("--plots", action="store_true", help="Render confusion matrix PNGs into --out-dir (only changed ones).")
+    parser.add_argument("--force-plots", action="store_true", help="Re-render every PNG even if its data is unchanged.")
+    parser.add_argument("--plot-workers", type=int, help="Processes used for rendering (defaults to CPU count).")
+    parser.add_argument("--save-agreement", type=Path, help="Optional path to write matrices and agreement statistics as JSON.")
     return parser.parse_args()
 
 
+def report_agreement(report, args: argparse.Namespace) -> None:
+    print_agreement(report, by_category=args.by_category)
+    if args.save_agreement:
+        args.save_agreement.parent.mkdir(parents=True, exist_ok=True)
+        with args.save_agreement.open("w", encoding="utf-8") as f:
+            json.dump(json_ready(report), f, ensure_ascii=False, indent=2, allow_nan=False)
+        print(f"\nAgreement report written to {args.save_agreement}")
+
+
 def main() -> None:
     args = parse_args()
 
+    if args.compare_ground_truth:
+        reference = load_json(args.ground_truth)
+        compared = load_json(args.compare_ground_truth)
+        report = agreement_report(encode_pairs(pairs_from_datasets(reference, compared)))
+        print(f"Agreement: {args.ground_truth} (rows) vs {args.compare_ground_truth} (columns)")
+        report_agreement(report, args)
+        write_plots(report, args, xlabel=args.compare_ground_truth.stem, ylabel=args.ground_truth.stem)
+        return
+
     preds = load_json(args.predictions)
     gt = load_json(args.ground_truth)
 
@@ -133,38 +154,11 @@ def main() -> None:
     for (model_need, human_need), count in pairs:
         print(f"  - {model_need} -> {human_need}: {count}")
 
-    # Confusion matrices
-    user_need_labels = list(USER_NEED_GROUPS.keys())
-    group_labels = ["Know", "Understand", "Feel", "Do"]
-    impact_labels = [str(level) for level in IMPACT_LEVELS]
+    # Confusion matrices and agreement, all metrics in one pass
+    report = agreement_report(encode_pairs(pairs_from_results(results)))
+    report_agreement(report, args)
 
-    user_need_conf = build_confusion(
-        results,
-        user_need_labels,
-        model_value_fn=lambda e: e["model_response"]["user_need"],
-        gt_value_fn=lambda e: e["ground_truth"]["user_need"],
-    )
-    group_conf = build_confusion(
-        results,
-        group_labels,
-        model_value_fn=lambda e: user_need_group(e["model_response"]["user_need"]),
-        gt_value_fn=lambda e: user_need_group(e["ground_truth"]["user_need"]),
-    )
-    impact_conf = {
-        key: build_confusion(
-            results,
-            impact_labels,
-            model_value_fn=lambda e, k=key: str(int(e["model_response"][k])),
-            gt_value_fn=lambda e, k=key: str(int(e["ground_truth"][k])),
-        )
-        for key in ("I1", "I3", "I4")
-    }
-
-    # plot_matrix("User need confusion (8x8)", user_need_labels, user_need_conf, args.out_dir / "user_need_confusion.png")
-    # plot_matrix("Group confusion (4x4)", group_labels, group_conf, args.out_dir / "group_confusion.png")
-    # for key, matrix in impact_conf.items():
-    #     plot_matrix(f"{key} impact confusion (5x5)", impact_labels, matrix, args.out_dir / f"{key}_confusion.png")
-    # print(f"\nConfusion matrices saved to {args.out_dir}")
+    write_plots(report, args, xlabel="Model", ylabel=args.ground_truth.stem)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+import pytest
+
+from batch_infer import AIMDController
+
+
+def test_increase_is_additive_per_window():
+    controller = AIMDController(initial=4, maximum=8, latency_target=1.0)
+    # Each success adds 1/limit, so about one window of successes raises the limit by one.
+    for _ in range(4):
+        controller.release(controller.acquire(), ok=True, latency=0.5)
+    assert controller.limit == 4
+    controller.release(controller.acquire(), ok=True, latency=0.5)
+    assert controller.limit == 5
+
+    for _ in range(100):
+        controller.release(controller.acquire(), ok=True, latency=0.5)
+    assert controller.limit == 8
+
+
+def test_decrease_once_per_window():
+    controller = AIMDController(initial=8, latency_target=1.0)
+    first, second = controller.acquire(), controller.acquire()
+    controller.release(first, ok=False)
+    assert controller.limit == 4
+
+    # Started before the decrease: already in flight when the controller backed off.
+    controller.release(second, ok=True, latency=5.0)
+    assert controller.limit == 4
+
+    controller.release(controller.acquire(), ok=True, latency=5.0)
+    assert controller.limit == 2
+    for _ in range(4):
+        controller.release(controller.acquire(), ok=False)
+    assert controller.limit == 1
+
+
+def test_cached_answers_do_not_adapt():
+    controller = AIMDController(initial=4)
+    controller.release(controller.acquire(), ok=True, latency=None)
+    assert controller.limit == 4
+    assert controller.latency_threshold() is None
+
+
+def test_baseline_follows_recent_latencies():
+    controller = AIMDController(initial=4, latency_tolerance=2.0, base_window=3)
+    for latency in (1.0, 4.0, 4.0):
+        controller.release(controller.acquire(), ok=True, latency=latency)
+    assert controller.latency_threshold() == pytest.approx(2.0)
+
+    # The fast sample leaves the window, so the backend's new speed becomes the baseline.
+    controller.release(controller.acquire(), ok=True, latency=4.0)
+    assert controller.latency_threshold() == pytest.approx(8.0)
+
+
+def test_rejects_invalid_bounds():
+    with pytest.raises(ValueError):
+        AIMDController(initial=0)
+    with pytest.raises(ValueError):
+        AIMDController(decrease=1.0)
@@ -0,0 +1,29 @@
+from dedup import DedupIndex, entry_key
+
+
+TEXT = " ".join(f"word{i}" for i in range(200))
+RESULT = {"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7}
+
+
+def built_index():
+    # Keyed like ``dedup.py build`` and ``batch_infer --dedup-index``.
+    index = DedupIndex(threshold=0.85)
+    index.add(4985425, TEXT, RESULT)
+    return index
+
+
+def test_indexed_article_does_not_match_itself():
+    index = built_index()
+    assert index.query(TEXT, exclude=entry_key(4985425, "text-hash")) is None
+
+
+def test_other_article_with_the_same_text_matches():
+    index = built_index()
+    match = index.query(TEXT, exclude=entry_key(4985812, "text-hash"))
+    assert match.key == 4985425
+    assert match.result == RESULT
+
+
+def test_raw_text_is_keyed_by_the_fallback():
+    assert entry_key(None, "text-hash") == "text-hash"
+    assert entry_key("4985425", "text-hash") == 4985425
@@ -0,0 +1,36 @@
+from dump_store import ColumnarDump, TextStore, write_columnar
+
+
+def round_trip(dataset, tmp_path):
+    store = TextStore(tmp_path / "texts")
+    write_columnar(dataset, tmp_path / "dump", store)
+    return ColumnarDump(tmp_path / "dump", store).to_grouped()
+
+
+def row(article_id, **fields):
+    item = {"article_id": article_id, "response": {"user_need": "Update me", "I1": 40}, "data": "text", "url": None}
+    item.update(fields)
+    return item
+
+
+def test_usage_round_trip(tmp_path):
+    dataset = {
+        "Update me": [
+            row(1, usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}),
+            row(2, usage={"prompt_tokens": None, "completion_tokens": 5, "total_tokens": None}),
+            row(3, usage={"completion_tokens": 5}),
+            row(4, usage=None),
+            row(5),
+        ]
+    }
+    assert round_trip(dataset, tmp_path) == dataset
+
+
+def test_empty_text_and_missing_response_round_trip(tmp_path):
+    only_empty = {"Update me": [row(1, data="")]}
+    assert round_trip(only_empty, tmp_path / "empty") == only_empty
+
+    without_response = row(2)
+    del without_response["response"]
+    dataset = {"Update me": [row(1, data=""), without_response, row(3, response=None)]}
+    assert round_trip(dataset, tmp_path / "mixed") == dataset
@@ -0,0 +1,93 @@
+from output_parser import normalize_user_need, repair_json_output, snap_impact
+
+
+ANSWER = {"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7}
+
+
+def test_valid_json_needs_no_repair():
+    result = repair_json_output('{"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7}')
+    assert result.data == ANSWER
+    assert result.repairs == []
+
+
+def test_trailing_comma():
+    result = repair_json_output('{"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7,}')
+    assert result.data == ANSWER
+    assert "trailing_comma" in result.repairs
+
+
+def test_single_quotes():
+    result = repair_json_output("{'user_need': 'Update me', 'I1': 5, 'I3': 3, 'I4': 7}")
+    assert result.data == ANSWER
+
+
+def test_unquoted_keys():
+    result = repair_json_output('{user_need: "Update me", I1: 5, I3: 3, I4: 7}')
+    assert result.data == ANSWER
+    assert "unquoted_keys" in result.repairs
+
+
+def test_think_block_with_braces_is_stripped():
+    raw = '<think>Maybe {"user_need": "Inspire me"}?</think>\n{"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7}'
+    result = repair_json_output(raw)
+    assert result.data == ANSWER
+    assert "strip_thinking" in result.repairs
+
+
+def test_code_fence_is_stripped():
+    result = repair_json_output('```json\n{"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7}\n```')
+    assert result.data == ANSWER
+    assert "strip_code_fence" in result.repairs
+
+
+def test_truncated_object_is_closed():
+    result = repair_json_output('{"user_need": "Update me", "I1": 5, "I3": 3, "I4": 7')
+    assert result.data == ANSWER
+    assert "close_brace" in result.repairs
+
+
+def test_impact_scores_are_snapped():
+    result = repair_json_output('{"user_need": "Update me", "I1": 6, "I3": "3", "I4": 8.9}')
+    assert result.data == {"user_need": "Update me", "I1": 5, "I3": 3, "I4": 9}
+    assert "I1:6->5" in result.repairs
+    assert "I4:8.9->9" in result.repairs
+
+
+def test_snap_impact():
+    assert snap_impact(0) == 1
+    assert snap_impact(4) == 3
+    assert snap_impact("7/9") == 7
+    assert snap_impact(12) == 9
+    assert snap_impact(True) is None
+    assert snap_impact("high") is None
+
+
+def test_regex_fallback():
+    result = repair_json_output("user_need: Update me\nI1 = 5\nI3: 3\nI4: 7")
+    assert result.data == ANSWER
+    assert "regex_fallback" in result.repairs
+
+
+def test_unparseable_output():
+    assert repair_json_output("no answer here").data is None
+    assert repair_json_output("").data is None
+    assert repair_json_output(None).data is None
+
+
+def test_label_variants():
+    assert normalize_user_need("update Me") == "Update me"
+    assert normalize_user_need("perspective") == "Give me perspective"
+    assert normalize_user_need("Update me or Educate me") is None
+
+
+def test_negated_label_is_not_matched():
+    assert normalize_user_need("Don't update me") is None
+    assert normalize_user_need("do not update me") is None
+    assert normalize_user_need("Not update, educate me") == "Educate me"
+
+
+def test_vietnamese_labels():
+    assert normalize_user_need("Giúp tôi") == "Help me"
+    assert normalize_user_need("Cập nhật cho tôi") == "Update me"
+    assert normalize_user_need("Truyền cảm hứng cho tôi") == "Inspire me"
+    assert normalize_user_need("Kết nối tôi") == "Connect me"
@@ -0,0 +1,28 @@
+from self_consistency import vote
+
+
+def sample(user_need="Update me", I1=5, I3=3, I4=7):
+    return {"user_need": user_need, "I1": I1, "I3": I3, "I4": I4}
+
+
+def test_majority_and_median():
+    response, confidence = vote([sample(I1=5), sample(I1=7), sample(user_need="Educate me", I1=5)])
+    assert response == sample()
+    assert confidence["user_need"] == 2 / 3
+    assert confidence["I1"] == 2 / 3
+
+
+def test_even_samples_vote_a_sampled_level():
+    response, confidence = vote([sample(I1=1), sample(I1=9), sample(I1=9), sample(I1=1)])
+    assert response["I1"] == 1
+    assert confidence["I1"] == 0.5
+
+
+def test_unparsed_samples_are_skipped():
+    response, confidence = vote([None, sample(), None])
+    assert response == sample()
+    assert confidence["user_need"] == 1.0
+
+
+def test_no_parsed_samples():
+    assert vote([None, None]) == (None, {"overall": 0.0})
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from shard import load_test_list, merge_shards, split_articles
+
+
+TEST_LIST = Path(__file__).resolve().parent.parent / "data" / "test_list_27_11_2025.json"
+SHARDS = 4
+
+
+def run_shards(articles):
+    """Fake shard outputs: one row with a response per assigned ID."""
+
+    return [
+        {
+            category: [{"article_id": article_id, "response": {"user_need": "Update me"}} for article_id in ids]
+            for category, ids in split_articles(articles, SHARDS, index).items()
+        }
+        for index in range(SHARDS)
+    ]
+
+
+def test_ids_listed_twice_are_split_once():
+    articles = load_test_list(TEST_LIST)
+    listed = [int(article_id) for ids in articles.values() for article_id in ids]
+    assigned = [int(row["article_id"]) for output in run_shards(articles) for rows in output.values() for row in rows]
+    assert listed.count(4985425) == listed.count(4985812) == 2
+    assert sorted(assigned) == sorted(set(listed))
+
+
+def test_clean_run_merges_without_problems():
+    articles = load_test_list(TEST_LIST)
+    merged = merge_shards(articles, run_shards(articles))
+    report = merged["report"]
+    assert report["merged"] == report["expected"]
+    assert report["missing"] == report["duplicates"] == report["unexpected"] == report["failed"] == []
+    rows = [row["article_id"] for items in merged["dataset"].values() for row in items]
+    assert len(rows) == len(set(rows)) == report["expected"]
+
+
+def test_id_from_two_shards_is_a_duplicate():
+    articles = load_test_list(TEST_LIST)
+    outputs = run_shards(articles)
+    category, ids = next((category, ids) for category, ids in split_articles(articles, SHARDS, 0).items() if ids)
+    outputs[1].setdefault(category, []).append({"article_id": ids[0], "response": None})
+    report = merge_shards(articles, outputs)["report"]
+    assert report["duplicates"] == [int(ids[0])]
+    assert report["failed"] == []
@@ -0,0 +1,188 @@
+"""Token usage and cost report next to the ``evaluate.py`` scores.
+
+Batch runners attach ``usage`` (prompt/completion/total tokens summed over stages),
+``usage_by_stage`` and ``prompt_variant`` to every row they write. This script
+aggregates that per prompt variant, per stage and per category, scores the same files
+with ``evaluate.evaluate_dataset`` and prints accuracy-per-token side by side:
+
+    python token_report.py --predictions single=data/qwen3_infer_a.json separate=data/qwen3_infer_b.json
+
+Rows written before usage was recorded count as zero tokens and are reported as
+``without_usage`` so the numbers are not silently optimistic.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from evaluate import DEFAULT_GROUND_TRUTHS, evaluate_dataset, load_json
+
+
+TOKEN_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+def empty_usage() -> Dict[str, int]:
+    return {key: 0 for key in TOKEN_KEYS}
+
+
+def add_usage(total: Dict[str, int], usage: Optional[Mapping[str, Any]]) -> None:
+    if not usage:
+        return
+    for key in TOKEN_KEYS:
+        total[key] += int(usage.get(key, 0) or 0)
+
+
+def iter_rows(dataset: Mapping[str, Any]):
+    for category, items in dataset.items():
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if isinstance(item, dict) and "article_id" in item:
+                yield category, item
+
+
+def summarize_usage(dataset: Mapping[str, Any]) -> Dict[str, Any]:
+    """Aggregate token usage of one prediction file overall, per stage and per category."""
+
+    totals = empty_usage()
+    by_stage: Dict[str, Dict[str, int]] = defaultdict(empty_usage)
+    by_category: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"rows": 0, **empty_usage()})
+    variants: Counter = Counter()
+    rows = 0
+    without_usage = 0
+
+    for category, item in iter_rows(dataset):
+        rows += 1
+        variants[item.get("prompt_variant", "unknown")] += 1
+        usage = item.get("usage")
+        if not usage:
+            without_usage += 1
+        add_usage(totals, usage)
+        for stage, stage_usage in (item.get("usage_by_stage") or {}).items():
+            add_usage(by_stage[stage], stage_usage)
+        by_category[category]["rows"] += 1
+        add_usage(by_category[category], usage)
+
+    return {
+        "rows": rows,
+        "without_usage": without_usage,
+        "prompt_variants": dict(variants),
+        "totals": totals,
+        "per_article": {key: (totals[key] / rows if rows else 0.0) for key in TOKEN_KEYS},
+        "by_stage": dict(by_stage),
+        "by_category": dict(by_category),
+    }
+
+
+def cost(usage: Mapping[str, float], price_prompt: float, price_completion: float) -> float:
+    """Cost in the caller's currency, with prices given per million tokens."""
+
+    return (usage["prompt_tokens"] * price_prompt + usage["completion_tokens"] * price_completion) / 1_000_000
+
+
+def category_scores(results: List[Mapping[str, Any]]) -> Dict[str, float]:
+    sums: Dict[str, float] = defaultdict(float)
+    counts: Counter = Counter()
+    for entry in results:
+        sums[entry["category"]] += entry["final_score"]
+        counts[entry["category"]] += 1
+    return {category: sums[category] / counts[category] for category in sums}
+
+
+def build_report(
+    predictions: List[Tuple[str, Path]],
+    gt_datasets: List[Mapping[str, Any]],
+    price_prompt: float = 0.0,
+    price_completion: float = 0.0,
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for name, path in predictions:
+        dataset = load_json(path)
+        usage = summarize_usage(dataset)
+        evaluation = evaluate_dataset(dataset, gt_datasets)
+        averages = evaluation["summary"]["averages"]
+        per_article_tokens = usage["per_article"]["total_tokens"]
+        per_category_score = category_scores(evaluation["results"])
+        for category, stats in usage["by_category"].items():
+            stats["final_score"] = per_category_score.get(category)
+            stats["tokens_per_article"] = stats["total_tokens"] / stats["rows"] if stats["rows"] else 0.0
+
+        report[name] = {
+            "path": str(path),
+            "evaluated": evaluation["summary"]["evaluated"],
+            "averages": averages,
+            "usage": usage,
+            "cost_per_article": cost(usage["per_article"], price_prompt, price_completion),
+            "final_score_per_1k_tokens": (averages["final_score"] / per_article_tokens * 1000) if per_article_tokens else None,
+        }
+    return report
+
+
+def print_report(report: Mapping[str, Any], by_category: bool = False) -> None:
+    header = f"{'variant':<24} {'n':>4} {'final':>6} {'need':>6} {'emot':>6} {'prompt/art':>11} {'compl/art':>10} {'cost/art':>9} {'final/1k tok':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, entry in report.items():
+        averages = entry["averages"]
+        per_article = entry["usage"]["per_article"]
+        per_1k = entry["final_score_per_1k_tokens"]
+        print(
+            f"{name:<24} {entry['evaluated']:>4} {averages['final_score']:>6.3f} "
+            f"{averages['score_userneed']:>6.3f} {averages['score_emotion']:>6.3f} "
+            f"{per_article['prompt_tokens']:>11.0f} {per_article['completion_tokens']:>10.0f} "
+            f"{entry['cost_per_article']:>9.5f} {(f'{per_1k:.4f}' if per_1k is not None else 'n/a'):>12}"
+        )
+        if entry["usage"]["without_usage"]:
+            print(f"  ({entry['usage']['without_usage']} of {entry['usage']['rows']} rows have no usage recorded)")
+
+    for name, entry in report.items():
+        stages = entry["usage"]["by_stage"]
+        if stages:
+            print(f"\n{name} per stage:")
+            for stage, usage in stages.items():
+                print(f"  {stage:<12} prompt={usage['prompt_tokens']} completion={usage['completion_tokens']}")
+        if by_category:
+            print(f"\n{name} per category:")
+            for category, stats in sorted(entry["usage"]["by_category"].items()):
+                score = stats["final_score"]
+                score_text = f"{score:.3f}" if score is not None else "n/a"
+                print(f"  {category:<45} n={stats['rows']:<3} tokens/art={stats['tokens_per_article']:>8.0f} final={score_text}")
+
+
+def parse_prediction_arg(value: str) -> Tuple[str, Path]:
+    if "=" in value:
+        name, path = value.split("=", 1)
+        return name, Path(path)
+    return Path(value).stem, Path(value)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Report token usage and cost per prompt variant alongside evaluation scores.")
+    parser.add_argument("--predictions", type=parse_prediction_arg, nargs="+", required=True, help="Prediction files as name=path (or just path).")
+    parser.add_argument("--ground-truths", dest="ground_truths", type=Path, nargs="+", default=list(DEFAULT_GROUND_TRUTHS), help="Ground truth JSON files.")
+    parser.add_argument("--price-prompt", type=float, default=0.0, help="Price per million prompt tokens.")
+    parser.add_argument("--price-completion", type=float, default=0.0, help="Price per million completion tokens.")
+    parser.add_argument("--by-category", action="store_true", help="Also print the per-category breakdown.")
+    parser.add_argument("--save", type=Path, help="Optional path to write the full report as JSON.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    gt_datasets = [load_json(path) for path in args.ground_truths]
+    report = build_report(args.predictions, gt_datasets, args.price_prompt, args.price_completion)
+    print_report(report, by_category=args.by_category)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with args.save.open("w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,70 @@
+import os
 import re
+import threading
+import time
 import requests
 import urllib.parse
+from requests.adapters import HTTPAdapter
+
+from replay import recordable
+
+# Overridable so benchmarks can point at a local stand-in (see mock_servers.py).
+ARTICLE_API_URL = os.getenv("ARTICLE_API_URL", "https://gw.vnexpress.net/ar/get_full")
+ARTICLE_POOL_SIZE = int(os.getenv("ARTICLE_POOL_SIZE", "32"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # One pooled session for the process so article fetches from any thread reuse
+    # keep-alive connections instead of paying a TCP/TLS handshake per article.
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=ARTICLE_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
 
 def strip_html_tags_regex(html_string):
     clean = re.compile('<.*?>')
     return re.sub(clean, '', html_string)
 
-def get_article_data(article_id: int):
+class RateLimiter:
+    """Thread-safe token bucket: at most ``rate`` acquisitions per second, bursts of ``burst``."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+@recordable("article")
+def get_article_data(article_id: int, timeout: float = 10):
     """
     Fetch full article data from VNExpress GW API using the given article_id.
+    ``timeout`` bounds the HTTP call in seconds (callers pass their remaining deadline).
     """
-    base_url = "https://gw.vnexpress.net/ar/get_full"
+    base_url = ARTICLE_API_URL
     
     # Define query parameters
     params = {
@@ -33,7 +87,7 @@ def get_article_data(article_id: int):
     url = f"{base_url}?article_id={article_id}&data_select={params['data_select']}"
 
     # Send request
-    response = requests.get(url, timeout=10)
+    response = get_session().get(url, timeout=timeout)
     
     if response.status_code == 200:
         try:
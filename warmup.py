@@ -0,0 +1,184 @@
+"""Startup warmup and backend readiness for the service.
+
+Right after a deploy the first requests pay for new connections to vLLM and the article
+API, and for prefilling the long static rubric prompt. ``Readiness.warmup`` runs once at
+startup. It pays those costs up front:
+
+- it opens ``WARMUP_CONNECTIONS`` concurrent connections to each backend, which stay in
+  the pools: the ``AsyncOpenAI`` client and ``utils.get_session``;
+- it sends a one-token request for every prompt stage with an empty article
+  (``aprime_local``). vLLM's prefix cache then holds the shared system prompt and rubric.
+  Stages that fail are retried in the background until they succeed, waiting
+  ``WARMUP_RETRY_DELAY`` seconds and doubling up to ``WARMUP_MAX_RETRY_DELAY``: an
+  instance started before vLLM finished loading becomes ready once it has. Until every
+  stage was primed the warmup report says ``retrying`` with the last errors and
+  ``/ready`` answers 503.
+
+``Readiness.status`` backs ``GET /ready``. It reports whether warmup finished, whether
+each backend answers a cheap probe (probes are cached for ``READY_PROBE_TTL`` seconds so
+frequent load-balancer polls do not hit the backends), and the recent fetch/generate
+latency of real requests. The endpoint answers 503 until the instance is warm and both
+backends are reachable; ``/health`` stays a plain liveness check.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+
+
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60"))
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "5"))
+WARMUP_MAX_RETRY_DELAY = float(os.getenv("WARMUP_MAX_RETRY_DELAY", "60"))
+READY_PROBE_TTL = float(os.getenv("READY_PROBE_TTL", "5"))
+READY_PROBE_TIMEOUT = float(os.getenv("READY_PROBE_TIMEOUT", "2"))
+LATENCY_WINDOW = int(os.getenv("READY_LATENCY_WINDOW", "200"))
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyWindow:
+    """The last ``size`` latencies of one stage, summarized for ``/ready``."""
+
+    def __init__(self, size: int = LATENCY_WINDOW) -> None:
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            values = np.asarray(self._samples) * 1000.0
+        if not values.size:
+            return {"count": 0}
+        p50, p95 = np.percentile(values, (50, 95))
+        return {"count": int(values.size), "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "last_ms": round(float(values[-1]), 1)}
+
+
+async def probe_llm(timeout: float = READY_PROBE_TIMEOUT) -> Dict[str, Any]:
+    from qwen3_infer import get_async_local_client, local_infer
+
+    if not local_infer:
+        return {"reachable": True, "skipped": "g4f backend"}
+    started = time.perf_counter()
+    try:
+        await get_async_local_client().models.list(timeout=timeout)
+    except Exception as exc:
+        return {"reachable": False, "error": f"{type(exc).__name__}: {exc}"}
+    return {"reachable": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def probe_article_api(timeout: float = READY_PROBE_TIMEOUT) -> Dict[str, Any]:
+    """Any non-5xx answer from the article API counts as reachable."""
+
+    import requests
+
+    from utils import ARTICLE_API_URL, get_session
+
+    started = time.perf_counter()
+    try:
+        response = get_session().get(ARTICLE_API_URL, timeout=timeout)
+    except requests.RequestException as exc:
+        return {"reachable": False, "error": f"{type(exc).__name__}: {exc}"}
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    if response.status_code >= 500:
+        return {"reachable": False, "error": f"HTTP {response.status_code}", "latency_ms": latency_ms}
+    return {"reachable": True, "latency_ms": latency_ms}
+
+
+class Readiness:
+    def __init__(self, connections: int = WARMUP_CONNECTIONS, probe_ttl: float = READY_PROBE_TTL) -> None:
+        self.connections = connections
+        self.probe_ttl = probe_ttl
+        self.warm = False
+        self.warmup_report: Dict[str, Any] = {"state": "pending"}
+        self._probes: Dict[str, Dict[str, Any]] = {}
+        self._probed_at = float("-inf")
+        self._probe_lock: Optional[asyncio.Lock] = None
+
+    async def warmup(
+        self,
+        timeout: float = WARMUP_TIMEOUT,
+        retry_delay: float = WARMUP_RETRY_DELAY,
+        max_retry_delay: float = WARMUP_MAX_RETRY_DELAY,
+    ) -> Dict[str, Any]:
+        from field_inference import STAGE_PROMPTS
+        from qwen3_infer import aprime_local, local_infer
+
+        self.warmup_report = {"state": "running"}
+        started = time.perf_counter()
+        # Concurrent requests force the pools to open that many connections.
+        llm_probes, article_probes = await asyncio.gather(
+            asyncio.gather(*(probe_llm(timeout) for _ in range(self.connections))),
+            asyncio.gather(*(asyncio.to_thread(probe_article_api, timeout) for _ in range(self.connections))),
+        )
+        connections = {
+            "llm": sum(1 for probe in llm_probes if probe["reachable"]),
+            "article_api": sum(1 for probe in article_probes if probe["reachable"]),
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+        primed: Dict[str, Any] = {}
+
+        async def prime(stage: str, attempt: int) -> None:
+            stage_started = time.perf_counter()
+            try:
+                await aprime_local(STAGE_PROMPTS[stage](""), timeout=timeout)
+                primed[stage] = {"ok": True, "ms": round((time.perf_counter() - stage_started) * 1000, 1), "attempts": attempt}
+            except Exception as exc:
+                primed[stage] = {"ok": False, "error": f"{type(exc).__name__}: {exc}", "attempts": attempt}
+
+        attempt, delay = 0, retry_delay
+        while local_infer:
+            attempt += 1
+            pending = [stage for stage in STAGE_PROMPTS if not primed.get(stage, {}).get("ok")]
+            await asyncio.gather(*(prime(stage, attempt) for stage in pending))
+            failed = sorted(stage for stage in pending if not primed[stage]["ok"])
+            if not failed:
+                break
+            # Not ready yet: serving now would pay the cold start warmup is meant to absorb.
+            self.warmup_report = {"state": "retrying", "connections": connections, "primed": dict(primed), "retry_in_s": delay}
+            logger.warning("Priming failed for %s (attempt %d); retrying in %.0fs", failed, attempt, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_delay)
+
+        self.warmup_report = {
+            "state": "done",
+            "connections": connections,
+            "primed": primed,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        self.warm = True
+        logger.info("Warmup finished: %s", self.warmup_report)
+        return self.warmup_report
+
+    async def probe(self) -> Dict[str, Dict[str, Any]]:
+        if self._probe_lock is None:
+            self._probe_lock = asyncio.Lock()
+        async with self._probe_lock:
+            if time.monotonic() - self._probed_at >= self.probe_ttl:
+                llm, article = await asyncio.gather(probe_llm(), asyncio.to_thread(probe_article_api))
+                self._probes = {"llm": llm, "article_api": article}
+                self._probed_at = time.monotonic()
+        return self._probes
+
+    async def status(self, latency: Mapping[str, LatencyWindow]) -> Tuple[bool, Dict[str, Any]]:
+        backends = await self.probe()
+        ready = self.warm and all(probe["reachable"] for probe in backends.values())
+        return ready, {
+            "status": "ready" if ready else "not_ready",
+            "warm": self.warm,
+            "warmup": self.warmup_report,
+            "backends": backends,
+            "recent_latency": {stage: window.summary() for stage, window in latency.items()},
+        }